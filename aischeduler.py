@@ -0,0 +1,79 @@
+# ------------------------------------------------------------------------------
+# AI scheduler: decides which guards think on each tick
+#
+# Guards that are chasing, alerted or near the player think every tick.
+# Patrolling guards further away think less often (keeping their last
+# velocity in between, and getting the time they missed when they next
+# think), and there's a budget on how many of those can think per tick, so
+# their work is spread across ticks.  A guard is never held back past twice
+# its interval, whatever the budget.
+#
+# The budget is a number of thinks rather than a time, so that the same inputs
+# always give the same game (see replay.py).
+# ------------------------------------------------------------------------------
+
+# (distance from the player, ticks between thinks) for patrolling guards, nearest first.  Guards can't see
+# further than 150, so the nearest band leaves room for the player and guard closing in between thinks.
+AI_DISTANCE_BANDS = ((300, 1), (500, 2), (None, 4))
+AI_THINKS_PER_TICK = 8		# budget for the guards that aren't thinking every tick
+AI_MAX_DELAY_FACTOR = 2		# a guard that's waited this many times its interval thinks regardless of the budget
+
+_AI_MAX_INTERVAL = max(interval for distance, interval in AI_DISTANCE_BANDS)
+
+# ------------------------------------------------------------------------------
+def intervalForDistance(dist_sq):
+	"Returns the ticks between thinks for a patrolling guard at the given squared distance from the player."
+	for distance, interval in AI_DISTANCE_BANDS:
+		if distance is None or dist_sq < distance * distance:
+			return interval
+	return _AI_MAX_INTERVAL
+
+# ------------------------------------------------------------------------------
+class AIScheduler(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, budget=AI_THINKS_PER_TICK):
+		self.budget = budget
+		self._waiting = {}		# guard -> ticks since it last thought
+		self.num_thinks = 0		# on the last tick
+		self.num_deferred = 0	# guards that were due on the last tick, but over the budget
+
+	# ------------------------------------------------------------------------------
+	def plan(self, guards, player):
+		"""Sets ai_thinking on each guard, to say whether it should think this tick.  guards should be in update
+		order.  Guards new to the scheduler are staggered, so they don't all think on the same tick."""
+		waiting = {}
+		due = []
+		self.num_thinks = 0
+		for guard in guards:
+			ticks_waited = self._waiting.get(guard, guard.order % _AI_MAX_INTERVAL) + 1
+			interval = guard.thinkInterval(player)
+			if interval == 1 or ticks_waited >= interval * AI_MAX_DELAY_FACTOR:
+				thinking = True
+			elif ticks_waited >= interval:
+				due.append((-float(ticks_waited) / interval, guard.order, guard))
+				thinking = False
+			else:
+				thinking = False
+			guard.ai_thinking = thinking
+			if thinking:
+				self.num_thinks += 1
+				ticks_waited = 0
+			waiting[guard] = ticks_waited
+
+		# The most overdue go first
+		due.sort()
+		for index, (overdue, order, guard) in enumerate(due):
+			if index == self.budget:
+				break
+			guard.ai_thinking = True
+			waiting[guard] = 0
+			self.num_thinks += 1
+		self.num_deferred = max(0, len(due) - self.budget)
+		self._waiting = waiting
+
+	# ------------------------------------------------------------------------------
+	def clear(self):
+		self._waiting = {}
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+# ------------------------------------------------------------------------------
+# Atlas: packs the entity and house textures into one big texture, so the
+# sprites in the entity batch all share a texture and can be drawn together
+#
+# The packed layout is cached in a JSON file beside the textures, and redone if
+# any of the images change
+# ------------------------------------------------------------------------------
+
+import json
+import os
+import pyglet
+
+ATLAS_SIZE = 512
+ATLAS_MAX_IMAGE_SIZE = 128		# bigger images (e.g. the background) keep their own textures
+ATLAS_PADDING = 1				# gap between images, so filtering never picks up a neighbour
+ATLAS_LAYOUT_VERSION = 1
+ATLAS_EXTENSIONS = ('.png', '.jpg')
+
+# ------------------------------------------------------------------------------
+def shelfPack(sizes, atlas_size=ATLAS_SIZE, padding=ATLAS_PADDING):
+	"""Packs rects into rows ("shelves"), tallest first.  sizes is a dict of name -> (width, height).
+	Returns a dict of name -> (x, y), or None if they don't all fit."""
+	positions = {}
+	x = 0
+	y = 0
+	shelf_height = 0
+	for name in sorted(sizes, key=lambda name: (-sizes[name][1], -sizes[name][0], name)):
+		width, height = sizes[name]
+		if x + width > atlas_size:
+			# Start a new shelf
+			x = 0
+			y += shelf_height + padding
+			shelf_height = 0
+		if y + height > atlas_size:
+			return None
+		positions[name] = (x, y)
+		x += width + padding
+		shelf_height = max(shelf_height, height)
+	return positions
+
+# ------------------------------------------------------------------------------
+class TextureAtlas(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, directory, resource_prefix, layout_file_name, size=ATLAS_SIZE):
+		"""Packs the small images in the directory.  Regions are looked up by resource name, i.e. resource_prefix
+		followed by the file name."""
+		self.size = size
+		self.regions = {}
+
+		stamps = {}
+		for file_name in sorted(os.listdir(directory)):
+			if os.path.splitext(file_name)[1].lower() in ATLAS_EXTENSIONS:
+				stat = os.stat(os.path.join(directory, file_name))
+				stamps[file_name] = [stat.st_mtime, stat.st_size]
+
+		layout = self._loadLayout(layout_file_name, stamps)
+		images = {}
+		if layout is None:
+			for file_name in stamps:
+				image = pyglet.image.load(os.path.join(directory, file_name))
+				if image.width <= ATLAS_MAX_IMAGE_SIZE and image.height <= ATLAS_MAX_IMAGE_SIZE:
+					images[file_name] = image
+			sizes = dict((file_name, (image.width, image.height)) for file_name, image in images.iteritems())
+			positions = shelfPack(sizes, size)
+			if positions is None:
+				print 'Textures do not fit in a {0}x{0} atlas'.format(size)
+				return
+			layout = {'version': ATLAS_LAYOUT_VERSION, 'size': size, 'stamps': stamps,
+					  'images': dict((file_name, positions[file_name] + sizes[file_name]) for file_name in images)}
+			try:
+				with open(layout_file_name, 'w') as out_file:
+					json.dump(layout, out_file, indent=1, sort_keys=True)
+			except (IOError, OSError):
+				print 'Failed to save texture atlas layout to', layout_file_name
+
+		self.texture = pyglet.image.Texture.create(size, size)
+		for file_name, (x, y, width, height) in sorted(layout['images'].iteritems()):
+			image = images.get(file_name)
+			if image is None:
+				image = pyglet.image.load(os.path.join(directory, file_name))
+			self.texture.blit_into(image, x, y, 0)
+			self.regions[resource_prefix + file_name] = self.texture.get_region(x, y, width, height)
+
+	# ------------------------------------------------------------------------------
+	def _loadLayout(self, layout_file_name, stamps):
+		"Returns the cached layout if it was made from the same images, or else None."
+		try:
+			with open(layout_file_name) as in_file:
+				layout = json.load(in_file)
+		except (IOError, OSError, ValueError):
+			return None
+		if layout.get('version') != ATLAS_LAYOUT_VERSION or layout.get('size') != self.size \
+				or layout.get('stamps') != stamps:
+			return None
+		return layout
+
+	# ------------------------------------------------------------------------------
+	def get(self, resource_name):
+		"Returns the atlas region for the image, or None if it isn't in the atlas."
+		return self.regions.get(resource_name)
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,489 @@
+# ------------------------------------------------------------------------------
+# Benchmark: timings for the engine's hot paths
+#
+# Run with "python benchmark.py"; see "python benchmark.py --help" for options.
+# Scenes run headless unless --draw is given, which opens a hidden window so
+# that drawing can be timed as well.
+# ------------------------------------------------------------------------------
+
+import sys
+if '--draw' not in sys.argv:
+	import headless		# must be imported before the game modules
+
+import json
+import misc
+import os
+import platform
+import profiler
+import random
+import spatial
+import subprocess
+import time
+
+# ------------------------------------------------------------------------------
+# Broad phase
+# ------------------------------------------------------------------------------
+class _Body(object):
+	"Stand-in for an entity: just the bounds used by the collision checks."
+	def __init__(self, order, x, y, half_size, vx, vy):
+		self.order = order
+		self.x = x
+		self.y = y
+		self.half_size = half_size
+		self.vx = vx
+		self.vy = vy
+		self.updateBoundaries()
+
+	def updateBoundaries(self):
+		self.circle = (self.x, self.y, self.half_size)
+		self.rect = (self.x - self.half_size, self.y - self.half_size, self.x + self.half_size, self.y + self.half_size)
+
+# ------------------------------------------------------------------------------
+def _makeBodies(count, density):
+	"Scatters bodies over an area that grows with the count, so the density stays roughly constant."
+	area_size = (count / density) ** 0.5
+	bodies = []
+	for index in xrange(count):
+		half_size = random.uniform(8, 32)
+		bodies.append(_Body(index, random.uniform(0, area_size), random.uniform(0, area_size), half_size,
+							random.choice((-100, 0, 100)), random.choice((-100, 0, 100))))
+	return bodies
+
+# ------------------------------------------------------------------------------
+def _bruteForceStep(bodies, dt):
+	"Moves each body and tests it against every other body; returns the list of overlapping pairs found."
+	pairs = []
+	for body in bodies:
+		body.x += body.vx * dt
+		body.y += body.vy * dt
+		body.updateBoundaries()
+		for other in bodies:
+			if other is body:
+				continue
+			if misc.rectsOverlap(body.rect, other.rect) or misc.circlesOverlap(body.circle, other.circle):
+				pairs.append((body.order, other.order))
+	return pairs
+
+# ------------------------------------------------------------------------------
+def _gridStep(bodies, grid, dt):
+	"As _bruteForceStep, but only testing the bodies in the overlapped cells."
+	pairs = []
+	order_key = lambda body: body.order
+	for body in bodies:
+		body.x += body.vx * dt
+		body.y += body.vy * dt
+		body.updateBoundaries()
+		bounds = spatial.boundsUnion(body.rect, spatial.circleBounds(body.circle))
+		grid.move(body, bounds)
+		candidates = grid.query(bounds)
+		candidates.discard(body)
+		for other in sorted(candidates, key=order_key):
+			if misc.rectsOverlap(body.rect, other.rect) or misc.circlesOverlap(body.circle, other.circle):
+				pairs.append((body.order, other.order))
+	return pairs
+
+# ------------------------------------------------------------------------------
+def benchmarkBroadPhase(counts=(50, 100, 200, 500, 1000, 2000, 5000), density=0.0004, ticks=5, dt=0.02,
+						brute_force_limit=2000):
+	print 'Collision broad phase (ms per tick)'
+	print '%8s %12s %12s %10s' % ('entities', 'brute force', 'grid', 'speed-up')
+	for count in counts:
+		random.seed(count)
+		bodies = _makeBodies(count, density)
+		grid = spatial.SpatialHash(64)
+		for body in bodies:
+			grid.insert(body, spatial.boundsUnion(body.rect, spatial.circleBounds(body.circle)))
+
+		start = time.time()
+		for tick in xrange(ticks):
+			grid_pairs = _gridStep(bodies, grid, dt)
+		grid_ms = (time.time() - start) * 1000 / ticks
+
+		if count > brute_force_limit:
+			print '%8d %12s %12.2f %10s' % (count, '-', grid_ms, '-')
+			continue
+
+		# Same starting positions for the brute force version
+		random.seed(count)
+		bodies = _makeBodies(count, density)
+		start = time.time()
+		for tick in xrange(ticks):
+			brute_pairs = _bruteForceStep(bodies, dt)
+		brute_ms = (time.time() - start) * 1000 / ticks
+
+		assert(grid_pairs == brute_pairs)		# last tick's results must match exactly, including order
+		print '%8d %12.2f %12.2f %9.1fx' % (count, brute_ms, grid_ms, brute_ms / grid_ms)
+
+# ------------------------------------------------------------------------------
+# Line of sight
+# ------------------------------------------------------------------------------
+def _makeHouseRects(count, spacing=160):
+	"Lays houses out on a jittered grid, like a (very large) town."
+	columns = max(1, int(count ** 0.5))
+	rects = []
+	for index in xrange(count):
+		x = (index % columns) * spacing + random.uniform(0, spacing - 100)
+		y = (index // columns) * spacing + random.uniform(0, spacing - 100)
+		rects.append((x, y, x + random.uniform(50, 100), y + random.uniform(50, 100)))
+	return rects, columns * spacing
+
+# ------------------------------------------------------------------------------
+def benchmarkLineOfSight(counts=(6, 25, 100, 400, 1600), num_queries=500, view_dist=150):
+	print 'House line of sight (us per query)'
+	print '%8s %12s %12s %10s' % ('houses', 'brute force', 'tree', 'speed-up')
+	for count in counts:
+		random.seed(count)
+		rects, area_size = _makeHouseRects(count)
+		tree = spatial.AABBTree([(rect, rect) for rect in rects])
+		queries = []
+		for index in xrange(num_queries):
+			x1 = random.uniform(0, area_size)
+			y1 = random.uniform(0, area_size)
+			queries.append((x1, y1, x1 + random.uniform(-view_dist, view_dist), y1 + random.uniform(-view_dist, view_dist)))
+
+		start = time.time()
+		brute_results = []
+		for x1, y1, x2, y2 in queries:
+			brute_results.append(any(misc.lineIntersectsRect(x1, y1, x2, y2, rect) for rect in rects))
+		brute_us = (time.time() - start) * 1000000 / num_queries
+
+		start = time.time()
+		tree_results = []
+		for x1, y1, x2, y2 in queries:
+			hit = tree.firstSegmentHit(x1, y1, x2, y2, lambda rect: misc.lineIntersectsRect(x1, y1, x2, y2, rect))
+			tree_results.append(hit is not None)
+		tree_us = (time.time() - start) * 1000000 / num_queries
+
+		assert(tree_results == brute_results)
+		print '%8d %12.1f %12.1f %9.1fx' % (count, brute_us, tree_us, brute_us / tree_us)
+
+# ------------------------------------------------------------------------------
+def benchmarkBatchedSight(guard_counts=(5, 20, 50, 200, 1000), num_houses=25, ticks=20, view_dist=150):
+	if not misc.g_have_numpy:
+		print 'Batched line of sight: skipped (numpy not available)'
+		return
+	print 'Batched line of sight against %d houses (ms per tick)' % num_houses
+	print '%8s %12s %12s %10s' % ('guards', 'scalar', 'batched', 'speed-up')
+	random.seed(num_houses)
+	rects, area_size = _makeHouseRects(num_houses)
+	edges = misc.rectEdges(rects)
+	for count in guard_counts:
+		player_x = random.uniform(0, area_size)
+		player_y = random.uniform(0, area_size)
+		guard_xs = [player_x + random.uniform(-view_dist, view_dist) for index in xrange(count)]
+		guard_ys = [player_y + random.uniform(-view_dist, view_dist) for index in xrange(count)]
+
+		start = time.time()
+		for tick in xrange(ticks):
+			scalar_results = [any(misc.lineIntersectsRect(player_x, player_y, x, y, rect) for rect in rects) \
+								for x, y in zip(guard_xs, guard_ys)]
+		scalar_ms = (time.time() - start) * 1000 / ticks
+
+		start = time.time()
+		for tick in xrange(ticks):
+			batched_results = misc.linesIntersectAny(player_x, player_y, guard_xs, guard_ys, edges)
+		batched_ms = (time.time() - start) * 1000 / ticks
+
+		assert(list(batched_results) == scalar_results)
+		print '%8d %12.2f %12.2f %9.1fx' % (count, scalar_ms, batched_ms, scalar_ms / batched_ms)
+
+# ------------------------------------------------------------------------------
+# Scenes
+# ------------------------------------------------------------------------------
+SCENE_SIZES = (		# (houses, guards and dogs, daggers in flight)
+	(6, 4, 0),
+	(25, 16, 4),
+	(50, 32, 8),
+	(100, 64, 16),
+	(200, 128, 32),
+	(400, 256, 64),
+)
+SCENE_HOUSE_SPACING = 160
+SCENE_DT = 0.02
+
+# Functions timed separately.  Each timing includes anything the function calls, so think includes
+# lookForPlayer, and updateAll includes everything except drawAll.
+TIMED_FUNCTIONS = (
+	('updateAll', 'Entity', 'updateAll'),
+	('think', 'GuardEntity', 'think'),
+	('lookForPlayer', 'GuardEntity', 'lookForPlayer'),
+	('checkCollisions', 'Entity', 'checkCollisions'),
+	('checkCollisions', 'DaggerEntity', 'checkCollisions'),		# counted with the general version
+	('drawAll', 'Entity', 'drawAll'),
+)
+
+# ------------------------------------------------------------------------------
+def buildScene(num_houses, num_guards, num_daggers, seed=0):
+	"""Replaces the current entities with a synthetic town: houses on a jittered grid, guards and dogs patrolling
+	between random points, and the player standing in the middle (too tough to die, so the guards keep chasing)."""
+	import entities
+	random.seed(seed)
+	entities.clearAll()
+	columns = max(1, int(round(num_houses ** 0.5)))
+	rows = max(1, (num_houses + columns - 1) // columns)
+	width = columns * SCENE_HOUSE_SPACING
+	height = rows * SCENE_HOUSE_SPACING + entities.SCREEN_MINIMUM_Y
+	if misc.g_headless:
+		entities.g_window.width = width
+		entities.g_window.height = height
+
+	player = entities.PlayerEntity(width / 2, height / 2, initial_daggers=0)
+	player.max_hp = player.hp = 10 ** 9
+
+	# Houses sit in the middle of each grid cell, leaving the edges of the cells as streets
+	for index in xrange(num_houses):
+		left = (index % columns) * SCENE_HOUSE_SPACING
+		bottom = (index // columns) * SCENE_HOUSE_SPACING + entities.SCREEN_MINIMUM_Y
+		size = random.choice((64, 96))
+		entities.HouseEntity(left + SCENE_HOUSE_SPACING / 2 + random.randint(-8, 8),
+							 bottom + SCENE_HOUSE_SPACING / 2 + random.randint(-8, 8), size)
+
+	def streetPoint():
+		x = random.randint(0, columns - 1) * SCENE_HOUSE_SPACING + 12
+		y = random.randint(0, rows - 1) * SCENE_HOUSE_SPACING + entities.SCREEN_MINIMUM_Y + 12
+		return x, y
+
+	for index in xrange(num_guards):
+		start_x, start_y = streetPoint()
+		patrol = list(streetPoint()) + list(streetPoint())
+		if index % 4 == 3:
+			entities.GuardDogEntity('Dog%d' % index, start_x, start_y, *patrol)
+		else:
+			entities.HumanGuardEntity('Guard%d' % index, start_x, start_y, *patrol)
+
+	entities.buildObstacles()
+	topUpDaggers(num_daggers)
+	entities.updateAll(0)		# move everything into the update list
+	return player
+
+# ------------------------------------------------------------------------------
+def topUpDaggers(num_daggers):
+	import entities
+	in_flight = len([entity for entity in entities.Entity._entities + entities.Entity._new_entities \
+						if isinstance(entity, entities.DaggerEntity) and not entity.dying])
+	player = entities.PlayerEntity.instance
+	for index in xrange(num_daggers - in_flight):
+		dir_x, dir_y = random.choice(((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1), (1, -1), (-1, 1)))
+		entities.DaggerEntity(player.x + dir_x * 20, player.y + dir_y * 20, dir_x, dir_y)
+
+# ------------------------------------------------------------------------------
+def _sceneTick(num_daggers):
+	import entities
+	import events
+	import stats
+	topUpDaggers(num_daggers)
+	entities.Entity.updateAll(SCENE_DT)		# not the module alias, so the timing wrapper is used
+	events.update(SCENE_DT)
+	stats.update(SCENE_DT)
+	misc.updateKeys()
+
+# ------------------------------------------------------------------------------
+def benchmarkScene(num_houses, num_guards, num_daggers, ticks=200, warm_up_ticks=20, draw=False):
+	import entities
+	buildScene(num_houses, num_guards, num_daggers)
+	for tick in xrange(warm_up_ticks):
+		_sceneTick(num_daggers)
+	num_entities = len(entities.Entity._entities)
+
+	# Overall rate, without the timing wrappers getting in the way
+	start = time.time()
+	for tick in xrange(ticks):
+		_sceneTick(num_daggers)
+		if draw:
+			entities.Entity.drawAll()
+	tick_sec = (time.time() - start) / ticks
+
+	# Individual functions
+	timer = profiler.FunctionTimer([(name, getattr(entities, class_name), method_name)
+									for name, class_name, method_name in TIMED_FUNCTIONS])
+	timer.install()
+	try:
+		for tick in xrange(ticks):
+			_sceneTick(num_daggers)
+			if draw:
+				entities.drawAll()
+	finally:
+		timer.uninstall()
+
+	result = {
+		'houses': num_houses,
+		'guards': num_guards,
+		'daggers': num_daggers,
+		'entities': num_entities,
+		'ticks_per_sec': 1 / tick_sec,
+		'tick_ms': tick_sec * 1000,
+		'tick_us_per_entity': tick_sec * 1000000 / num_entities,
+		'functions': {},
+	}
+	for name in timer.totals:
+		if name == 'drawAll' and not draw:
+			continue
+		total = timer.totals[name]
+		calls = timer.calls[name]
+		result['functions'][name] = {
+			'ms_per_tick': total * 1000 / ticks,
+			'calls_per_tick': float(calls) / ticks,
+			'us_per_call': (total * 1000000 / calls) if calls > 0 else 0,
+		}
+	return result
+
+# ------------------------------------------------------------------------------
+def _printSceneResult(result):
+	functions = result['functions']
+	line = '%6d %6d %7d %8d %9.1f %9.2f %8.1f' % (result['houses'], result['guards'], result['daggers'],
+		result['entities'], result['ticks_per_sec'], result['tick_ms'], result['tick_us_per_entity'])
+	for name in ('updateAll', 'think', 'lookForPlayer', 'checkCollisions', 'drawAll'):
+		if name in functions:
+			line += ' %10.2f' % functions[name]['ms_per_tick']
+		else:
+			line += ' %10s' % '-'
+	print line
+
+# ------------------------------------------------------------------------------
+def benchmarkScenes(sizes=SCENE_SIZES, ticks=200, draw=False):
+	print 'Scenes (function timings are in ms per tick, and include whatever they call)'
+	print '%6s %6s %7s %8s %9s %9s %8s %10s %10s %10s %10s %10s' % ('houses', 'guards', 'daggers', 'entities',
+		'ticks/s', 'ms/tick', 'us/ent', 'updateAll', 'think', 'look', 'collisions', 'drawAll')
+	results = []
+	for num_houses, num_guards, num_daggers in sizes:
+		result = benchmarkScene(num_houses, num_guards, num_daggers, ticks=ticks, draw=draw)
+		_printSceneResult(result)
+		results.append(result)
+	return results
+
+# ------------------------------------------------------------------------------
+def benchmarkAllocations(num_houses=25, ticks=200, warm_up_ticks=20):
+	"""Checks that the entity update keeps no memory from one tick to the next in a steady scene: the player walking
+	among the houses.  Returns the number of ticks that ended holding more than they started with.
+	With tracemalloc (Python 3.4 or later), each tick is compared with the one before by where the memory was
+	allocated, so a line holding more counts even if another holds less.  Without it, only the number of live objects
+	can be compared.  Either way, memory that a tick allocates and frees again isn't counted: collision queries, for
+	one, still build a list of candidates every tick."""
+	import entities
+	import gc
+	from pyglet.window import key
+	buildScene(num_houses, 0, 0)
+	misc.handleKeyPress(key.RIGHT, 0)
+	try:
+		for tick in xrange(warm_up_ticks):
+			entities.updateAll(SCENE_DT)
+		try:
+			import tracemalloc
+		except ImportError:
+			tracemalloc = None
+
+		growing_ticks = 0
+		if tracemalloc is not None:
+			tracemalloc.start()
+			filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+			before = tracemalloc.take_snapshot().filter_traces(filters)
+			for tick in xrange(ticks):
+				entities.updateAll(SCENE_DT)
+				after = tracemalloc.take_snapshot().filter_traces(filters)
+				if any(stat.size_diff > 0 for stat in after.compare_to(before, 'lineno')):
+					growing_ticks += 1
+				before = after
+			tracemalloc.stop()
+			print 'Allocations: %d of %d ticks kept memory allocated (by line)' % (growing_ticks, ticks)
+		else:
+			gc.collect()
+			before = len(gc.get_objects())
+			for tick in xrange(ticks):
+				entities.updateAll(SCENE_DT)
+				gc.collect()
+				after = len(gc.get_objects())
+				if after > before:
+					growing_ticks += 1
+				before = after
+			print 'Allocations: %d of %d ticks ended with more live objects (no tracemalloc, so only live ' \
+				  'objects are counted)' % (growing_ticks, ticks)
+	finally:
+		misc.handleKeyRelease(key.RIGHT, 0)
+	return growing_ticks
+
+# ------------------------------------------------------------------------------
+# Results
+# ------------------------------------------------------------------------------
+def _revision():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+# ------------------------------------------------------------------------------
+def writeResults(file_name, scene_results):
+	results = {
+		'revision': _revision(),
+		'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+		'python': platform.python_version(),
+		'numpy': misc.g_have_numpy,
+		'headless': misc.g_headless,
+		'scenes': scene_results,
+	}
+	with open(file_name, 'w') as out_file:
+		json.dump(results, out_file, indent=1, sort_keys=True)
+	print 'Wrote results to', file_name
+
+# ------------------------------------------------------------------------------
+def compareResults(old_file_name, scene_results):
+	with open(old_file_name) as in_file:
+		old = json.load(in_file)
+	print 'Compared with %s (revision %s): ticks/s now vs then' % (old_file_name, old.get('revision'))
+	old_scenes = dict(((scene['houses'], scene['guards'], scene['daggers']), scene) for scene in old['scenes'])
+	for scene in scene_results:
+		old_scene = old_scenes.get((scene['houses'], scene['guards'], scene['daggers']))
+		if old_scene is None:
+			continue
+		print '%6d %6d %7d %9.1f %9.1f %8.2fx' % (scene['houses'], scene['guards'], scene['daggers'],
+			scene['ticks_per_sec'], old_scene['ticks_per_sec'], scene['ticks_per_sec'] / old_scene['ticks_per_sec'])
+
+# ------------------------------------------------------------------------------
+def _initWindowed():
+	import entities
+	import events
+	import pyglet
+	import stats
+	window = pyglet.window.Window(width=800, height=600, visible=False)
+	entities.g_window = window
+	stats.g_window = window
+	misc.init()
+	stats.init()
+	events.init()
+
+# ------------------------------------------------------------------------------
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description='Time the game engine\'s hot paths.')
+	parser.add_argument('--micro', action='store_true', help='run the broad phase and line of sight benchmarks')
+	parser.add_argument('--no-scenes', action='store_true', help="don't run the scene benchmarks")
+	parser.add_argument('--draw', action='store_true', help='open a hidden window, and time drawing too')
+	parser.add_argument('--ticks', type=int, default=200, help='ticks to time per scene')
+	parser.add_argument('--max-scenes', type=int, default=len(SCENE_SIZES), help='only run the smallest N scenes')
+	parser.add_argument('--output', help='write the scene results to this JSON file')
+	parser.add_argument('--compare', help='compare the scene results with a previous JSON file')
+	parser.add_argument('--allocations', action='store_true', help='check the entity update keeps no memory from tick to tick')
+	args = parser.parse_args()
+
+	if args.micro:
+		benchmarkBroadPhase()
+		benchmarkLineOfSight()
+		benchmarkBatchedSight()
+
+	if args.no_scenes:
+		return
+	if args.draw:
+		_initWindowed()
+	else:
+		headless.init()
+	if args.allocations:
+		benchmarkAllocations()
+	scene_results = benchmarkScenes(SCENE_SIZES[:args.max_scenes], ticks=args.ticks, draw=args.draw)
+	if args.output:
+		writeResults(args.output, scene_results)
+	if args.compare:
+		compareResults(args.compare, scene_results)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,43 @@
+# ------------------------------------------------------------------------------
+# Camera: which part of the world the window shows
+#
+# The view follows the player, stopping at the edges of the world, so a level
+# the size of the window never scrolls.  Everything drawn between begin() and
+# end() is in world coordinates; the HUD is drawn after, in window coordinates.
+# ------------------------------------------------------------------------------
+
+import pyglet
+
+CULL_MARGIN = 96		# sprites can reach this far outside their entity's bounds (the guards' vision)
+
+# ------------------------------------------------------------------------------
+class Camera(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, view_width, view_height):
+		self.view_width = view_width
+		self.view_height = view_height
+		self.x = 0		# world position of the bottom left of the view
+		self.y = 0
+
+	# ------------------------------------------------------------------------------
+	def follow(self, target_x, target_y, world_width, world_height):
+		"Centres the view on the target, as far as the world's edges allow.  The view stays on whole pixels."
+		self.x = int(round(max(0, min(target_x - self.view_width / 2.0, world_width - self.view_width))))
+		self.y = int(round(max(0, min(target_y - self.view_height / 2.0, world_height - self.view_height))))
+
+	# ------------------------------------------------------------------------------
+	def viewBounds(self, margin=CULL_MARGIN):
+		"Returns the rect of the world in view, grown by the margin."
+		return (self.x - margin, self.y - margin, self.x + self.view_width + margin, self.y + self.view_height + margin)
+
+	# ------------------------------------------------------------------------------
+	def begin(self):
+		pyglet.gl.glPushMatrix()
+		pyglet.gl.glTranslatef(-self.x, -self.y, 0)
+
+	# ------------------------------------------------------------------------------
+	def end(self):
+		pyglet.gl.glPopMatrix()
+
+# ------------------------------------------------------------------------------
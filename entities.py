@@ -6,14 +6,22 @@
 # All accelerations (if I end up adding any) are in pixels per second per second
 # ------------------------------------------------------------------------------
 
+import aischeduler
+import entitystore
+from entitystore import storeField, storeFlag
 import events
+import hashlib
 import math
 import misc
-from misc import rectLeft, rectTop, rectRight, rectBottom
+import navigation
+from operator import attrgetter
 import pyglet
 from pyglet.window import key
 import random
+import spatial
 import stats
+import tweens
+import visibility
 
 COS_45_DEG = 0.7071
 DEATH_DURATION_SEC = 1
@@ -22,16 +30,89 @@ LOOT_DURATION_SEC = 2
 STUCK_DIST_SQ_LIMIT = 1
 SCREEN_MINIMUM_Y = 50		# Text goes below this
 ALERT_MAX_RANGE = 120
+COLLISION_CELL_SIZE = 64	# roughly the size of the smaller houses
+NAV_CLEARANCE = 18			# half the height of the guard and dog rects, plus a little
+NAV_WAYPOINT_RANGE = 6
+CHASE_FIELD_RANGE = 480		# how far the chase flow field reaches from the player, when the level's too big for one
 
 g_window = None
+g_world_width = None		# size of the current level; None for the window's size
+g_world_height = None
+g_store = entitystore.EntityStore()		# positions, velocities and bounds of every entity
+
+# All entity sprites are drawn in one batch, in these groups (back to front)
+g_batch = pyglet.graphics.Batch()
+HOUSE_GROUP = pyglet.graphics.OrderedGroup(0)
+CHEST_GROUP = pyglet.graphics.OrderedGroup(1)
+VISION_GROUP = pyglet.graphics.OrderedGroup(2)
+ACTOR_GROUP = pyglet.graphics.OrderedGroup(3)
+DAGGER_GROUP = pyglet.graphics.OrderedGroup(4)
+
+# ------------------------------------------------------------------------------
+def worldSize():
+	return g_world_width or g_window.width, g_world_height or g_window.height
+
+# ------------------------------------------------------------------------------
+def setWorldSize(width, height):
+	"Sets the size of the world, for the current level.  None for either uses the window's."
+	global g_world_width, g_world_height
+	g_world_width = width
+	g_world_height = height
 
 # ------------------------------------------------------------------------------
 class Entity(object):
+	draw_group = ACTOR_GROUP
+	
+	# Everything else an entity keeps is in its store slot, below; slots avoid a dict per entity
+	__slots__ = ('store', 'slot', 'name', 'rotation', 'collide_circle_duration', 'collide_rect_duration',
+				 'stuck_duration', 'chat_col', 'order', 'image', 'width', 'height', 'sprite', 'sprite_interpolated')
+	
 	_entities = []
 	_new_entities = []
+	_by_type = {}			# class -> the entities in _entities that are instances of it, in update order
+	_unlooted_chests = 0	# houses in _entities that still have a chest
+	_unloaded_chests = 0	# chests in the parts of the level that aren't loaded (see streaming.py)
+	_shown = set()			# entities whose sprites are shown; see cullAll
+	_grid = spatial.SpatialHash(COLLISION_CELL_SIZE)		# broad phase for everything in _entities
+	_next_order = 0
+	_obstacles = None		# AABB tree of the houses, which block line of sight
+	_obstacle_edges = None	# array of the house edges, for batched line of sight checks (with numpy)
+	_nav_grid = None		# walkable cells around the houses, for guard pathfinding
+	_nav_bounds = None		# rect the navigation grid covers, or None for the whole world
+	_chase_field = None		# flow field towards the player's cell, shared by all chasing guards
+	_visibility = None		# precomputed cell-to-cell line of sight for the level, if available
+	_tweens = tweens.Tweener()		# death fades and damage flashes, advanced once per tick
+	_tick = 0
+	
+	# State kept in the entity store (see entitystore.py)
+	x = storeField('x')
+	y = storeField('y')
+	vx = storeField('vx')
+	vy = storeField('vy')
+	prev_x = storeField('prev_x', 'position before the last move')
+	prev_y = storeField('prev_y')
+	radius = storeField('radius')
+	half_width = storeField('half_width')
+	half_height = storeField('half_height')
+	sprite_left = storeField('sprite_left', 'edges of the collision rect, relative to the sprite')
+	sprite_top = storeField('sprite_top')
+	sprite_right = storeField('sprite_right')
+	sprite_bottom = storeField('sprite_bottom')
+	alive = storeFlag('alive')
+	dying = storeFlag('dying')
+	die_off_screen = storeFlag('die_off_screen')
+	force_on_screen = storeFlag('force_on_screen')
+	
+	# Bounds as of the last updateBoundaries, and as they were before the last move
+	rect = property(lambda self: self.store.rectOf(self.slot))
+	circle = property(lambda self: self.store.circleOf(self.slot))
+	prev_rect = property(lambda self: self.store.prevRectOf(self.slot))
+	prev_circle = property(lambda self: self.store.prevCircleOf(self.slot))
 	
 	# ------------------------------------------------------------------------------
 	def __init__(self, img_fname, x=0, y=0, *args):
+		self.store = g_store
+		self.slot = g_store.allocate(self)
 		self.name = 'unknown'
 		self.x = float(x)		# left x
 		self.y = float(y)		# *bottom* y
@@ -46,6 +127,7 @@ class Entity(object):
 		self.collide_rect_duration = 0
 		self.stuck_duration = 0
 		self.chat_col = (255, 255, 255, 255)
+		self.order = None		# position in the update order; set when added to _entities
 		
 		self.image = misc.getImage(img_fname)
 		self.width = self.image.width
@@ -57,7 +139,8 @@ class Entity(object):
 		self.sprite_top = 0
 		self.sprite_bottom = self.height
 		self.updateRadius()
-		self.sprite = pyglet.sprite.Sprite(self.image, 0, 0)
+		self.sprite = misc.makeSprite(self.image, 0, 0, batch=g_batch, group=self.draw_group)
+		self.sprite.visible = False		# shown once it's added to the update list
 		self.updatePos()
 		
 		Entity._new_entities.append(self)
@@ -66,26 +149,63 @@ class Entity(object):
 	def updateRadius(self):
 		relevant_width = self.sprite_right - self.sprite_left
 		relevant_height = self.sprite_bottom - self.sprite_top
-		self.radius = (relevant_width + relevant_height) / 4	# /2 for diameter to radius; /2 for average
+		self.radius = (relevant_width + relevant_height) // 4	# /2 for diameter to radius; /2 for average
 	
 	# ------------------------------------------------------------------------------
 	def updatePos(self):
 		misc.setSpriteRenderPos(self.sprite, self.x, self.y, self.rotation)
+		self.sprite_interpolated = False
 		self.updateBoundaries()
 		
+	# ------------------------------------------------------------------------------
+	def moveTo(self, x, y):
+		"Puts the entity straight at the position, with nothing to interpolate from."
+		self.x = self.prev_x = x
+		self.y = self.prev_y = y
+		self.updatePos()
+		
+	# ------------------------------------------------------------------------------
+	def renderPos(self, alpha):
+		"Returns the position the fraction alpha of the way from the previous tick's position to the current one."
+		return self.prev_x + (self.x - self.prev_x) * alpha, self.prev_y + (self.y - self.prev_y) * alpha
+	
+	# ------------------------------------------------------------------------------
+	def updateRenderPos(self, alpha):
+		render_x, render_y = self.renderPos(alpha)
+		misc.setSpriteRenderPos(self.sprite, render_x, render_y, self.rotation)
+		self.sprite_interpolated = True
+		
 	# ------------------------------------------------------------------------------
 	def updateBoundaries(self):
-		self.circle = (self.x, self.y, self.radius)
-		render_left = self.x - self.half_width
-		render_top = self.y - self.half_height
-		self.rect = (render_left + self.sprite_left,  render_top + self.sprite_top,
-					 render_left + self.sprite_right, render_top + self.sprite_bottom)
+		self.store.updateBounds(self.slot)
+		if self.order is not None:
+			self.updateGridCells()
 	
 	# ------------------------------------------------------------------------------
-	left =   lambda self: rectLeft(self.rect)
-	top =    lambda self: rectTop(self.rect)
-	right =  lambda self: rectRight(self.rect)
-	bottom = lambda self: rectBottom(self.rect)
+	def broadBounds(self):
+		"Bounds covering both the rect and the circle, for the broad phase."
+		return self.store.broadBoundsOf(self.slot)
+	
+	# ------------------------------------------------------------------------------
+	def updateGridCells(self):
+		"Moves the entity in the broad phase grid to its broad bounds, read straight from the store."
+		store = self.store
+		slot = self.slot
+		circle_x = store.circle_x[slot]
+		circle_y = store.circle_y[slot]
+		radius = store.radius[slot]
+		left = store.left[slot]
+		top = store.top[slot]
+		right = store.right[slot]
+		bottom = store.bottom[slot]
+		Entity._grid.moveEdges(self, min(left, circle_x - radius), min(top, circle_y - radius),
+							   max(right, circle_x + radius), max(bottom, circle_y + radius))
+	
+	# ------------------------------------------------------------------------------
+	left =   lambda self: self.store.left[self.slot]
+	top =    lambda self: self.store.top[self.slot]
+	right =  lambda self: self.store.right[self.slot]
+	bottom = lambda self: self.store.bottom[self.slot]
 	
 	# ------------------------------------------------------------------------------
 	def setSpriteRotationFromDir(self, dir_x, dir_y):
@@ -98,18 +218,43 @@ class Entity(object):
 	
 	# ------------------------------------------------------------------------------
 	def circlesCollide(self, entity):
-		return misc.circlesOverlap(self.circle, entity.circle)
+		# As misc.circlesOverlap, but reading the circles in place
+		store = self.store
+		slot = self.slot
+		other_store = entity.store
+		other_slot = entity.slot
+		dist = misc.distBetween(store.circle_x[slot], store.circle_y[slot],
+								other_store.circle_x[other_slot], other_store.circle_y[other_slot])
+		return dist - (store.radius[slot] + other_store.radius[other_slot]) < 0
 	
 	# ------------------------------------------------------------------------------
 	def rectsCollide(self, entity):
-		return misc.rectsOverlap(self.rect, entity.rect)
+		# As misc.rectsOverlap, but reading the rects in place
+		store = self.store
+		slot = self.slot
+		other_store = entity.store
+		other_slot = entity.slot
+		if store.right[slot] < other_store.left[other_slot] or store.left[slot] >= other_store.right[other_slot]:
+			return False
+		if store.bottom[slot] < other_store.top[other_slot] or store.top[slot] >= other_store.bottom[other_slot]:
+			return False
+		return True
 	
 	# ------------------------------------------------------------------------------
 	def startDying(self):
+		"Fades the entity out, then kills it."
 		self.dying = True
-		self.death_timer = DEATH_DURATION_SEC
 		self.vx = 0
 		self.vy = 0
+		Entity._tweens.start((self, 'fade'), DEATH_DURATION_SEC, self.setOpacity, 255, 0, on_finish=self.finishDying)
+	
+	# ------------------------------------------------------------------------------
+	def setOpacity(self, opacity):
+		self.sprite.opacity = opacity
+	
+	# ------------------------------------------------------------------------------
+	def finishDying(self):
+		self.alive = False
 		
 	# ------------------------------------------------------------------------------
 	def limitRight(self, right_limit):
@@ -141,55 +286,54 @@ class Entity(object):
 	
 	# ------------------------------------------------------------------------------
 	def update(self, dt):
-		self.prev_x = self.x
-		self.prev_y = self.y
-		self.prev_circle = self.circle
-		self.prev_rect = self.rect
-		
-		self.x += self.vx * dt
-		self.y += self.vy * dt
-		self.updateBoundaries()
-		
-		if self.dying:
-			self.death_timer -= dt
-			opacity = 255 * self.death_timer / DEATH_DURATION_SEC
-			self.sprite.opacity = opacity
-			if hasattr(self, 'vision_sprite'):
-				base_col = self.vision_sprite.base_col
-				self.vision_sprite.color = tuple([int(float(opacity) * col / 255) for col in base_col])
-			if self.death_timer <= 0:
-				self.alive = False
-			
-		else:
-			# Kill some things when they're off-screen
-			if self.die_off_screen:
-				if self.x >= g_window.width or self.x < 0 or self.y >= g_window.height or self.y < SCREEN_MINIMUM_Y:
-					self.alive = False
-			
-			# Lock some things on screen
-			if self.force_on_screen:
-				self.limitRight(g_window.width)
-				self.limitLeft(0)
-				self.limitBottom(g_window.height)
-				self.limitTop(SCREEN_MINIMUM_Y)
-			
-			if not self.dying:
-				self.checkCollisions(dt)
+		"The entity's behaviour for the tick, before it moves.  Moving is done for all entities at once (in updateAll)."
+		pass
+	
+	# ------------------------------------------------------------------------------
+	def afterMove(self, dt):
+		"Carries on from the move: collisions with anything nearby, unless it's dying."
+		if not self.dying:
+			# Killing things that go off-screen and locking others on screen are done in the move
+			self.checkCollisions(dt)
 		
-		self.updatePos()
+		# Only things that moved or turned (or were drawn part way through a move) need their sprites and bounds updating
+		if self.sprite_interpolated or self.store.hasMoved(self.slot) or self.sprite.rotation != self.rotation:
+			self.updatePos()
 		
 	# ------------------------------------------------------------------------------
-	def draw(self):
-		self.sprite.draw()
+	def sprites(self):
+		return [self.sprite]
+	
+	# ------------------------------------------------------------------------------
+	def setVisible(self, visible):
+		for sprite in self.sprites():
+			sprite.visible = visible
+	
+	# ------------------------------------------------------------------------------
+	def deleteSprites(self):
+		"Removes the sprites from the batch.  The entity can't be drawn or updated after this."
+		for sprite in self.sprites():
+			sprite.delete()
 		
+	# ------------------------------------------------------------------------------
+	def collisionCandidates(self, include_prev=False):
+		"Returns the entities that may overlap this one (excluding itself), in update order."
+		if include_prev:
+			# Collision responses only ever move back towards the previous position, so covering both
+			# positions covers everything that could be touched during the checks
+			bounds = self.store.sweptBoundsOf(self.slot)
+		else:
+			bounds = self.broadBounds()
+		candidates = Entity._grid.query(bounds)
+		candidates.discard(self)
+		return sorted(candidates, key=attrgetter('order'))
+	
 	# ------------------------------------------------------------------------------
 	def checkCollisions(self, dt):
 		# Check for collisions if moving
 		stuck = False
 		if self.vx != 0 or self.vy != 0:
-			for entity in Entity._entities:
-				if entity is self:
-					continue
+			for entity in self.collisionCandidates(include_prev=True):
 				if isinstance(self, LivingEntity) and isinstance(entity, LivingEntity):
 					if self.circlesCollide(entity):
 						#print self.name, 'collided with', entity.name
@@ -204,13 +348,14 @@ class Entity(object):
 						#print '%s (%.1f, %.1f, %.1f, %.1f) overlaps with %s (%.1f, %.1f, %.1f, %.1f)' % \
 						#		(self.name, self.rect[0], self.rect[1], self.rect[2], self.rect[3],
 						#		 entity.name, entity.rect[0], entity.rect[1], entity.rect[2], entity.rect[3])
-						if self.vx > 0 and rectRight(self.prev_rect) <= entity.left():
+						store = self.store
+						if self.vx > 0 and store.prev_right[self.slot] <= entity.left():
 							self.limitRight(entity.left())
-						elif self.vx < 0 and rectLeft(self.prev_rect) >= entity.right():
+						elif self.vx < 0 and store.prev_left[self.slot] >= entity.right():
 							self.limitLeft(entity.right())
-						if self.vy > 0 and rectBottom(self.prev_rect) <= entity.top():
+						if self.vy > 0 and store.prev_bottom[self.slot] <= entity.top():
 							self.limitBottom(entity.top())
-						elif self.vy < 0 and rectTop(self.prev_rect) >= entity.bottom():
+						elif self.vy < 0 and store.prev_top[self.slot] >= entity.bottom():
 							self.limitTop(entity.bottom())
 						
 						self.collide_rect_duration += dt
@@ -228,42 +373,254 @@ class Entity(object):
 	# ------------------------------------------------------------------------------
 	def alertGuardsInRange(self):
 		# Work out which guards are within a short distance of this entity
-		for entity in Entity._entities:
-			if entity is self or not isinstance(entity, GuardEntity):
+		for entity in Entity.ofType(GuardEntity):
+			if entity is self:
 				continue
 			dist = misc.distBetween(self.x, self.y, entity.x, entity.y)
 			if dist < ALERT_MAX_RANGE:
 				# Alert the guard and make them come to this location
 				entity.alertTo(self.x, self.y)
 	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def ofType(cls, entity_class):
+		"Returns the entities in the update list that are instances of the class, in update order.  Don't change it."
+		return cls._by_type.get(entity_class, ())
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def unlootedChests(cls):
+		"Houses that still have a chest, including those in parts of the level that aren't loaded."
+		return cls._unlooted_chests + cls._unloaded_chests
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def setUnloadedChests(cls, count):
+		cls._unloaded_chests = count
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def _register(cls, entity):
+		for entity_class in type(entity).__mro__:
+			if entity_class is object:
+				break
+			cls._by_type.setdefault(entity_class, []).append(entity)
+		if isinstance(entity, HouseEntity) and entity.chest is not None:
+			cls._unlooted_chests += 1
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def _unregister(cls, dead_entities):
+		dead_classes = set()
+		for entity in dead_entities:
+			dead_classes.update(type(entity).__mro__)
+			if isinstance(entity, HouseEntity) and entity.chest is not None:
+				cls._unlooted_chests -= 1
+		for entity_class in dead_classes:
+			if entity_class in cls._by_type:
+				cls._by_type[entity_class] = [entity for entity in cls._by_type[entity_class] if entity.alive]
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def buildObstacles(cls):
+		"""Puts the houses into a tree for line of sight queries, and bakes the navigation grid around them.
+		Houses never move, so this is done per level, and again as parts of a large level are loaded or released."""
+		houses = [entity for entity in cls._entities + cls._new_entities if isinstance(entity, HouseEntity)]
+		cls._obstacles = spatial.AABBTree([(house.rect, house) for house in houses])
+		if misc.g_have_numpy and houses != []:
+			cls._obstacle_edges = misc.rectEdges([house.rect for house in houses])
+		else:
+			cls._obstacle_edges = None
+		world_width, world_height = worldSize()
+		left, top, right, bottom = cls._nav_bounds or (0, SCREEN_MINIMUM_Y, world_width, world_height)
+		cls._nav_grid = navigation.NavGrid(right, bottom, [house.rect for house in houses], NAV_CLEARANCE,
+										   min_y=top, min_x=left)
+		cls._chase_field = None
+		for guard in cls.ofType(GuardEntity):
+			guard.nav_path = None		# planned on the old grid
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def setNavBounds(cls, bounds):
+		"Limits the navigation grid to the rect, or to the world for None.  Applies from the next buildObstacles."
+		cls._nav_bounds = bounds
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def loadVisibility(cls, cache_file_name, level_hash):
+		"""Loads (or builds) the visibility table for the current houses.  level_hash identifies the level's layout.
+		The table covers the whole world, so only use it when all of the level's houses are loaded."""
+		world_width, world_height = worldSize()
+		key = hashlib.md5(level_hash + repr((world_width, world_height, SCREEN_MINIMUM_Y,
+											 visibility.PVS_CELL_SIZE))).hexdigest()
+		houses = [entity for entity in cls._entities + cls._new_entities if isinstance(entity, HouseEntity)]
+		cls._visibility = visibility.loadOrBuild(cache_file_name, key, world_width, world_height,
+												 [house.rect for house in houses], min_y=SCREEN_MINIMUM_Y)
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def knownVisibility(cls, x1, y1, x2, y2):
+		"Returns True or False if the visibility table knows whether the points can see each other, or else None."
+		if cls._visibility is None:
+			return None
+		return cls._visibility.lookup(x1, y1, x2, y2)
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def findObstacle(cls, x1, y1, x2, y2):
+		"Returns the first house blocking the line between the two points, or None if there isn't one."
+		if cls._obstacles is None:
+			cls.buildObstacles()
+		return cls._obstacles.firstSegmentHit(x1, y1, x2, y2,
+											  lambda house: misc.lineIntersectsRect(x1, y1, x2, y2, house.rect))
+	
 	# ------------------------------------------------------------------------------
 	@classmethod
 	def updateAll(cls, dt):
-		[entity.update(dt) for entity in cls._entities]
-		cls._entities = [entity for entity in cls._entities if entity.alive]
+		cls._tick += 1
+		GuardEntity._scheduler.plan(cls.ofType(GuardEntity), PlayerEntity.instance)
+		for entity in cls._entities:
+			entity.update(dt)
+		
+		# Everything moves at once, then carries on in update order
+		owners = g_store.owners
+		world_width, world_height = worldSize()
+		for slot in g_store.move(dt, 0, SCREEN_MINIMUM_Y, world_width, world_height):
+			owners[slot].updateGridCells()
+		for entity in cls._entities:
+			entity.afterMove(dt)
+		cls._tweens.update(dt)
+		
+		# Remove dead entities, and add new ones.  The lists are only rebuilt when they change.
+		dead_entities = None
+		for entity in cls._entities:
+			if not entity.alive:
+				cls._grid.remove(entity)
+				cls._shown.discard(entity)
+				entity.deleteSprites()
+				g_store.release(entity.slot)
+				if dead_entities is None:
+					dead_entities = []
+				dead_entities.append(entity)
+		if dead_entities is not None:
+			cls._entities = [entity for entity in cls._entities if entity.alive]
+			cls._unregister(dead_entities)
+		if cls._new_entities == []:
+			return
+		for entity in cls._new_entities:
+			entity.order = cls._next_order
+			cls._next_order += 1
+			entity.prev_x = entity.x		# nowhere to interpolate from yet
+			entity.prev_y = entity.y
+			g_store.active[entity.slot] = 1
+			cls._grid.insert(entity, entity.broadBounds())
+			cls._register(entity)
+			entity.setVisible(True)		# until the next cullAll says otherwise
+			cls._shown.add(entity)
 		cls._entities.extend(cls._new_entities)
 		cls._new_entities = []
 		
 	# ------------------------------------------------------------------------------
 	@classmethod
-	def drawAll(cls):
-		[entity.draw() for entity in cls._entities]
+	def removeNow(cls, removed):
+		"""Takes the entities out straight away, rather than at the end of an update as for dead ones (so it works
+		while paused).  A house takes its chest with it.  Entities that are already gone are skipped."""
+		removing = []
+		for entity in removed:
+			if isinstance(entity, HouseEntity) and entity.chest is not None:
+				removing.append(entity.chest)
+			removing.append(entity)
+		removing = [entity for entity in removing if entity.alive]
+		if removing == []:
+			return
+		
+		registered = [entity for entity in removing if entity.order is not None]
+		for entity in removing:
+			entity.alive = False
+			cls._tweens.cancel((entity, 'fade'))
+			cls._tweens.cancel((entity, 'flash'))
+			events.removeAllEventsForEntity(entity)
+			if entity.order is not None:
+				cls._grid.remove(entity)
+			cls._shown.discard(entity)
+			entity.deleteSprites()
+			g_store.release(entity.slot)
+		cls._entities = [entity for entity in cls._entities if entity.alive]
+		cls._new_entities = [entity for entity in cls._new_entities if entity.alive]
+		cls._unregister(registered)
+		if any(isinstance(entity, HouseEntity) for entity in removing):
+			cls._obstacles = None		# rebuilt without these houses on the next query
+			cls._visibility = None
+		
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def interpolateAll(cls, alpha):
+		"""Moves the sprites of everything shown that moved in the last tick the fraction alpha of the way there
+		from where it was, for drawing between ticks.  An alpha of 1 puts them back at their current positions."""
+		for entity in cls._shown:
+			if entity.x != entity.prev_x or entity.y != entity.prev_y:
+				entity.updateRenderPos(alpha)
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def cullAll(cls, view_bounds):
+		"""Shows the sprites of the entities that may overlap the view bounds (a rect in world coordinates) and
+		hides the rest, so they cost the batch nothing.  Only the entities going on or off screen are touched."""
+		on_screen = cls._grid.query(view_bounds)
+		for entity in cls._shown - on_screen:
+			entity.setVisible(False)
+		for entity in on_screen - cls._shown:
+			entity.setVisible(True)
+		cls._shown = on_screen
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def numShown(cls):
+		return len(cls._shown)
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def drawAll(cls, view_bounds=None):
+		"Draws the entities.  If view bounds are given, only the ones that may overlap them are drawn."
+		if view_bounds is not None:
+			cls.cullAll(view_bounds)
+		g_batch.draw()
 	
 	# ------------------------------------------------------------------------------
 	@classmethod
 	def clearAll(cls):
+		for entity in cls._entities + cls._new_entities:
+			entity.deleteSprites()
+		g_store.clear()
+		cls._tweens.clear()
+		GuardEntity._scheduler.clear()
 		cls._entities = []
 		cls._new_entities = []
+		cls._by_type = {}
+		cls._unlooted_chests = 0
+		cls._unloaded_chests = 0
+		cls._shown = set()
+		cls._grid.clear()
+		cls._obstacles = None
+		cls._nav_grid = None
+		cls._nav_bounds = None
+		cls._chase_field = None
+		cls._visibility = None
 
 # ------------------------------------------------------------------------------
 class HouseEntity(Entity):
+	draw_group = HOUSE_GROUP
 	_index = 1
+	__slots__ = ('chest', 'loot_rect', 'loot_difficulty', 'loot_timer', 'loot_amount', 'colour')
 	# ------------------------------------------------------------------------------
-	def __init__(self, x, y, size, loot_amount=-1, loot_difficulty=1):
-		col = random.randint(1, 4)
+	def __init__(self, x, y, size, loot_amount=-1, loot_difficulty=1, colour=None):
+		col = colour if colour is not None else random.randint(1, 4)
+		self.colour = col
 		super(HouseEntity, self).__init__('data/textures/house{0}-{1}.jpg'.format(col, size), x, y)
 		self.name = 'house ' + str(HouseEntity._index)
 		HouseEntity._index += 1
+		Entity._obstacles = None		# rebuilt with this house on the next query
+		Entity._visibility = None
 		self.chest = ChestEntity(float(x), float(y) + self.height * 0.2)
 		loot_half_width = self.width / 8
 		self.loot_rect = [self.x - loot_half_width, self.top() - 32,
@@ -301,13 +658,17 @@ class HouseEntity(Entity):
 			return False
 		self.chest.startDying()
 		self.chest = None
+		if self.order is not None and self.alive:
+			Entity._unlooted_chests -= 1
 		stats.addLoot(self.loot_amount)
 		self.loot_amount = 0
 		return True
 
 # ------------------------------------------------------------------------------
 class ChestEntity(Entity):
+	draw_group = CHEST_GROUP
 	_index = 1
+	__slots__ = ()
 	# ------------------------------------------------------------------------------
 	def __init__(self, x, y):
 		super(ChestEntity, self).__init__('data/textures/chest.png', x, y)
@@ -316,12 +677,14 @@ class ChestEntity(Entity):
 
 # ------------------------------------------------------------------------------
 class SpinnerEntity(Entity):
+	__slots__ = ()
 	# ------------------------------------------------------------------------------
 	def __init__(self):
 		super(SpinnerEntity, self).__init__('placeholders/textures/arrow.png', 200, 200)
 		self.name = 'spinner'
 		self.rotation = 0
 		self.sprite.scale = 1.5
+		self.updatePos()		# the sprite's offset from the centre depends on its scale
 		
 	# ------------------------------------------------------------------------------
 	def update(self, dt):
@@ -330,7 +693,9 @@ class SpinnerEntity(Entity):
 
 # ------------------------------------------------------------------------------
 class DaggerEntity(Entity):
+	draw_group = DAGGER_GROUP
 	_index = 1
+	__slots__ = ('move_speed',)
 	# ------------------------------------------------------------------------------
 	def __init__(self, x, y, dir_x, dir_y):
 		"dir_x and dir_y should be -1, 0, or +1 to give a direction for the dagger."
@@ -347,18 +712,10 @@ class DaggerEntity(Entity):
 		
 		self.setSpriteRotationFromDir(dir_x, dir_y)
 		
-	# ------------------------------------------------------------------------------
-	def update(self, dt):
-		super(DaggerEntity, self).update(dt)
-		if self.dying:
-			return
-		
 	# ------------------------------------------------------------------------------
 	def checkCollisions(self, dt):
-		# Check collision with everything (except itself)
-		for entity in Entity._entities:
-			if entity is self:
-				continue
+		# Check collision with everything nearby (except itself)
+		for entity in self.collisionCandidates():
 			if self.rectsCollide(entity):
 				if isinstance(entity, GuardEntity):
 					entity.damage(1)
@@ -370,11 +727,11 @@ class DaggerEntity(Entity):
 
 # ------------------------------------------------------------------------------
 class LivingEntity(Entity):
+	__slots__ = ('hp',)
 	# ------------------------------------------------------------------------------
 	def __init__(self, img_fname, x=0, y=0):
 		super(LivingEntity, self).__init__(img_fname, x, y)
 		self.hp = 1		# anything above zero
-		self.damage_timer = 0
 	
 	# ------------------------------------------------------------------------------
 	def damage(self, amount):
@@ -382,24 +739,54 @@ class LivingEntity(Entity):
 		if self.hp <= 0 and not self.dying:
 			self.startDying()
 		else:
-			self.damage_timer = DAMAGE_ANIM_DURATION_SEC
+			# Go red, then fade back to white
+			Entity._tweens.start((self, 'flash'), DAMAGE_ANIM_DURATION_SEC, self.setDamageColour, 255 - 192, 255)
+	
+	# ------------------------------------------------------------------------------
+	def setDamageColour(self, damaged_col):
+		self.sprite.color = (255, damaged_col, damaged_col)
 		
 	# ------------------------------------------------------------------------------
 	def startDying(self):
 		super(LivingEntity, self).startDying()
 		events.removeAllEventsForEntity(self)
-		self.damage_timer = 0
+		Entity._tweens.cancel((self, 'flash'))
 		self.sprite.color = (255, 64, 64)
-	
-	# ------------------------------------------------------------------------------
-	def update(self, dt):
-		# Test the movement
-		super(LivingEntity, self).update(dt)
-		if self.damage_timer > 0:
-			# Go red, then fade back to white
-			self.damage_timer = max(self.damage_timer - dt, 0)
-			damaged_col = 255 - 192 * self.damage_timer / DAMAGE_ANIM_DURATION_SEC
-			self.sprite.color = (255, damaged_col, damaged_col)
+
+# ------------------------------------------------------------------------------
+class PatrolRoute(object):
+	"A guard's patrol points (after the start point), whether they loop, and the initial facing (if given)."
+	def __init__(self, points, is_loop=False, dir_x=None, dir_y=None):
+		self.points = points
+		self.is_loop = is_loop
+		self.dir_x = dir_x
+		self.dir_y = dir_y
+
+# ------------------------------------------------------------------------------
+def parsePatrolRoute(tokens):
+	"""Parses the tokens after a guard's start position: coordinate pairs for the patrol points, 'dir' followed
+	by a pair for the initial facing, and a negative number to make the patrol loop."""
+	route = PatrolRoute([])
+	prev_coord = None
+	next_coord_is_dir = False
+	for coord in tokens:
+		if coord == 'dir':
+			next_coord_is_dir = True
+			continue
+		coord = int(coord)
+		if prev_coord is not None:
+			if next_coord_is_dir:
+				route.dir_x = misc.sign(prev_coord)
+				route.dir_y = misc.sign(coord)
+				next_coord_is_dir = False
+			else:
+				route.points.append((prev_coord, coord))
+			prev_coord = None
+		elif not next_coord_is_dir and coord < 0:
+			route.is_loop = True
+		else:
+			prev_coord = coord
+	return route
 
 # ------------------------------------------------------------------------------
 class GuardEntity(LivingEntity):
@@ -411,6 +798,16 @@ class GuardEntity(LivingEntity):
 	CHASE_STATE = 1
 	ALERT_STATE = 2
 	
+	_sightings = None		# (tick, player position, {guard: (guard position, blocked)}) from the last batch
+	_scheduler = aischeduler.AIScheduler()		# which guards think on each tick
+	
+	__slots__ = ('seen_player', 'view_dist', 'patrol_speed', 'chase_speed', 'attack_recharge_timer',
+				 'min_time_between_attacks', 'dir_x', 'dir_y', 'type_name', 'close_range_vision_min_cos', 'loot_amount',
+				 'patrol_points', 'next_patrol_point', 'patrol_point_direction', 'patrol_is_loop',
+				 'alert_x', 'alert_y', 'alert_timer', 'decision_timer', 'decided_dir_x', 'decided_dir_y',
+				 'decided_move_diagonally', 'state', 'nav_path', 'nav_target_cell', 'nav_index',
+				 'vision_img', 'vision_sprite', 'vision_half_width', 'vision_half_height', 'ai_thinking', 'ai_dt')
+	
 	# ------------------------------------------------------------------------------
 	def __init__(self, img_name, start_x, start_y, *args):
 		super(GuardEntity, self).__init__(img_name, start_x, start_y)
@@ -428,29 +825,17 @@ class GuardEntity(LivingEntity):
 		self.type_name = 'guard'
 		self.close_range_vision_min_cos = 0
 		
-		self.patrol_points = [(start_x, start_y)]
+		if len(args) == 1 and isinstance(args[0], PatrolRoute):
+			route = args[0]		# already parsed, e.g. from a baked level
+		else:
+			route = parsePatrolRoute(args)
+		self.patrol_points = [(start_x, start_y)] + route.points
 		self.next_patrol_point = 1
 		self.patrol_point_direction = +1
-		self.patrol_is_loop = False
-		prev_coord = None
-		next_coord_is_dir = False
-		for coord in args:
-			if coord == 'dir':
-				next_coord_is_dir = True
-				continue
-			coord = int(coord)
-			if prev_coord is not None:
-				if next_coord_is_dir:
-					self.dir_x = misc.sign(prev_coord)
-					self.dir_y = misc.sign(coord)
-					next_coord_is_dir = False
-				else:
-					self.patrol_points.append((prev_coord, coord))
-				prev_coord = None
-			elif not next_coord_is_dir and coord < 0:
-				self.patrol_is_loop = True
-			else:
-				prev_coord = coord
+		self.patrol_is_loop = route.is_loop
+		if route.dir_x is not None:
+			self.dir_x = route.dir_x
+			self.dir_y = route.dir_y
 		
 		self.alert_x = None
 		self.alert_y = None
@@ -461,16 +846,27 @@ class GuardEntity(LivingEntity):
 		self.decided_move_diagonally = False
 		self.state = GuardEntity.PATROL_STATE
 		
+		self.nav_path = None		# waypoints towards nav_target_cell, from the navigation grid
+		self.nav_target_cell = None
+		self.nav_index = 0
+		
+		self.ai_thinking = True		# whether to think this tick; set by the AI scheduler
+		self.ai_dt = 0				# time since it last thought
+		
 		self.vision_img = misc.getImage('data/textures/vision.jpg')
-		self.vision_sprite = pyglet.sprite.Sprite(self.vision_img, 0, 0,
-								blend_src=pyglet.gl.GL_SRC_COLOR, blend_dest=pyglet.gl.GL_ONE_MINUS_SRC_COLOR)
+		self.vision_sprite = misc.makeSprite(self.vision_img, 0, 0,
+								blend_src=pyglet.gl.GL_SRC_COLOR, blend_dest=pyglet.gl.GL_ONE_MINUS_SRC_COLOR,
+								batch=g_batch, group=VISION_GROUP)
+		self.vision_sprite.visible = False
 		self.vision_sprite.base_col = (255, 255, 255)
 		self.vision_half_width = self.vision_img.width / 2
 		self.vision_half_height = self.vision_img.height / 2
 		self.updateVisionDisplay()
 		
 	# ------------------------------------------------------------------------------
-	def updateVisionDisplay(self):
+	def updateVisionDisplay(self, centre_x=None, centre_y=None):
+		if centre_x is None:
+			centre_x, centre_y = self.x, self.y
 		offset_dist = self.half_width + self.vision_half_width
 		diagonal = self.dir_x != 0 and self.dir_y != 0
 		if diagonal:
@@ -480,8 +876,8 @@ class GuardEntity(LivingEntity):
 		if rotation is not None:
 			self.vision_sprite.rotation = rotation
 		
-		vision_centre_x = self.x + self.dir_x * offset_dist
-		vision_centre_y = self.y + self.dir_y * offset_dist
+		vision_centre_x = centre_x + self.dir_x * offset_dist
+		vision_centre_y = centre_y + self.dir_y * offset_dist
 		misc.setSpriteRenderPos(self.vision_sprite, vision_centre_x, vision_centre_y, self.vision_sprite.rotation)
 	
 	# ------------------------------------------------------------------------------
@@ -499,6 +895,13 @@ class GuardEntity(LivingEntity):
 		
 		self.alert_timer = None
 	
+	# ------------------------------------------------------------------------------
+	def setOpacity(self, opacity):
+		super(GuardEntity, self).setOpacity(opacity)
+		base_col = self.vision_sprite.base_col
+		self.vision_sprite.color = (int(opacity * base_col[0] / 255), int(opacity * base_col[1] / 255),
+									int(opacity * base_col[2] / 255))
+	
 	# ------------------------------------------------------------------------------
 	def damage(self, amount):
 		prev_hp = self.hp
@@ -512,15 +915,12 @@ class GuardEntity(LivingEntity):
 			stats.addKill(self.name)
 	
 	# ------------------------------------------------------------------------------
-	def lookForPlayer(self, dt):
-		if self.seen_player:
-			return
-		player = PlayerEntity.instance
-		
+	def playerInView(self, player):
+		"Checks the distance and angle to the player; doesn't check for anything in the way."
 		# Look for the player
 		dist_to_player = misc.circleSeparation(self.circle, player.circle)
 		if dist_to_player >= self.view_dist:
-			return
+			return False
 		
 		# Check the angle to the player using a dot product of the offset to the player with the facing direction
 		offset_to_player_x = player.x - self.x
@@ -528,20 +928,65 @@ class GuardEntity(LivingEntity):
 		offset_dot_facing = misc.normalisedDotProduct(offset_to_player_x, offset_to_player_y, self.dir_x, self.dir_y)
 		# Must be the same direction and within 45 degrees - or for very small distances, within 90 degrees
 		min_cos_angle = self.close_range_vision_min_cos if dist_to_player < 50 else COS_45_DEG
-		if offset_dot_facing < min_cos_angle:
+		return offset_dot_facing >= min_cos_angle
+	
+	# ------------------------------------------------------------------------------
+	def lookForPlayer(self, dt):
+		if self.seen_player:
+			return
+		player = PlayerEntity.instance
+		if not self.playerInView(player):
 			return
 		
-		# Check if the player is visible by intersecting the line joining the centres with all of
-		# the obstacles
-		for entity in Entity._entities:
-			if isinstance(entity, HouseEntity):		# can see through everything other than houses
-				if misc.lineIntersectsRect(player.x, player.y, self.x, self.y, entity.rect):
-					#print self.name, "can't see the player because", entity.name, 'is in the way'
-					return
+		# Check if the player is visible by intersecting the line joining the centres with the
+		# obstacles (can see through everything other than houses)
+		if self.lineOfSightBlocked(player):
+			return
 		
 		events.trigger(self.type_name + '_saw_player', self)
 		self.spotPlayer()
 		
+	# ------------------------------------------------------------------------------
+	def lineOfSightBlocked(self, player):
+		known = Entity.knownVisibility(player.x, player.y, self.x, self.y)
+		if known is not None:
+			return not known
+		
+		sighting = GuardEntity._resolveSightings(player).get(self)
+		if sighting is not None and sighting[0] == (self.x, self.y):
+			return sighting[1]
+		
+		blocker = Entity.findObstacle(player.x, player.y, self.x, self.y)
+		#if blocker is not None:
+		#	print self.name, "can't see the player because", blocker.name, 'is in the way'
+		return blocker is not None
+	
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def _resolveSightings(cls, player):
+		"""Checks line of sight for all of the guards that might see the player this tick, in one batch.
+		The guards haven't moved yet when the first one looks, so the results hold for the whole tick."""
+		if cls._sightings is not None and cls._sightings[0] == Entity._tick and cls._sightings[1] == (player.x, player.y):
+			return cls._sightings[2]
+		
+		results = {}
+		cls._sightings = (Entity._tick, (player.x, player.y), results)
+		if Entity._obstacles is None:
+			Entity.buildObstacles()
+		if Entity._obstacle_edges is None:
+			return results		# no numpy, or nothing to hide behind
+		
+		guards = [entity for entity in Entity.ofType(GuardEntity) if not entity.dying \
+					and not entity.seen_player and entity.playerInView(player) \
+					and Entity.knownVisibility(player.x, player.y, entity.x, entity.y) is None]
+		if guards == []:
+			return results
+		blocked = misc.linesIntersectAny(player.x, player.y, [guard.x for guard in guards],
+										 [guard.y for guard in guards], Entity._obstacle_edges)
+		for guard, guard_blocked in zip(guards, blocked):
+			results[guard] = ((guard.x, guard.y), bool(guard_blocked))
+		return results
+	
 	# ------------------------------------------------------------------------------
 	def spotPlayer(self):
 		PlayerEntity.instance.setSpotted(True)
@@ -575,24 +1020,28 @@ class GuardEntity(LivingEntity):
 			move_speed = self.chase_speed
 			range_to_reach = self.radius + player.radius + 5	# max attack distance
 		elif self.alert_x is not None:
-			objective_x = self.alert_x
-			objective_y = self.alert_y
+			objective_x, objective_y = self.reachablePoint(self.alert_x, self.alert_y)
 			range_to_reach = 20		# arbitrary
 		else:
 			# Patrol
 			if self.next_patrol_point < len(self.patrol_points):
 				point = self.patrol_points[self.next_patrol_point]
-				objective_x = point[0]
-				objective_y = point[1]
+				objective_x, objective_y = self.reachablePoint(point[0], point[1])
 				range_to_reach = 5
 			
 		if self.decision_timer > 0:
 			self.decision_timer -= dt
 		
 		if objective_x is not None:
-			# Move towards the objective
-			offset_to_objective_x = objective_x - self.x
-			offset_to_objective_y = objective_y - self.y
+			dist_sq_to_objective = misc.distSqBetween(self.x, self.y, objective_x, objective_y)
+			
+			# Move towards the objective, by way of the next waypoint around any houses
+			if chasing_player:
+				steer_x, steer_y = self.chaseTarget(player)
+			else:
+				steer_x, steer_y = self.steerTarget(objective_x, objective_y)
+			offset_to_objective_x = steer_x - self.x
+			offset_to_objective_y = steer_y - self.y
 			
 			move_diagonally = False
 			abs_offset_x = abs(offset_to_objective_x)
@@ -658,7 +1107,7 @@ class GuardEntity(LivingEntity):
 			self.vy = desired_dir_y * move_speed
 			
 			# Check if in range of the objective
-			if abs_offset_x * abs_offset_x + abs_offset_y * abs_offset_y < range_to_reach * range_to_reach:
+			if dist_sq_to_objective < range_to_reach * range_to_reach:
 				# In range
 				if chasing_player:
 					# Can hit the player
@@ -695,6 +1144,59 @@ class GuardEntity(LivingEntity):
 				self.dir_x = misc.sign(self.vx)
 				self.dir_y = misc.sign(self.vy)
 	
+	# ------------------------------------------------------------------------------
+	def reachablePoint(self, x, y):
+		"Moves points that are inside (or too close to) a house out to somewhere the guard can actually get to."
+		if Entity._obstacles is None:
+			Entity.buildObstacles()
+		return Entity._nav_grid.reachablePoint(x, y)
+	
+	# ------------------------------------------------------------------------------
+	def steerTarget(self, objective_x, objective_y):
+		"""Returns the point to head for on the way to the objective: the next waypoint of a path around the
+		houses.  The path is kept until the objective moves to a different cell (or the guard gets stuck)."""
+		if Entity._obstacles is None:
+			Entity.buildObstacles()
+		nav_grid = Entity._nav_grid
+		
+		target_cell = nav_grid.cellOf(objective_x, objective_y)
+		if self.stuck_duration > GuardEntity.DECISION_INTERVAL_SEC:
+			self.nav_path = None		# try again from wherever we ended up
+		if self.nav_path is None or target_cell != self.nav_target_cell:
+			self.nav_target_cell = target_cell
+			self.nav_path = nav_grid.findPath(self.x, self.y, objective_x, objective_y)
+			self.nav_index = 0
+		
+		path = self.nav_path
+		if not path:
+			return objective_x, objective_y		# no path (so head straight there and hope), or already close
+		range_sq = NAV_WAYPOINT_RANGE * NAV_WAYPOINT_RANGE
+		while self.nav_index < len(path) and \
+				misc.distSqBetween(self.x, self.y, path[self.nav_index][0], path[self.nav_index][1]) < range_sq:
+			self.nav_index += 1
+		if self.nav_index >= len(path):
+			return objective_x, objective_y
+		return path[self.nav_index]
+	
+	# ------------------------------------------------------------------------------
+	def chaseTarget(self, player):
+		"""As steerTarget, but for chasing the player.  All chasing guards share one flow field, which is only
+		rebuilt when the player moves to a different cell.  On large levels, it only reaches CHASE_FIELD_RANGE."""
+		if Entity._obstacles is None:
+			Entity.buildObstacles()
+		field = Entity._chase_field
+		player_cell = Entity._nav_grid.cellOf(player.x, player.y)
+		if field is None or field.player_cell != player_cell:
+			max_distance = CHASE_FIELD_RANGE if Entity._nav_bounds is not None else None
+			field = navigation.FlowField(Entity._nav_grid, player.x, player.y, max_distance)
+			field.player_cell = player_cell
+			Entity._chase_field = field
+		
+		next_point = field.nextPoint(self.x, self.y)
+		if next_point is None:
+			return player.x, player.y		# close enough to go straight there (or no way round)
+		return next_point
+	
 	# ------------------------------------------------------------------------------
 	def alertTo(self, x, y):
 		# Make the guard go towards the location - unless they're already chasing the player
@@ -704,10 +1206,19 @@ class GuardEntity(LivingEntity):
 		self.alert_y = y
 		self.setState(GuardEntity.ALERT_STATE)
 	
+	# ------------------------------------------------------------------------------
+	def thinkInterval(self, player):
+		"Ticks between thinks: every tick if anything's going on, or else less often the further it is from the player."
+		if player is None or self.seen_player or self.state != GuardEntity.PATROL_STATE or self.alert_x is not None:
+			return 1
+		return aischeduler.intervalForDistance(misc.distSqBetween(self.x, self.y, player.x, player.y))
+	
 	# ------------------------------------------------------------------------------
 	def update(self, dt):
-		if not self.dying:
-			self.think(dt)
+		self.ai_dt += dt
+		if not self.dying and self.ai_thinking:
+			self.think(self.ai_dt)
+			self.ai_dt = 0
 		
 		if self.attack_recharge_timer is not None:
 			self.attack_recharge_timer -= dt
@@ -715,15 +1226,24 @@ class GuardEntity(LivingEntity):
 				self.attack_recharge_timer = None
 		
 		super(GuardEntity, self).update(dt)
+	
+	# ------------------------------------------------------------------------------
+	def afterMove(self, dt):
+		super(GuardEntity, self).afterMove(dt)
 		self.updateVisionDisplay()
 	
 	# ------------------------------------------------------------------------------
-	def draw(self):
-		self.vision_sprite.draw()
-		super(GuardEntity, self).draw()
+	def updateRenderPos(self, alpha):
+		super(GuardEntity, self).updateRenderPos(alpha)
+		self.updateVisionDisplay(*self.renderPos(alpha))
+	
+	# ------------------------------------------------------------------------------
+	def sprites(self):
+		return [self.vision_sprite, self.sprite]
 
 # ------------------------------------------------------------------------------
 class HumanGuardEntity(GuardEntity):
+	__slots__ = ()
 	# ------------------------------------------------------------------------------
 	def __init__(self, name, start_x, start_y, *args):
 		super(HumanGuardEntity, self).__init__('data/textures/guard.png', start_x, start_y, *args)
@@ -736,6 +1256,7 @@ class HumanGuardEntity(GuardEntity):
 
 # ------------------------------------------------------------------------------
 class GuardDogEntity(GuardEntity):
+	__slots__ = ()
 	# ------------------------------------------------------------------------------
 	def __init__(self, name, start_x, start_y, *args):
 		super(GuardDogEntity, self).__init__('data/textures/dog.png', start_x, start_y, *args)
@@ -761,6 +1282,8 @@ class PlayerEntity(LivingEntity):
 	
 	MAX_DIST_TO_PICKPOCKET = 10		# not including entity radii
 	
+	__slots__ = ('max_hp', 'move_speed', 'dir_x', 'dir_y', 'firing', 'loot_target', 'ever_spotted')
+	
 	# ------------------------------------------------------------------------------
 	def __init__(self, x, y, initial_daggers=10):
 		PlayerEntity.instance = self
@@ -849,21 +1372,21 @@ class PlayerEntity(LivingEntity):
 	def checkLooting(self, dt):
 		loot_target = None
 		if misc.isKeyHeld(PlayerEntity.LOOT_KEY):
-			for entity in Entity._entities:
-				if isinstance(entity, HouseEntity):
-					if entity.chest is not None and misc.rectsOverlap(self.rect, entity.loot_rect):
-						loot_target = entity
-				elif isinstance(entity, HumanGuardEntity):
-					if entity.loot_amount > 0 and not entity.seen_player:
-						dist_to_guard = misc.distBetween(self.x, self.y, entity.x, entity.y)
-						dist_to_guard -= self.radius + entity.radius
-						if dist_to_guard <= PlayerEntity.MAX_DIST_TO_PICKPOCKET:
-							# Pickpocket the guard
-							events.trigger('pickpocketed_guard', self)
-							stats.addLoot(entity.loot_amount, pickpocket_target=entity)
-							entity.loot_amount = 0
-							return
-						
+			# Picking a pocket takes precedence over looting
+			for entity in Entity.ofType(HumanGuardEntity):
+				if entity.loot_amount > 0 and not entity.seen_player:
+					dist_to_guard = misc.distBetween(self.x, self.y, entity.x, entity.y)
+					dist_to_guard -= self.radius + entity.radius
+					if dist_to_guard <= PlayerEntity.MAX_DIST_TO_PICKPOCKET:
+						# Pickpocket the guard
+						events.trigger('pickpocketed_guard', self)
+						stats.addLoot(entity.loot_amount, pickpocket_target=entity)
+						entity.loot_amount = 0
+						return
+			for entity in Entity.ofType(HouseEntity):
+				if entity.chest is not None and misc.rectsOverlap(self.rect, entity.loot_rect):
+					loot_target = entity
+			
 		if loot_target != self.loot_target:
 			# Loot target changed
 			if self.loot_target is not None:
@@ -873,10 +1396,8 @@ class PlayerEntity(LivingEntity):
 				self.loot_target.startLooting()
 		elif loot_target is not None:
 			if self.loot_target.updateLooting(dt):
-				# Checking only for chests on houses, as they may be fading out ("dying")
-				won = not any((isinstance(entity, HouseEntity) and entity.chest is not None \
-								for entity in Entity._entities))
-				if won:
+				# Counting only the chests on houses, as they may be fading out ("dying")
+				if Entity.unlootedChests() == 0:
 					events.trigger('won_level', self)
 					stats.setWonLevel()
 				else:
@@ -896,6 +1417,11 @@ class PlayerEntity(LivingEntity):
 
 updateAll = Entity.updateAll
 drawAll = Entity.drawAll
+interpolateAll = Entity.interpolateAll
 clearAll = Entity.clearAll
+buildObstacles = Entity.buildObstacles
+setNavBounds = Entity.setNavBounds
+removeNow = Entity.removeNow
+loadVisibility = Entity.loadVisibility
 
 # ------------------------------------------------------------------------------
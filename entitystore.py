@@ -0,0 +1,271 @@
+# ------------------------------------------------------------------------------
+# Entity store: entity positions, velocities and bounds kept in parallel arrays
+# indexed by slot (a "struct of arrays"), so that movement can be done for every
+# entity in one pass
+#
+# Each field is an array.array, with a NumPy view onto the same memory when
+# NumPy is available.  Entities read and write their own slot through
+# properties, so the rest of the code doesn't need to know.
+# ------------------------------------------------------------------------------
+
+import array
+import misc
+
+INITIAL_CAPACITY = 64
+
+FLOAT_FIELDS = (
+	'x', 'y', 'vx', 'vy', 'prev_x', 'prev_y', 'radius',
+	'half_width', 'half_height', 'sprite_left', 'sprite_top', 'sprite_right', 'sprite_bottom',
+	# Bounds as of the last updateBoundaries, and as they were before the last move
+	'left', 'top', 'right', 'bottom', 'circle_x', 'circle_y',
+	'prev_left', 'prev_top', 'prev_right', 'prev_bottom', 'prev_circle_x', 'prev_circle_y',
+)
+FLAG_FIELDS = ('active', 'alive', 'dying', 'die_off_screen', 'force_on_screen')
+FIELDS = FLOAT_FIELDS + FLAG_FIELDS
+
+# ------------------------------------------------------------------------------
+def storeField(name, doc=None):
+	"Returns a property that reads and writes the field in the entity's slot of its store."
+	def get(self):
+		return getattr(self.store, name)[self.slot]
+	def set(self, value):
+		getattr(self.store, name)[self.slot] = value
+	return property(get, set, doc=doc)
+
+# ------------------------------------------------------------------------------
+def storeFlag(name, doc=None):
+	def get(self):
+		return getattr(self.store, name)[self.slot] != 0
+	def set(self, value):
+		getattr(self.store, name)[self.slot] = 1 if value else 0
+	return property(get, set, doc=doc)
+
+# ------------------------------------------------------------------------------
+class EntityStore(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, capacity=INITIAL_CAPACITY):
+		self.capacity = 0
+		self.size = 0		# slots in use are all below this
+		self.owners = []	# slot -> entity, or None if the slot's free
+		self._free_slots = []
+		self._detached = None	# store that released entities are moved to; see release
+		for name in FLOAT_FIELDS:
+			setattr(self, name, array.array('d'))
+		for name in FLAG_FIELDS:
+			setattr(self, name, array.array('b'))
+		self._grow(capacity)
+
+	# ------------------------------------------------------------------------------
+	def _grow(self, capacity):
+		# A new array for each field (rather than extending the old one), so NumPy views of the old ones never
+		# point at freed memory
+		for name in FLOAT_FIELDS:
+			new_array = array.array('d', [0.0]) * capacity
+			new_array[:self.capacity] = getattr(self, name)
+			setattr(self, name, new_array)
+		for name in FLAG_FIELDS:
+			new_array = array.array('b', [0]) * capacity
+			new_array[:self.capacity] = getattr(self, name)
+			setattr(self, name, new_array)
+		self.owners.extend([None] * (capacity - self.capacity))
+		self.capacity = capacity
+		self.views = None
+		if misc.g_have_numpy:
+			self.views = dict((name, misc.numpy.frombuffer(getattr(self, name), dtype=misc.numpy.float64 \
+												if name in FLOAT_FIELDS else misc.numpy.int8)) for name in FIELDS)
+
+	# ------------------------------------------------------------------------------
+	def allocate(self, owner):
+		"Returns a free slot for the owner, with every field zeroed."
+		if self._free_slots:
+			slot = self._free_slots.pop()
+		else:
+			if self.size == self.capacity:
+				self._grow(self.capacity * 2)
+			slot = self.size
+			self.size += 1
+		for name in FIELDS:
+			getattr(self, name)[slot] = 0
+		self.owners[slot] = owner
+		return slot
+
+	# ------------------------------------------------------------------------------
+	def release(self, slot):
+		"""Frees the slot, after moving its owner to a slot of the detached store, so anything still holding on to
+		the entity can go on reading it.  Released entities share the detached store, and their slots there are never
+		reused, until clear starts a new one."""
+		owner = self.owners[slot]
+		if self._detached is None:
+			self._detached = EntityStore()
+		detached = self._detached
+		detached_slot = detached.allocate(None)		# doesn't keep hold of the entity
+		for name in FIELDS:
+			getattr(detached, name)[detached_slot] = getattr(self, name)[slot]
+		detached.active[detached_slot] = 0
+		owner.store = detached
+		owner.slot = detached_slot
+
+		self.owners[slot] = None
+		self.active[slot] = 0
+		self._free_slots.append(slot)
+
+	# ------------------------------------------------------------------------------
+	def clear(self):
+		for slot in xrange(self.size):
+			if self.owners[slot] is not None:
+				self.release(slot)
+		self._free_slots = []
+		self.size = 0
+		self._detached = None		# kept alive by whatever still refers to the entities in it
+
+	# ------------------------------------------------------------------------------
+	def rectOf(self, slot):
+		return (self.left[slot], self.top[slot], self.right[slot], self.bottom[slot])
+
+	# ------------------------------------------------------------------------------
+	def circleOf(self, slot):
+		return (self.circle_x[slot], self.circle_y[slot], self.radius[slot])
+
+	# ------------------------------------------------------------------------------
+	def prevRectOf(self, slot):
+		return (self.prev_left[slot], self.prev_top[slot], self.prev_right[slot], self.prev_bottom[slot])
+
+	# ------------------------------------------------------------------------------
+	def prevCircleOf(self, slot):
+		return (self.prev_circle_x[slot], self.prev_circle_y[slot], self.radius[slot])
+
+	# ------------------------------------------------------------------------------
+	def broadBoundsOf(self, slot):
+		"Bounds covering both the rect and the circle."
+		circle_x = self.circle_x[slot]
+		circle_y = self.circle_y[slot]
+		radius = self.radius[slot]
+		return (min(self.left[slot], circle_x - radius), min(self.top[slot], circle_y - radius),
+				max(self.right[slot], circle_x + radius), max(self.bottom[slot], circle_y + radius))
+
+	# ------------------------------------------------------------------------------
+	def sweptBoundsOf(self, slot):
+		"Bounds covering the rect and the circle, both now and before the last move."
+		radius = self.radius[slot]
+		circle_x = self.circle_x[slot]
+		circle_y = self.circle_y[slot]
+		prev_circle_x = self.prev_circle_x[slot]
+		prev_circle_y = self.prev_circle_y[slot]
+		return (min(self.left[slot], circle_x - radius, self.prev_left[slot], prev_circle_x - radius),
+				min(self.top[slot], circle_y - radius, self.prev_top[slot], prev_circle_y - radius),
+				max(self.right[slot], circle_x + radius, self.prev_right[slot], prev_circle_x + radius),
+				max(self.bottom[slot], circle_y + radius, self.prev_bottom[slot], prev_circle_y + radius))
+
+	# ------------------------------------------------------------------------------
+	def hasMoved(self, slot):
+		"Returns True if the position has changed since the last move started, or since the bounds were updated."
+		x = self.x[slot]
+		y = self.y[slot]
+		return x != self.prev_x[slot] or y != self.prev_y[slot] or x != self.circle_x[slot] or y != self.circle_y[slot]
+
+	# ------------------------------------------------------------------------------
+	def move(self, dt, min_x, min_y, max_x, max_y):
+		"""Moves every active entity by its velocity, then (unless it's dying) kills the die_off_screen ones
+		outside the limits and keeps the force_on_screen ones inside them.  Returns the slots that moved."""
+		if self.views is not None:
+			return self._moveVectorised(dt, min_x, min_y, max_x, max_y)
+
+		moved = []
+		for slot in xrange(self.size):
+			if not self.active[slot]:
+				continue
+			self._savePrevious(slot)
+			self.x[slot] += self.vx[slot] * dt
+			self.y[slot] += self.vy[slot] * dt
+			self.updateBounds(slot)
+			if not self.dying[slot]:
+				x = self.x[slot]
+				y = self.y[slot]
+				if self.die_off_screen[slot] and (x >= max_x or x < min_x or y >= max_y or y < min_y):
+					self.alive[slot] = 0
+				if self.force_on_screen[slot]:
+					self._limit(slot, self.x, self.right[slot] - max_x, -1)
+					self._limit(slot, self.x, min_x - self.left[slot], +1)
+					self._limit(slot, self.y, self.bottom[slot] - max_y, -1)
+					self._limit(slot, self.y, min_y - self.top[slot], +1)
+			if self.x[slot] != self.prev_x[slot] or self.y[slot] != self.prev_y[slot]:
+				moved.append(slot)
+		return moved
+
+	# ------------------------------------------------------------------------------
+	def _savePrevious(self, slot):
+		self.prev_x[slot] = self.x[slot]
+		self.prev_y[slot] = self.y[slot]
+		self.prev_left[slot] = self.left[slot]
+		self.prev_top[slot] = self.top[slot]
+		self.prev_right[slot] = self.right[slot]
+		self.prev_bottom[slot] = self.bottom[slot]
+		self.prev_circle_x[slot] = self.circle_x[slot]
+		self.prev_circle_y[slot] = self.circle_y[slot]
+
+	# ------------------------------------------------------------------------------
+	def _limit(self, slot, coords, overlap, direction):
+		if overlap > 0:
+			coords[slot] += overlap * direction
+			self.updateBounds(slot)
+
+	# ------------------------------------------------------------------------------
+	def updateBounds(self, slot):
+		x = self.x[slot]
+		y = self.y[slot]
+		self.circle_x[slot] = x
+		self.circle_y[slot] = y
+		render_left = x - self.half_width[slot]
+		render_top = y - self.half_height[slot]
+		self.left[slot] = render_left + self.sprite_left[slot]
+		self.top[slot] = render_top + self.sprite_top[slot]
+		self.right[slot] = render_left + self.sprite_right[slot]
+		self.bottom[slot] = render_top + self.sprite_bottom[slot]
+
+	# ------------------------------------------------------------------------------
+	def _moveVectorised(self, dt, min_x, min_y, max_x, max_y):
+		numpy = misc.numpy
+		size = self.size
+		views = dict((name, view[:size]) for name, view in self.views.iteritems())
+		active = views['active'] != 0
+
+		for name in ('x', 'y', 'left', 'top', 'right', 'bottom', 'circle_x', 'circle_y'):
+			views['prev_' + name][active] = views[name][active]
+		x = views['x']
+		y = views['y']
+		x[active] += views['vx'][active] * dt
+		y[active] += views['vy'][active] * dt
+		self._updateBoundsVectorised(views, active)
+
+		living = active & (views['dying'] == 0)
+		off_screen = living & (views['die_off_screen'] != 0) & ((x >= max_x) | (x < min_x) | (y >= max_y) | (y < min_y))
+		views['alive'][off_screen] = 0
+
+		# Same order as the limit functions: right, left, bottom, top
+		clamped = living & (views['force_on_screen'] != 0)
+		for coords, edge, limit, direction in ((x, 'right', max_x, -1), (x, 'left', min_x, +1),
+											   (y, 'bottom', max_y, -1), (y, 'top', min_y, +1)):
+			overlap = (views[edge] - limit) * -direction
+			mask = clamped & (overlap > 0)
+			if mask.any():
+				coords[mask] += overlap[mask] * direction
+				self._updateBoundsVectorised(views, mask)
+
+		moved = active & ((x != views['prev_x']) | (y != views['prev_y']))
+		return numpy.flatnonzero(moved).tolist()
+
+	# ------------------------------------------------------------------------------
+	def _updateBoundsVectorised(self, views, mask):
+		x = views['x'][mask]
+		y = views['y'][mask]
+		views['circle_x'][mask] = x
+		views['circle_y'][mask] = y
+		render_left = x - views['half_width'][mask]
+		render_top = y - views['half_height'][mask]
+		views['left'][mask] = render_left + views['sprite_left'][mask]
+		views['top'][mask] = render_top + views['sprite_top'][mask]
+		views['right'][mask] = render_left + views['sprite_right'][mask]
+		views['bottom'][mask] = render_top + views['sprite_bottom'][mask]
+
+# ------------------------------------------------------------------------------
@@ -2,17 +2,40 @@
 # Events: trigger various events and responses to them, including chatter
 # ------------------------------------------------------------------------------
 
+import heapq
 import misc
+import mixer
+from multiprocessing.pool import ThreadPool
+import os
 import pyglet
 import random
 import stats
+import threading
 
 LOW_PRIORITY_MESSAGE_INTERVAL_SEC = 2
+SOUND_LOADING_THREADS = 4
+
+# Sounds that matter more steal voices from others when the mixer is full (the default priority is 0)
+SOUND_PRIORITIES = {'player_death': 2, 'won_level': 2, 'looted_chest': 1, 'pickpocketed_guard': 1,
+					'guard_death': 1, 'dog_death': 1}
+# Minimum time between repeats of the same sound, for events that come in bursts
+SOUND_COOLDOWNS_SEC = {'threw_dagger': 0.1, 'dagger_hit_house': 0.1, 'guard_hit': 0.1, 'dog_hit': 0.1}
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+_SOUND_MANIFEST_FILE = os.path.join(_DATA_DIR, 'sfx', 'manifest.txt')
+CHATTER_FILE = os.path.join(_DATA_DIR, 'chatter.txt')
 
 g_chat_events = {}
 g_sound_events = {}
-g_pending_chat_events = []		# list of [time_from_now_until_trigger_sec, line, entity]
+_g_sound_pool = None
+_g_decode_lock = threading.Lock()	# AVbin's decoding isn't re-entrant, so only the file reads are done in parallel
+_g_pending_sounds = {}		# event name -> async results for its sounds, while they're being decoded
+_g_sound_random = random.Random()		# kept apart, so when the sounds finish loading doesn't affect the game's random numbers
+g_pending_chat_events = []		# heap of (trigger time, sequence number, entity generation, line, entity)
 g_time_since_last_event = 0
+_g_time = 0						# time since the start, for the pending chat events' trigger times
+_g_next_sequence = 0			# keeps events with the same trigger time in the order they were added
+_g_entity_generations = {}		# entity -> [generation, number of its events in the heap]; see removeAllEventsForEntity
 
 # ------------------------------------------------------------------------------
 # Chatter
@@ -46,6 +69,12 @@ def initChatter():
 	# Add the last one
 	insertChat(current_name, current_lines)
 
+# ------------------------------------------------------------------------------
+def reloadChatter():
+	"Reads the chatter file again, replacing every event's lines.  Lines already waiting to be shown are kept."
+	g_chat_events.clear()
+	initChatter()
+
 # ------------------------------------------------------------------------------
 def insertChat(name, lines):
 	if name is None:
@@ -59,11 +88,70 @@ def insertChat(name, lines):
 # Sounds
 # ------------------------------------------------------------------------------
 def initSounds():
+	"""Starts decoding the sounds for each chat event in the background.  Each event's sounds become available
+	(in g_sound_events) once they're all decoded; until then the event is silent."""
 	if not misc.g_enable_sound:
 		return
 	
+	manifest = readSoundManifest()
+	if manifest is None:
+		manifest = findEventSounds()
+		try:
+			writeSoundManifest(manifest)
+		except (IOError, OSError):
+			print 'Failed to save sound manifest'
+	
+	# pyglet.resource builds its index the first time it's asked, without a lock - do it here, not in the workers
+	pyglet.resource.reindex()
+	
+	global _g_sound_pool
+	_g_sound_pool = ThreadPool(SOUND_LOADING_THREADS)
+	loading = {}		# some files are shared between events, so only decode them once
+	for event, sounds in manifest.iteritems():
+		for sound in sounds:
+			if sound not in loading:
+				loading[sound] = _g_sound_pool.apply_async(_loadSound, (sound,))
+		_g_pending_sounds[event] = [loading[sound] for sound in sounds]
+
+# ------------------------------------------------------------------------------
+def _loadSound(name):
+	# Reading the file first means the decode finds it cached, rather than holding the lock while waiting on the disk
+	src = pyglet.resource.file(name)
+	try:
+		src.read()
+	finally:
+		src.close()
+	with _g_decode_lock:
+		return pyglet.resource.media(name, streaming=False)
+
+# ------------------------------------------------------------------------------
+def _updateSoundLoading():
+	global _g_sound_pool
+	for event, results in _g_pending_sounds.items():
+		if not all(result.ready() for result in results):
+			continue
+		del _g_pending_sounds[event]
+		try:
+			sounds = [result.get() for result in results]
+		except Exception, e:
+			print 'Failed to load sounds for {0}: {1}'.format(event, e)
+			continue
+		if SOUND_LOADING_THREADS > 1 and not all(isinstance(sound, pyglet.media.StaticSource) for sound in sounds):
+			# Anything else would be decoded as it plays, on whichever thread - not safe to share
+			print 'Failed to load sounds for {0}: not fully decoded'.format(event)
+			continue
+		g_sound_events[event] = sounds
+	
+	if _g_pending_sounds == {}:
+		_g_sound_pool.close()
+		_g_sound_pool = None
+
+# ------------------------------------------------------------------------------
+def findEventSounds():
+	"Returns a dict of chat event name -> list of sound resource names, by searching for data/sfx/<event>*.ogg."
 	# Slight laziness: copy sound events from chat events
 	from glob import glob
+	manifest = {}
 	for event in g_chat_events:
 		matching_sounds = []
 		for path in pyglet.resource.path:
@@ -77,7 +165,33 @@ def initSounds():
 			continue
 		#print 'Found', len(matching_sounds), 'matching sounds for', event
 		#print '  -', matching_sounds
-		g_sound_events[event] = [pyglet.resource.media(sound, streaming=False) for sound in matching_sounds]
+		manifest[event] = sorted(matching_sounds)
+	return manifest
+
+# ------------------------------------------------------------------------------
+def readSoundManifest():
+	"Returns the manifest saved by writeSoundManifest, or None if it's missing or older than the sounds or chatter."
+	try:
+		manifest_time = os.path.getmtime(_SOUND_MANIFEST_FILE)
+		if manifest_time < os.path.getmtime(os.path.join(_DATA_DIR, 'sfx')) or \
+				manifest_time < os.path.getmtime(CHATTER_FILE):
+			return None
+		src = open(_SOUND_MANIFEST_FILE)
+	except (IOError, OSError):
+		return None
+	
+	manifest = {}
+	for line in src.readlines():
+		tokens = line.split()
+		if len(tokens) > 1:
+			manifest[tokens[0]] = tokens[1:]
+	return manifest
+
+# ------------------------------------------------------------------------------
+def writeSoundManifest(manifest):
+	with open(_SOUND_MANIFEST_FILE, 'w') as out_file:
+		for event in sorted(manifest):
+			out_file.write('{0} {1}\n'.format(event, ' '.join(manifest[event])))
 
 # ------------------------------------------------------------------------------
 # Events
@@ -120,7 +234,7 @@ def _triggerChat(name, entity, delay_sec, low_priority, very_low_priority, event
 	if delay_sec <= 0:
 		triggerLine(chosen_line, entity)
 	else:
-		g_pending_chat_events.append([delay_sec, chosen_line, entity])
+		_scheduleLine(delay_sec, chosen_line, entity)
 	#delay_sec = 0
 	#for line in event:
 	#	g_pending_chat_events.append([delay_sec, line])
@@ -132,9 +246,20 @@ def _triggerSound(name, entity, event_trace):
 	triggered = True
 	sound_options = g_sound_events[name]
 	num_sounds = len(sound_options)
-	chosen_sound = random.randint(0, num_sounds - 1)
+	chosen_sound = _g_sound_random.randint(0, num_sounds - 1)
 	sound = sound_options[chosen_sound]
-	sound.play()
+	misc.g_mixer.play(sound, name, priority=SOUND_PRIORITIES.get(name, 0),
+					  cooldown_sec=SOUND_COOLDOWNS_SEC.get(name, mixer.DEFAULT_COOLDOWN_SEC))
+
+# ------------------------------------------------------------------------------
+def _scheduleLine(delay_sec, line, entity):
+	global _g_next_sequence
+	generation = _g_entity_generations.get(entity)
+	if generation is None:
+		generation = _g_entity_generations[entity] = [0, 0]
+	generation[1] += 1
+	heapq.heappush(g_pending_chat_events, (_g_time + delay_sec, _g_next_sequence, generation[0], line, entity))
+	_g_next_sequence += 1
 
 # ------------------------------------------------------------------------------
 def triggerLine(line, entity):
@@ -156,21 +281,32 @@ def init():
 
 # ------------------------------------------------------------------------------
 def update(dt):
-	global g_pending_chat_events
-	for event in g_pending_chat_events:
-		time_left_sec, line, entity = event
-		time_left_sec -= dt
-		event[0] = time_left_sec
-		if time_left_sec <= 0:
+	if misc.g_mixer is not None:
+		misc.g_mixer.update(dt)
+	if _g_sound_pool is not None:
+		_updateSoundLoading()
+	
+	# Only the events that are due are looked at
+	global _g_time
+	_g_time += dt
+	while g_pending_chat_events and g_pending_chat_events[0][0] <= _g_time:
+		trigger_time, sequence, event_generation, line, entity = heapq.heappop(g_pending_chat_events)
+		generation = _g_entity_generations[entity]
+		generation[1] -= 1
+		if generation[1] == 0:
+			del _g_entity_generations[entity]
+		if event_generation == generation[0]:
 			triggerLine(line, entity)
-	g_pending_chat_events = [event for event in g_pending_chat_events if event[0] > 0]
 	
 	global g_time_since_last_event
 	g_time_since_last_event += dt
 
 # ------------------------------------------------------------------------------
 def removeAllEventsForEntity(entity):
-	global g_pending_chat_events
-	g_pending_chat_events = [event for event in g_pending_chat_events if event[2] is entity]
+	"""Cancels the entity's pending chat events.  They're left in the heap, but moving the entity on to a new
+	generation means they're skipped when they come up."""
+	generation = _g_entity_generations.get(entity)
+	if generation is not None:
+		generation[0] += 1
 
 # ------------------------------------------------------------------------------
@@ -0,0 +1,78 @@
+# ------------------------------------------------------------------------------
+# Game: one tick of the whole game, including the keys that move between the
+# intro, the levels and the end screen
+#
+# Shared by the windowed game (thievery.py) and headless replays (replay.py)
+# ------------------------------------------------------------------------------
+
+import entities
+import events
+import levels
+import misc
+import profiler
+from pyglet.window import key
+import replay
+import stats
+
+g_paused = False
+
+# ------------------------------------------------------------------------------
+def tick(dt):
+	"Runs one simulation step.  Returns False once the player has asked to leave the game."
+	global g_paused
+
+	replay.startTick()
+
+	if not g_paused and not stats.won_level:
+		profiler.start('updateAll')
+		entities.updateAll(dt)
+		profiler.stop('updateAll')
+		profiler.start('streaming')
+		levels.update()
+		profiler.stop('streaming')
+	profiler.start('events')
+	events.update(dt)
+	profiler.stop('events')
+	profiler.start('stats')
+	stats.update(dt)
+	profiler.stop('stats')
+
+	# Special input
+	keep_going = True
+	if misc.wasAnyKeyPressed((key.ENTER, key.RETURN)):
+		if stats.isPlayerDead():
+			#print 'reloading'
+			levels.reload()
+			stats.reset(player_died=True)
+			g_paused = False
+		elif stats.won_game:
+			#print 'finished'
+			keep_going = False
+		elif stats.intro_screen:
+			if stats.showing_sound_warning:
+				stats.setUpIntroScreen()
+			else:
+				#print 'starting'
+				levels.start()
+				misc.playMusic()
+				stats.reset()
+		elif stats.won_level:
+			#print 'next level'
+			if not levels.next():
+				misc.playMusic(victory=True)
+			stats.reset()
+			g_paused = False
+	if misc.wasKeyPressed(key.P):
+		if not stats.won_game and not stats.intro_screen:
+			g_paused = not g_paused
+			stats.setPaused(g_paused)
+	if misc.wasKeyPressed(key.F3):
+		profiler.toggle()
+	if misc.wasKeyPressed(key.F4) and profiler.isEnabled():
+		profiler.dumpCsv()
+
+	# Do this at the end, because it clears the keys pressed
+	misc.updateKeys()
+	return keep_going
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,124 @@
+# ------------------------------------------------------------------------------
+# Headless: runs the game simulation without a window, GL or sound, as fast as
+# the CPU allows
+#
+# Run with e.g. "python headless.py 3 --seconds 600" for ten minutes of level 3
+# ------------------------------------------------------------------------------
+
+import pyglet
+pyglet.options['shadow_window'] = False		# don't let pyglet open a GL context behind our back
+
+import misc
+misc.g_headless = True
+misc.g_enable_sound = False
+
+import entities
+import events
+import hotreload
+import levels
+import os
+import stats
+import time
+
+DEFAULT_STEP_SEC = 0.02		# same as the windowed game's update interval
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_g_initialised = False
+
+# ------------------------------------------------------------------------------
+class HeadlessWindow(object):
+	"The only parts of the window the simulation uses."
+	def __init__(self, width=800, height=600):
+		self.width = width
+		self.height = height
+
+# ------------------------------------------------------------------------------
+def init(width=800, height=600):
+	global _g_initialised
+	if _g_initialised:
+		return
+	_g_initialised = True
+
+	# pyglet looks for resources next to the main script, which needn't be the game's (e.g. when testing)
+	pyglet.resource.path = [GAME_DIR]
+	pyglet.resource.reindex()
+
+	window = HeadlessWindow(width, height)
+	entities.g_window = window
+	stats.g_window = window
+	misc.init()
+	stats.init()
+	events.init()
+
+# ------------------------------------------------------------------------------
+class Simulation(object):
+	"""Steps a level without drawing anything.  Each step advances the game by step_sec * time_scale seconds;
+	raising the time scale covers more game time per step, at the cost of coarser physics."""
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, level_name, step_sec=DEFAULT_STEP_SEC, time_scale=1):
+		init()
+		self.step_sec = step_sec
+		self.time_scale = time_scale
+		self.ticks = 0
+		self.game_time_sec = 0
+		self.level_name = level_name
+		levels.load(level_name)
+		stats.reset(player_died=True)
+
+	# ------------------------------------------------------------------------------
+	def step(self, count=1):
+		dt = self.step_sec * self.time_scale
+		for index in xrange(count):
+			hotreload.update(dt)
+			if not stats.won_level:
+				entities.updateAll(dt)
+				levels.update()
+			events.update(dt)
+			stats.update(dt)
+			misc.updateKeys()
+			self.ticks += 1
+			self.game_time_sec += dt
+
+	# ------------------------------------------------------------------------------
+	def runFor(self, game_time_sec):
+		"Steps until at least the given amount of game time has passed."
+		dt = self.step_sec * self.time_scale
+		self.step(max(0, int(round(game_time_sec / dt))))
+
+	# ------------------------------------------------------------------------------
+	def pressKey(self, symbol, modifiers=0):
+		misc.handleKeyPress(symbol, modifiers)
+
+	# ------------------------------------------------------------------------------
+	def releaseKey(self, symbol, modifiers=0):
+		misc.handleKeyRelease(symbol, modifiers)
+
+	# ------------------------------------------------------------------------------
+	def finished(self):
+		return stats.won_level or stats.isPlayerDead()
+
+# ------------------------------------------------------------------------------
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description='Run a level of Thievery without a window.')
+	parser.add_argument('level', nargs='?', default='1')
+	parser.add_argument('--seconds', type=float, default=60, help='game time to simulate')
+	parser.add_argument('--step', type=float, default=DEFAULT_STEP_SEC, help='seconds per step, before scaling')
+	parser.add_argument('--time-scale', type=float, default=1, help='multiplier for the time per step')
+	parser.add_argument('--hot-reload', action='store_true', help='apply edits to the level and chatter files as they\'re saved')
+	args = parser.parse_args()
+	if args.hot_reload:
+		hotreload.enable()
+
+	sim = Simulation(args.level, step_sec=args.step, time_scale=args.time_scale)
+	start = time.time()
+	sim.runFor(args.seconds)
+	elapsed = time.time() - start
+	print 'Level {0}: {1} ticks ({2:.1f} s of game time) in {3:.3f} s; {4:.0f} ticks/s' \
+		.format(args.level, sim.ticks, sim.game_time_sec, elapsed, sim.ticks / max(elapsed, 1e-9))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	main()
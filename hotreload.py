@@ -0,0 +1,110 @@
+# ------------------------------------------------------------------------------
+# Hot reload: watches the current level's file and the chatter file, and
+# applies changes to the running game without restarting it
+#
+# A changed level is applied as a difference against the live entities (see
+# levels.applyChanges), so only the houses and guards that were edited are
+# touched.  Changed chatter is read again on its own.  Files are polled by
+# modification time and size, a couple of times a second.
+#
+# Off unless asked for (with --hot-reload), as edits mid-game would make a
+# recording impossible to replay.
+# ------------------------------------------------------------------------------
+
+import events
+import levels
+import os
+
+POLL_INTERVAL_SEC = 0.5
+
+_g_watcher = None
+
+# ------------------------------------------------------------------------------
+class FileWatcher(object):
+	"Notices when files change, by polling their modification times and sizes."
+
+	# ------------------------------------------------------------------------------
+	def __init__(self):
+		self._stamps = {}		# file name -> (mtime, size) when last checked, or None if it was missing
+
+	# ------------------------------------------------------------------------------
+	def watch(self, file_name):
+		"Starts watching the file, if it isn't watched already.  Its current state doesn't count as a change."
+		if file_name not in self._stamps:
+			self._stamps[file_name] = self._stamp(file_name)
+
+	# ------------------------------------------------------------------------------
+	def _stamp(self, file_name):
+		try:
+			file_stat = os.stat(file_name)
+		except OSError:
+			return None
+		return file_stat.st_mtime, file_stat.st_size
+
+	# ------------------------------------------------------------------------------
+	def changed(self):
+		"Returns the watched files that have changed since the last call (or since they were first watched)."
+		changed_files = []
+		for file_name, old_stamp in self._stamps.items():
+			new_stamp = self._stamp(file_name)
+			if new_stamp != old_stamp:
+				self._stamps[file_name] = new_stamp
+				if new_stamp is not None:
+					changed_files.append(file_name)
+		return changed_files
+
+# ------------------------------------------------------------------------------
+class HotReloader(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, poll_interval_sec=POLL_INTERVAL_SEC):
+		self.poll_interval_sec = poll_interval_sec
+		self._poll_timer = poll_interval_sec
+		self._watcher = FileWatcher()
+		self._watcher.watch(events.CHATTER_FILE)
+
+	# ------------------------------------------------------------------------------
+	def update(self, dt):
+		self._poll_timer -= dt
+		if self._poll_timer > 0:
+			return
+		self._poll_timer = self.poll_interval_sec
+
+		# Follow the game from level to level
+		level_name = levels.currentName()
+		if level_name is not None:
+			self._watcher.watch(levels.sourceFileName(level_name))
+
+		for file_name in self._watcher.changed():
+			if file_name == events.CHATTER_FILE:
+				events.reloadChatter()
+				print 'Reloaded chatter'
+			elif level_name is not None and file_name == levels.sourceFileName(level_name):
+				self._applyLevel(level_name)
+
+	# ------------------------------------------------------------------------------
+	def _applyLevel(self, level_name):
+		try:
+			num_removed, num_added = levels.applyChanges()
+		except Exception, e:
+			# Probably saved half way through an edit; the next save will try again
+			print 'Failed to reload level {0}: {1}'.format(level_name, e)
+			return
+		print 'Reloaded level {0}: {1} removed, {2} added'.format(level_name, num_removed, num_added)
+
+# ------------------------------------------------------------------------------
+def enable(poll_interval_sec=POLL_INTERVAL_SEC):
+	global _g_watcher
+	_g_watcher = HotReloader(poll_interval_sec)
+
+# ------------------------------------------------------------------------------
+def isEnabled():
+	return _g_watcher is not None
+
+# ------------------------------------------------------------------------------
+def update(dt):
+	"Call once per frame (or tick) while enabled, with the time since the last call."
+	if _g_watcher is not None:
+		_g_watcher.update(dt)
+
+# ------------------------------------------------------------------------------
@@ -3,23 +3,237 @@
 # ------------------------------------------------------------------------------
 
 import entities
-import pyglet
+import hashlib
+import mmap
+import os
+import replay
 import stats
+import streaming
+import struct
+
+LEVEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'levels')
+
+# Baked levels: each level's text file is compiled to a binary file beside it, which is memory-mapped on load.
+# The records stay in the order of the text file, so entities are created (and use random numbers) in the same order.
+# Params are stored with a type tag, so they load exactly as parsed (ints, full precision floats or strings).
+BAKED_FILE_MAGIC = 'LVB2'
+_BAKED_HEADER = struct.Struct('<4s32sdqI')		# magic, source MD5, source mtime, source size, number of records
+_RECORD_TYPE = struct.Struct('<B')
+_PARAM_COUNT = struct.Struct('<B')				# then each param: a tag, then its value
+_PARAM_TAG = struct.Struct('<c')
+_INT_PARAM = struct.Struct('<q')
+_FLOAT_PARAM = struct.Struct('<d')
+_STRING_LENGTH = struct.Struct('<H')			# then the string
+_GUARD_ROUTE = struct.Struct('<bbBH')			# dir x, dir y, flags, number of patrol points (after name, x, y)
+_PATROL_POINT = struct.Struct('<ii')
+
+PLAYER_RECORD = 1
+HOUSE_RECORD = 2
+GUARD_RECORD = 3
+DOG_RECORD = 4
+WORLD_RECORD = 5
+
+_GUARD_LOOPS = 1
+_GUARD_HAS_DIR = 2
+
+_RECORD_TYPES = {'player': PLAYER_RECORD, 'house': HOUSE_RECORD, 'guard': GUARD_RECORD, 'dog': DOG_RECORD,
+				 'world': WORLD_RECORD}
 
 _current_name = None
 
 _all_levels = ['1', '2', '3']
+g_first_level = None	# level to start on instead of the first, e.g. 'town'
+
+_g_records = {}		# level name -> (source mtime, source size, source MD5, records), so restarts skip the disk
+_g_streamer = streaming.ChunkStreamer(lambda *args, **kwargs: _construct(*args, **kwargs))	# the current level's
+_g_player_key = None	# record key of the player in the current level, as last loaded or changed
+_g_nav_bounds = None	# rect the navigation grid was last limited to, or None for the whole world
 
 # ------------------------------------------------------------------------------
 def load(level_name):
-	global _current_name
+	global _current_name, _g_player_key, _g_nav_bounds
 	_current_name = level_name
-	file_name = 'data/levels/{0}.txt'.format(level_name)
-	src = pyglet.resource.file(file_name)
+	replay.levelStarting(level_name)		# reseeds random if recording or replaying
+	source_hash, records = _levelRecords(level_name)
 	
 	entities.clearAll()
+	entities.setWorldSize(*_worldSize(records))
+	_g_nav_bounds = None
+	
+	# The player first, then the houses and guards around them (all of them, unless the level is bigger than the
+	# window), in the order of the file
+	streamed_records = []
+	for index, (record_type, params) in enumerate(records):
+		if record_type == PLAYER_RECORD:
+			_g_player_key = _recordKey(record_type, params)
+			_construct(record_type, params)
+		elif record_type != WORLD_RECORD:
+			streamed_records.append(_streamedRecord(index, record_type, params))
+	_g_streamer.setRecords(streamed_records)
+	_updateStreaming(force=True)
+	
+	# The visibility table is slow to build, so it's cached beside the level and rebuilt when the level changes.
+	# It covers the whole level, so large levels go without.
+	if _g_streamer.isAllLoaded():
+		entities.loadVisibility(os.path.join(LEVEL_DIR, '{0}.pvs'.format(level_name)), source_hash)
+	
+	#spinner = entities.SpinnerEntity()
+
+# ------------------------------------------------------------------------------
+def update():
+	"Loads and releases the parts of a large level around the player.  Call once per tick, after the entities move."
+	if _g_streamer.records:
+		_updateStreaming()
+
+# ------------------------------------------------------------------------------
+def _updateStreaming(force=False):
+	global _g_nav_bounds
+	player = entities.PlayerEntity.instance
+	if player is None:
+		return
+	houses_changed = _g_streamer.update(player.x, player.y, force)
+	entities.Entity.setUnloadedChests(_g_streamer.unloaded_chests)
 	
-	for line in src.readlines():
+	# Guards only go where the chunks can be loaded, so the navigation grid only needs to cover them
+	world_width, world_height = entities.worldSize()
+	left, top, right, bottom = streaming.reachBounds(player.x, player.y)
+	nav_bounds = (max(left, 0), max(top, entities.SCREEN_MINIMUM_Y), min(right, world_width), min(bottom, world_height))
+	if nav_bounds == (0, entities.SCREEN_MINIMUM_Y, world_width, world_height):
+		nav_bounds = None
+	if houses_changed or nav_bounds != _g_nav_bounds:
+		_g_nav_bounds = nav_bounds
+		entities.setNavBounds(nav_bounds)
+		entities.buildObstacles()
+
+# ------------------------------------------------------------------------------
+def _construct(record_type, params, **kwargs):
+	constructors = {PLAYER_RECORD: entities.PlayerEntity, HOUSE_RECORD: entities.HouseEntity,
+					GUARD_RECORD: entities.HumanGuardEntity, DOG_RECORD: entities.GuardDogEntity}
+	return constructors[record_type](*params, **kwargs)
+
+# ------------------------------------------------------------------------------
+def _streamedRecord(index, record_type, params):
+	if record_type == HOUSE_RECORD:
+		x, y = params[:2]
+	else:
+		x, y = params[1:3]		# after the guard's name
+	return streaming.StreamedRecord(_recordKey(record_type, params), index, record_type, params, x, y,
+									is_house=record_type == HOUSE_RECORD)
+
+# ------------------------------------------------------------------------------
+def _worldSize(records):
+	"Returns the (width, height) from the level's world record, or (None, None) for the window's size."
+	for record_type, params in records:
+		if record_type == WORLD_RECORD:
+			return params
+	return None, None
+
+# ------------------------------------------------------------------------------
+def _recordKey(record_type, params):
+	"Returns a hashable key for the record, equal for records that would create the same entity."
+	key = [record_type]
+	for param in params:
+		if isinstance(param, entities.PatrolRoute):
+			param = (tuple(tuple(point) for point in param.points), param.is_loop, param.dir_x, param.dir_y)
+		key.append(param)
+	return tuple(key)
+
+# ------------------------------------------------------------------------------
+def sourceFileName(level_name):
+	return os.path.join(LEVEL_DIR, '{0}.txt'.format(level_name))
+
+# ------------------------------------------------------------------------------
+def currentName():
+	return _current_name
+
+# ------------------------------------------------------------------------------
+def applyChanges():
+	"""Brings the current level's entities into line with its file without reloading it, for editing a level
+	while it runs.  Houses and guards whose records have changed or gone are removed, and new ones are added;
+	the rest are left as they are, mid-patrol or looted.  If the player's record has changed, the player is moved.
+	Returns (number removed, number added)."""
+	global _g_player_key
+	if _current_name is None or not _g_streamer.records:
+		return 0, 0
+	source_hash, records = _levelRecords(_current_name)
+	
+	unmatched = {}		# record key -> streamed records, in file order
+	for record in _g_streamer.records:
+		unmatched.setdefault(record.key, []).append(record)
+	
+	streamed_records = []
+	num_added = 0
+	houses_changed = False
+	for index, (record_type, params) in enumerate(records):
+		record_key = _recordKey(record_type, params)
+		if record_type == PLAYER_RECORD:
+			if record_key != _g_player_key and entities.PlayerEntity.instance is not None:
+				entities.PlayerEntity.instance.moveTo(float(params[0]), float(params[1]))
+				_g_player_key = record_key
+			continue
+		if record_type == WORLD_RECORD:
+			continue
+		matches = unmatched.get(record_key)
+		if matches:
+			record = matches.pop(0)
+			record.index = index
+		else:
+			record = _streamedRecord(index, record_type, params)
+			num_added += 1
+			houses_changed |= record.is_house
+		streamed_records.append(record)
+	
+	gone = [record for old_records in unmatched.itervalues() for record in old_records]
+	entities.removeNow([record.entity for record in gone if record.entity is not None])
+	houses_changed |= any(record.is_house for record in gone)
+	entities.setWorldSize(*_worldSize(records))
+	_g_streamer.setRecords(streamed_records)
+	_updateStreaming(force=True)
+	
+	if houses_changed:
+		entities.buildObstacles()
+		if _g_streamer.isAllLoaded():
+			entities.loadVisibility(os.path.join(LEVEL_DIR, '{0}.pvs'.format(_current_name)), source_hash)
+	return len(gone), num_added
+
+# ------------------------------------------------------------------------------
+def _levelRecords(level_name):
+	"""Returns (source MD5, records) for the level, where each record is (record type, constructor params).
+	Uses the copy in memory or the baked file if they match the text file, or else bakes it again."""
+	source_name = sourceFileName(level_name)
+	baked_name = os.path.join(LEVEL_DIR, '{0}.lvb'.format(level_name))
+	source_stat = os.stat(source_name)
+	
+	cached = _g_records.get(level_name)
+	if cached is not None and cached[:2] == (source_stat.st_mtime, source_stat.st_size):
+		return cached[2:]
+	
+	baked = _readBaked(baked_name)
+	if baked is not None and baked[1:3] == (source_stat.st_mtime, source_stat.st_size):
+		source_hash, records = baked[0], baked[3]
+	else:
+		# The file's been touched (or there's no baked copy) - only bake again if the contents have changed
+		with open(source_name, 'rb') as src:
+			text = src.read()
+		source_hash = hashlib.md5(text).hexdigest()
+		if baked is not None and baked[0] == source_hash:
+			records = baked[3]
+		else:
+			records = parse(text)
+		try:
+			_writeBaked(baked_name, source_hash, source_stat, records)
+		except (IOError, OSError, struct.error):
+			# Can't be stored (e.g. a number out of range) - the parsed records are fine to use as they are
+			print 'Failed to save baked level to', baked_name
+	
+	_g_records[level_name] = (source_stat.st_mtime, source_stat.st_size, source_hash, records)
+	return source_hash, records
+
+# ------------------------------------------------------------------------------
+def parse(text):
+	"Parses a level's text, returning a list of (record type, constructor params)."
+	records = []
+	for line in text.splitlines():
 		# Trim comments
 		hash_pos = line.find('#')
 		if hash_pos >= 0:
@@ -29,7 +243,9 @@ def load(level_name):
 			continue
 		
 		tokens = line.split()
-		obj_type = tokens[0].lower()
+		record_type = _RECORD_TYPES.get(tokens[0].lower())
+		if record_type is None:
+			continue
 		
 		params = []
 		for tok in tokens[1:]:
@@ -41,16 +257,113 @@ def load(level_name):
 			else:
 				params.append(tok)
 		
-		if obj_type == 'player':
-			entities.PlayerEntity(*params)
-		elif obj_type == 'house':
-			entities.HouseEntity(*params)
-		elif obj_type == 'guard':
-			entities.HumanGuardEntity(*params)
-		elif obj_type == 'dog':
-			entities.GuardDogEntity(*params)
+		if record_type in (GUARD_RECORD, DOG_RECORD):
+			params = params[:3] + [entities.parsePatrolRoute(params[3:])]
+		records.append((record_type, tuple(params)))
+	return records
+
+# ------------------------------------------------------------------------------
+def _packParams(params):
+	"Returns the params as strings of bytes, each with its type tag.  Raises struct.error for unsupported values."
+	chunks = [_PARAM_COUNT.pack(len(params))]
+	for param in params:
+		if isinstance(param, float):
+			chunks.append(_PARAM_TAG.pack('f') + _FLOAT_PARAM.pack(param))
+		elif isinstance(param, (int, long)):
+			chunks.append(_PARAM_TAG.pack('i') + _INT_PARAM.pack(param))
+		elif isinstance(param, str):
+			chunks.append(_PARAM_TAG.pack('s') + _STRING_LENGTH.pack(len(param)) + param)
+		else:
+			raise struct.error('Unsupported level param: {0!r}'.format(param))
+	return chunks
+
+# ------------------------------------------------------------------------------
+def _unpackParams(data, offset):
+	"Returns (params, offset after them) from the data written by _packParams."
+	num_params, = _PARAM_COUNT.unpack_from(data, offset)
+	offset += _PARAM_COUNT.size
+	params = []
+	for index in xrange(num_params):
+		tag, = _PARAM_TAG.unpack_from(data, offset)
+		offset += _PARAM_TAG.size
+		if tag == 'f':
+			param, = _FLOAT_PARAM.unpack_from(data, offset)
+			offset += _FLOAT_PARAM.size
+		elif tag == 'i':
+			param, = _INT_PARAM.unpack_from(data, offset)
+			offset += _INT_PARAM.size
+		elif tag == 's':
+			length, = _STRING_LENGTH.unpack_from(data, offset)
+			offset += _STRING_LENGTH.size
+			param = data[offset:offset + length]
+			if len(param) != length:
+				raise struct.error('Truncated level param')
+			offset += length
+		else:
+			raise struct.error('Unknown level param tag: {0!r}'.format(tag))
+		params.append(param)
+	return tuple(params), offset
+
+# ------------------------------------------------------------------------------
+def _writeBaked(file_name, source_hash, source_stat, records):
+	"Raises struct.error (before touching the file) if the records can't be stored."
+	chunks = [_BAKED_HEADER.pack(BAKED_FILE_MAGIC, source_hash, source_stat.st_mtime, source_stat.st_size,
+								 len(records))]
+	for record_type, params in records:
+		chunks.append(_RECORD_TYPE.pack(record_type))
+		if record_type == GUARD_RECORD or record_type == DOG_RECORD:
+			route = params[3]
+			flags = (_GUARD_LOOPS if route.is_loop else 0) | (_GUARD_HAS_DIR if route.dir_x is not None else 0)
+			chunks.extend(_packParams(params[:3]))
+			chunks.append(_GUARD_ROUTE.pack(route.dir_x or 0, route.dir_y or 0, flags, len(route.points)))
+			for point in route.points:
+				chunks.append(_PATROL_POINT.pack(*point))
+		else:
+			chunks.extend(_packParams(params))
+	with open(file_name, 'wb') as out_file:
+		out_file.write(''.join(chunks))
+
+# ------------------------------------------------------------------------------
+def _readBaked(file_name):
+	"Returns (source MD5, source mtime, source size, records) from a baked level, or None if it's missing or damaged."
+	try:
+		with open(file_name, 'rb') as in_file:
+			if os.fstat(in_file.fileno()).st_size < _BAKED_HEADER.size:
+				return None
+			data = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+	except (IOError, OSError, mmap.error):
+		return None
 	
-	#spinner = entities.SpinnerEntity()
+	try:
+		magic, source_hash, source_mtime, source_size, num_records = _BAKED_HEADER.unpack_from(data)
+		if magic != BAKED_FILE_MAGIC:
+			return None
+		records = []
+		offset = _BAKED_HEADER.size
+		for index in xrange(num_records):
+			record_type, = _RECORD_TYPE.unpack_from(data, offset)
+			offset += _RECORD_TYPE.size
+			if record_type not in (PLAYER_RECORD, HOUSE_RECORD, WORLD_RECORD, GUARD_RECORD, DOG_RECORD):
+				return None
+			params, offset = _unpackParams(data, offset)
+			if record_type == GUARD_RECORD or record_type == DOG_RECORD:
+				dir_x, dir_y, flags, num_points = _GUARD_ROUTE.unpack_from(data, offset)
+				offset += _GUARD_ROUTE.size
+				points = []
+				for point_index in xrange(num_points):
+					points.append(_PATROL_POINT.unpack_from(data, offset))
+					offset += _PATROL_POINT.size
+				route = entities.PatrolRoute(points, is_loop=bool(flags & _GUARD_LOOPS))
+				if flags & _GUARD_HAS_DIR:
+					route.dir_x = dir_x
+					route.dir_y = dir_y
+				params += (route,)
+			records.append((record_type, params))
+	except struct.error:
+		return None
+	finally:
+		data.close()
+	return source_hash, source_mtime, source_size, records
 
 # ------------------------------------------------------------------------------
 def reload():
@@ -61,11 +374,12 @@ def next():
 	try:
 		current_index = _all_levels.index(_current_name) + 1
 	except ValueError:
-		print 'Current level not found'
-		current_index = 0
+		# A level played on its own (e.g. with --level) is the whole game
+		current_index = len(_all_levels)
 	
 	if current_index >= len(_all_levels):
 		print 'Game complete!'
+		_g_streamer.setRecords([])
 		entities.clearAll()
 		stats.setWonGame()
 		return False	# no more levels
@@ -75,6 +389,6 @@ def next():
 
 # ------------------------------------------------------------------------------
 def start():
-	load(_all_levels[0])
+	load(g_first_level or _all_levels[0])
 
 # ------------------------------------------------------------------------------
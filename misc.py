@@ -2,14 +2,22 @@
 # Miscellaneous functionality
 # ------------------------------------------------------------------------------
 
+import atlas
 import math
+import mixer
 import os
 import pyglet
 from pyglet.window import key
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
 COS_45_DEG = 0.7071
 
 _g_images = {}
+_g_atlas = None
 _g_sounds = {}
 _g_keys_held = set()
 _g_keys_pressed = set()
@@ -22,6 +30,10 @@ _g_debug_img = None
 _g_debug_sprite = None
 
 g_enable_sound = pyglet.media.have_avbin
+g_mixer = None		# plays all the sound effects; set up in init if sound is enabled
+g_have_numpy = numpy is not None
+g_headless = False		# no window, GL or sound; see headless.py
+g_key_recorder = None	# if set, called with (pressed, symbol, modifiers) for every key event; see replay.py
 
 # ------------------------------------------------------------------------------
 # Helpers
@@ -36,9 +48,57 @@ def getResourceName(name):
 # ------------------------------------------------------------------------------
 def getImage(file_name):
 	if not file_name in _g_images:
-		_g_images[file_name] = pyglet.resource.image(file_name)
+		if g_headless:
+			# Only the size is needed, so don't make a texture
+			_g_images[file_name] = pyglet.image.load(file_name, file=pyglet.resource.file(file_name))
+		elif _g_atlas is not None and _g_atlas.get(file_name) is not None:
+			_g_images[file_name] = _g_atlas.get(file_name)
+		else:
+			_g_images[file_name] = pyglet.resource.image(file_name)
 	return _g_images[file_name]
 
+# ------------------------------------------------------------------------------
+def makeSprite(image, x=0, y=0, **kwargs):
+	if g_headless:
+		return HeadlessSprite(image, x, y)
+	return pyglet.sprite.Sprite(image, x, y, **kwargs)
+
+# ------------------------------------------------------------------------------
+class HeadlessSprite(object):
+	"Stands in for a pyglet sprite when there's no GL: keeps the properties, but never draws anything."
+	def __init__(self, image, x=0, y=0):
+		self.image = image
+		self.x = x
+		self.y = y
+		self.rotation = 0
+		self.opacity = 255
+		self.color = (255, 255, 255)
+		self.scale = 1
+		self.visible = True
+	
+	width = property(lambda self: self.image.width * self.scale)
+	height = property(lambda self: self.image.height * self.scale)
+	
+	def set_position(self, x, y):
+		self.x = x
+		self.y = y
+	
+	def draw(self):
+		pass
+	
+	def delete(self):
+		pass
+
+# ------------------------------------------------------------------------------
+class HeadlessLabel(object):
+	"Stands in for a pyglet label when there's no GL."
+	def __init__(self, text='', color=(255, 255, 255, 255), **kwargs):
+		self.text = text
+		self.color = color
+	
+	def draw(self):
+		pass
+
 # ------------------------------------------------------------------------------
 # Sounds
 # ------------------------------------------------------------------------------
@@ -53,13 +113,15 @@ def playSound(name):
 	if not name in _g_sounds:
 		print 'Sound {0} does not exist'.format(name)
 	else:
-		_g_sounds[name].play()
+		g_mixer.play(_g_sounds[name], name)
 
 # ------------------------------------------------------------------------------
 # Keys
 # ------------------------------------------------------------------------------
 def handleKeyPress(symbol, modifiers):
 	#print 'Key pressed: {0} ({1})'.format(symbol, modifiers)
+	if g_key_recorder is not None:
+		g_key_recorder(True, symbol, modifiers)
 	_g_keys_held.add(symbol)
 	_g_keys_pressed.add(symbol)
 	if symbol == key.A:
@@ -68,6 +130,8 @@ def handleKeyPress(symbol, modifiers):
 # ------------------------------------------------------------------------------
 def handleKeyRelease(symbol, modifiers):
 	#print 'Key released: {0} ({1})'.format(symbol, modifiers)
+	if g_key_recorder is not None:
+		g_key_recorder(False, symbol, modifiers)
 	# Note: keys may be released when not pressed (from while in another window, etc)
 	if symbol in _g_keys_held:
 		_g_keys_held.remove(symbol)
@@ -82,7 +146,10 @@ def isKeyHeld(symbol):
 
 # ------------------------------------------------------------------------------
 def isAnyKeyHeld(symbol_list):
-	return set(symbol_list).intersection(_g_keys_held)
+	for symbol in symbol_list:
+		if symbol in _g_keys_held:
+			return True
+	return False
 
 # ------------------------------------------------------------------------------
 def wasKeyPressed(symbol):
@@ -90,7 +157,10 @@ def wasKeyPressed(symbol):
 
 # ------------------------------------------------------------------------------
 def wasAnyKeyPressed(symbol_list):
-	return set(symbol_list).intersection(_g_keys_pressed)
+	for symbol in symbol_list:
+		if symbol in _g_keys_pressed:
+			return True
+	return False
 
 # ------------------------------------------------------------------------------
 def updateKeys():
@@ -256,14 +326,68 @@ def lineIntersectsRect(x1, y1, x2, y2, rect):
 			linesIntersect(x1, y1, x2, y2,   right, top, right, bottom) or \
 			linesIntersect(x1, y1, x2, y2,   left, bottom, right, bottom)
 	
+# ------------------------------------------------------------------------------
+# Batched versions of the above (need numpy)
+# ------------------------------------------------------------------------------
+def rectEdges(rects):
+	"Returns an (N * 4, 4) array of the edges of the rects, in the order lineIntersectsRect tests them."
+	edges = []
+	for left, top, right, bottom in rects:
+		edges.append((left, top, right, top))
+		edges.append((left, top, left, bottom))
+		edges.append((right, top, right, bottom))
+		edges.append((left, bottom, right, bottom))
+	return numpy.array(edges, dtype=float).reshape(-1, 4)
+
+# ------------------------------------------------------------------------------
+def linesIntersectAny(x1, y1, x2s, y2s, edges):
+	"""For each line from (x1, y1) to (x2s[i], y2s[i]), returns whether it intersects any of the edges (as
+	from rectEdges).  Does the same calculation as linesIntersect, so the results match it exactly."""
+	x2 = numpy.asarray(x2s, dtype=float).reshape(-1, 1)
+	y2 = numpy.asarray(y2s, dtype=float).reshape(-1, 1)
+	x3 = edges[:, 0]
+	y3 = edges[:, 1]
+	x4 = edges[:, 2]
+	y4 = edges[:, 3]
+	
+	# Points 3 and 4 on the same side of each line: no intersection
+	a1 = y2 - y1
+	b1 = x1 - x2
+	c1 = x2 * y1 - x1 * y2
+	r3 = a1 * x3 + b1 * y3 + c1
+	r4 = a1 * x4 + b1 * y4 + c1
+	separate = (r3 != 0) & (r4 != 0) & (numpy.sign(r3) == numpy.sign(r4))
+	
+	# Points 1 and 2 on the same side of each edge: no intersection
+	a2 = y4 - y3
+	b2 = x3 - x4
+	c2 = x4 * y3 - x3 * y4
+	r1 = a2 * x1 + b2 * y1 + c2
+	r2 = a2 * x2 + b2 * y2 + c2
+	separate |= (r1 != 0) & (r2 != 0) & (numpy.sign(r1) == numpy.sign(r2))
+	
+	return ~separate.all(axis=1)
+
+# ------------------------------------------------------------------------------
+def _renderOffsetFactors(rotation):
+	"Returns the cos & sin that scale a sprite's size into its offset from the centre, for the rotation."
+	effective_angle_rad = (225 - rotation) * math.pi / 180
+	return math.cos(effective_angle_rad), math.sin(effective_angle_rad)
+
+# Offset factors for the 8 rotations getRotationFromDir gives, so they needn't be worked out on every move
+_g_render_offset_factors = dict((rotation, _renderOffsetFactors(rotation))
+								for rotation in (0, 45, 90, 135, 180, 270, -45, -135))
+
 # ------------------------------------------------------------------------------
 def setSpriteRenderPos(sprite, centre_x, centre_y, rotation=0):
 	max_x_offset = sprite.width / (2 * COS_45_DEG)
 	max_y_offset = sprite.height / (2 * COS_45_DEG)
 	
-	effective_angle_rad = (225 - rotation) * math.pi / 180
-	offset_x = max_x_offset * math.cos(effective_angle_rad)
-	offset_y = max_y_offset * math.sin(effective_angle_rad)
+	factors = _g_render_offset_factors.get(rotation)
+	if factors is None:
+		factors = _renderOffsetFactors(rotation)		# any other angle, e.g. the spinner's
+	offset_x = max_x_offset * factors[0]
+	offset_y = max_y_offset * factors[1]
 	
 	sprite.set_position(centre_x + offset_x, centre_y + offset_y)
 	sprite.rotation = rotation
@@ -299,9 +423,16 @@ def playMusic(victory=False):
 
 # ------------------------------------------------------------------------------
 def init():
-	pyglet.resource.add_font('data/fonts/UbuntuMono-B.ttf')
+	if not g_headless:
+		pyglet.resource.add_font('data/fonts/UbuntuMono-B.ttf')
+		
+		global _g_atlas
+		texture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'textures')
+		_g_atlas = atlas.TextureAtlas(texture_dir, 'data/textures/', os.path.join(texture_dir, 'atlas.json'))
 	
 	if g_enable_sound:
+		global g_mixer
+		g_mixer = mixer.Mixer()
 		global _g_main_music
 		_g_main_music = pyglet.resource.media('data/music/main.ogg')
 		global _g_won_music
@@ -0,0 +1,100 @@
+# ------------------------------------------------------------------------------
+# Mixer: plays sounds on a fixed pool of players, so a busy fight can't pile up
+# any number of voices
+#
+# Each sound has an event name (for the per-event limit and cooldown) and a
+# priority.  When there's no free voice, the new sound steals the lowest
+# priority voice (oldest first) if that's no more important, or is dropped.
+# ------------------------------------------------------------------------------
+
+import pyglet
+
+MAX_VOICES = 8
+MAX_VOICES_PER_EVENT = 2
+DEFAULT_COOLDOWN_SEC = 0.05		# repeats of an event within this time are skipped
+DEFAULT_SOUND_DURATION_SEC = 1	# for sources that don't know their duration
+
+# ------------------------------------------------------------------------------
+class Voice(object):
+	def __init__(self, player):
+		self.player = player
+		self.event = None
+		self.priority = 0
+		self.start_time = 0
+		self.end_time = 0
+
+# ------------------------------------------------------------------------------
+class Mixer(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, max_voices=MAX_VOICES, max_voices_per_event=MAX_VOICES_PER_EVENT):
+		self.voices = [Voice(pyglet.media.Player()) for index in xrange(max_voices)]
+		self.max_voices_per_event = max_voices_per_event
+		self.time = 0
+		self.last_played = {}		# event -> time it last started
+		self.num_played = 0
+		self.num_dropped = 0
+		self.num_stolen = 0
+		self.num_deduplicated = 0
+
+	# ------------------------------------------------------------------------------
+	def update(self, dt):
+		self.time += dt
+
+	# ------------------------------------------------------------------------------
+	def play(self, source, event, priority=0, cooldown_sec=DEFAULT_COOLDOWN_SEC):
+		"Returns True if the sound was started."
+		last_time = self.last_played.get(event)
+		if last_time is not None and self.time - last_time < cooldown_sec:
+			self.num_deduplicated += 1
+			return False
+
+		active = [voice for voice in self.voices if voice.event is not None and voice.end_time > self.time]
+		same_event = [voice for voice in active if voice.event == event]
+		if len(same_event) >= self.max_voices_per_event:
+			voice = min(same_event, key=lambda voice: voice.start_time)		# replace its oldest voice
+			self.num_stolen += 1
+		elif len(active) < len(self.voices):
+			voice = self._freeVoice()
+		else:
+			voice = min(active, key=lambda voice: (voice.priority, voice.start_time))
+			if voice.priority > priority:
+				self.num_dropped += 1
+				return False
+			self.num_stolen += 1
+
+		self._start(voice, source, event, priority)
+		return True
+
+	# ------------------------------------------------------------------------------
+	def _freeVoice(self):
+		for voice in self.voices:
+			if voice.event is None or voice.end_time <= self.time:
+				return voice
+		return None
+
+	# ------------------------------------------------------------------------------
+	def _start(self, voice, source, event, priority):
+		player = voice.player
+		if player.source is not None:
+			player.next()		# drop whatever it played last (finished or not)
+		player.queue(source)
+		player.play()
+		duration = source.duration if source.duration is not None else DEFAULT_SOUND_DURATION_SEC
+		voice.event = event
+		voice.priority = priority
+		voice.start_time = self.time
+		voice.end_time = self.time + duration
+		self.last_played[event] = self.time
+		self.num_played += 1
+
+	# ------------------------------------------------------------------------------
+	def activeVoices(self):
+		return len([voice for voice in self.voices if voice.event is not None and voice.end_time > self.time])
+
+	# ------------------------------------------------------------------------------
+	def report(self):
+		return 'Sounds: {0} played, {1} stolen, {2} dropped, {3} skipped as repeats' \
+			.format(self.num_played, self.num_stolen, self.num_dropped, self.num_deduplicated)
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,234 @@
+# ------------------------------------------------------------------------------
+# Navigation: a grid of walkable cells baked from the houses, for pathfinding
+#
+# Cells are walkable if an entity with the given clearance (the largest half
+# extent of its rect) can stand at the cell's centre without touching a house
+# ------------------------------------------------------------------------------
+
+import heapq
+import math
+
+NAV_CELL_SIZE = 16
+PATH_CACHE_SIZE = 256		# paths kept per grid, for guards that walk the same routes over and over
+
+SQRT_2 = math.sqrt(2)
+
+# Neighbour offsets and step costs
+_NEIGHBOURS = ((1, 0, 1), (-1, 0, 1), (0, 1, 1), (0, -1, 1),
+			   (1, 1, SQRT_2), (-1, 1, SQRT_2), (1, -1, SQRT_2), (-1, -1, SQRT_2))
+
+# ------------------------------------------------------------------------------
+class NavGrid(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, width, height, blocked_rects, clearance, min_y=0, cell_size=NAV_CELL_SIZE, min_x=0):
+		"Covers min_x to width and min_y to height."
+		self.cell_size = cell_size
+		self.min_x = min_x
+		self.min_y = min_y
+		self.columns = int(math.ceil(float(width - min_x) / cell_size))
+		self.rows = int(math.ceil(float(height - min_y) / cell_size))
+		self._path_cache = {}
+
+		# 1 for walkable, 0 for blocked; indexed by row * columns + column
+		self.walkable = bytearray([1]) * (self.columns * self.rows)
+		for left, top, right, bottom in blocked_rects:
+			min_col, min_row = self.cellOf(left - clearance, top - clearance, clamp=True)
+			max_col, max_row = self.cellOf(right + clearance, bottom + clearance, clamp=True)
+			for row in xrange(min_row, max_row + 1):
+				for col in xrange(min_col, max_col + 1):
+					centre_x, centre_y = self.cellCentre(col, row)
+					if left - clearance < centre_x < right + clearance and top - clearance < centre_y < bottom + clearance:
+						self.walkable[row * self.columns + col] = 0
+
+	# ------------------------------------------------------------------------------
+	def cellOf(self, x, y, clamp=True):
+		col = int(math.floor((x - self.min_x) / self.cell_size))
+		row = int(math.floor((y - self.min_y) / self.cell_size))
+		if clamp:
+			col = min(max(col, 0), self.columns - 1)
+			row = min(max(row, 0), self.rows - 1)
+		return col, row
+
+	# ------------------------------------------------------------------------------
+	def cellCentre(self, col, row):
+		return self.min_x + (col + 0.5) * self.cell_size, self.min_y + (row + 0.5) * self.cell_size
+
+	# ------------------------------------------------------------------------------
+	def isWalkable(self, col, row):
+		if col < 0 or row < 0 or col >= self.columns or row >= self.rows:
+			return False
+		return self.walkable[row * self.columns + col] == 1
+
+	# ------------------------------------------------------------------------------
+	def neighbours(self, col, row):
+		"Yields (col, row, cost) for the walkable neighbours.  Diagonal moves can't cut the corners of blocked cells."
+		for offset_col, offset_row, cost in _NEIGHBOURS:
+			next_col = col + offset_col
+			next_row = row + offset_row
+			if not self.isWalkable(next_col, next_row):
+				continue
+			if offset_col != 0 and offset_row != 0:
+				if not self.isWalkable(col + offset_col, row) or not self.isWalkable(col, row + offset_row):
+					continue
+			yield next_col, next_row, cost
+
+	# ------------------------------------------------------------------------------
+	def nearestWalkable(self, col, row, max_radius=4):
+		"Returns the closest walkable cell (by rings of cells), or None if there isn't one nearby."
+		if self.isWalkable(col, row):
+			return col, row
+		for radius in xrange(1, max_radius + 1):
+			best = None
+			best_dist_sq = None
+			for ring_row in xrange(row - radius, row + radius + 1):
+				for ring_col in xrange(col - radius, col + radius + 1):
+					if max(abs(ring_col - col), abs(ring_row - row)) != radius:
+						continue
+					if not self.isWalkable(ring_col, ring_row):
+						continue
+					dist_sq = (ring_col - col) ** 2 + (ring_row - row) ** 2
+					if best is None or dist_sq < best_dist_sq:
+						best = (ring_col, ring_row)
+						best_dist_sq = dist_sq
+			if best is not None:
+				return best
+		return None
+
+	# ------------------------------------------------------------------------------
+	def reachablePoint(self, x, y):
+		"Returns the point itself if it's walkable, or else the centre of the nearest walkable cell (if any)."
+		col, row = self.cellOf(x, y)
+		if self.isWalkable(col, row):
+			return x, y
+		nearest = self.nearestWalkable(col, row)
+		if nearest is None:
+			return x, y
+		return self.cellCentre(*nearest)
+
+	# ------------------------------------------------------------------------------
+	def findPath(self, start_x, start_y, goal_x, goal_y):
+		"""Returns a list of waypoints (cell centres) leading to the goal, with only the points where the
+		direction changes.  Returns an empty list if already in the goal cell, or None if there's no path."""
+		start = self.nearestWalkable(*self.cellOf(start_x, start_y))
+		goal = self.nearestWalkable(*self.cellOf(goal_x, goal_y))
+		if start is None or goal is None:
+			return None
+		if start == goal:
+			return []
+
+		key = (start, goal)
+		if key in self._path_cache:
+			path = self._path_cache[key]
+		else:
+			path = self._aStar(start, goal)
+			if len(self._path_cache) >= PATH_CACHE_SIZE:
+				self._path_cache.clear()
+			self._path_cache[key] = path
+		if path is None:
+			return None
+		return [self.cellCentre(col, row) for col, row in path]
+
+	# ------------------------------------------------------------------------------
+	def _aStar(self, start, goal):
+		goal_col, goal_row = goal
+		def heuristic(col, row):
+			# Octile distance
+			offset_col = abs(col - goal_col)
+			offset_row = abs(row - goal_row)
+			return max(offset_col, offset_row) + (SQRT_2 - 1) * min(offset_col, offset_row)
+
+		open_heap = [(heuristic(*start), 0, start)]
+		came_from = {start: None}
+		cost_so_far = {start: 0}
+		counter = 1		# tie-breaker, so equal-cost cells come out in the order they went in
+		while open_heap:
+			priority, index, current = heapq.heappop(open_heap)
+			if current == goal:
+				break
+			current_cost = cost_so_far[current]
+			for next_col, next_row, step_cost in self.neighbours(*current):
+				next_cell = (next_col, next_row)
+				new_cost = current_cost + step_cost
+				if next_cell not in cost_so_far or new_cost < cost_so_far[next_cell]:
+					cost_so_far[next_cell] = new_cost
+					came_from[next_cell] = current
+					heapq.heappush(open_heap, (new_cost + heuristic(next_col, next_row), counter, next_cell))
+					counter += 1
+		else:
+			return None
+
+		# Walk back from the goal, keeping only the corners
+		cells = []
+		cell = goal
+		while cell is not None:
+			cells.append(cell)
+			cell = came_from[cell]
+		cells.reverse()
+		corners = []
+		for index in xrange(1, len(cells)):
+			if index == len(cells) - 1:
+				corners.append(cells[index])
+				continue
+			prev_col, prev_row = cells[index - 1]
+			col, row = cells[index]
+			next_col, next_row = cells[index + 1]
+			if (col - prev_col, row - prev_row) != (next_col - col, next_row - row):
+				corners.append(cells[index])
+		return corners
+
+# ------------------------------------------------------------------------------
+class FlowField(object):
+	"""Distances from every walkable cell to a target cell, with the next cell to step to from each one.  Built
+	once per target cell, so any number of followers can read their direction in constant time."""
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, nav_grid, target_x, target_y, max_distance=None):
+		"If max_distance is given, cells further than that (along the paths) from the target are left unreachable."
+		self.nav_grid = nav_grid
+		self.target_cell = nav_grid.nearestWalkable(*nav_grid.cellOf(target_x, target_y))
+		columns = nav_grid.columns
+		num_cells = columns * nav_grid.rows
+		self.distances = [None] * num_cells
+		self.next_cells = [None] * num_cells		# (col, row) to step to, or None at the target / if unreachable
+		if self.target_cell is None:
+			return
+
+		# Dijkstra outwards from the target.  Moves are symmetric, so each cell's next step is the cell it was
+		# reached from.
+		max_cost = float(max_distance) / nav_grid.cell_size if max_distance is not None else None
+		target_col, target_row = self.target_cell
+		self.distances[target_row * columns + target_col] = 0
+		open_heap = [(0, self.target_cell)]
+		while open_heap:
+			dist, cell = heapq.heappop(open_heap)
+			col, row = cell
+			if dist > self.distances[row * columns + col]:
+				continue		# already reached by a shorter route
+			for next_col, next_row, step_cost in nav_grid.neighbours(col, row):
+				index = next_row * columns + next_col
+				new_dist = dist + step_cost
+				if max_cost is not None and new_dist > max_cost:
+					continue
+				if self.distances[index] is None or new_dist < self.distances[index]:
+					self.distances[index] = new_dist
+					self.next_cells[index] = cell
+					heapq.heappush(open_heap, (new_dist, (next_col, next_row)))
+
+	# ------------------------------------------------------------------------------
+	def nextPoint(self, x, y):
+		"""Returns the centre of the next cell to head for, or None if already in the target cell or if the target
+		can't be reached from here."""
+		nav_grid = self.nav_grid
+		col, row = nav_grid.cellOf(x, y)
+		cell = nav_grid.nearestWalkable(col, row)
+		if cell is None:
+			return None
+		if cell != (col, row):
+			return nav_grid.cellCentre(*cell)		# get back onto the grid first
+		next_cell = self.next_cells[row * nav_grid.columns + col]
+		if next_cell is None:
+			return None
+		return nav_grid.cellCentre(*next_cell)
+
+# ------------------------------------------------------------------------------
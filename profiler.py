@@ -0,0 +1,194 @@
+# ------------------------------------------------------------------------------
+# Profiler: per-frame timings of the game's subsystems, shown in an overlay
+#
+# Press F3 in game to show or hide the overlay, and F4 to save the last few
+# seconds of frames to a CSV file.  Nothing is timed while the overlay is off.
+# ------------------------------------------------------------------------------
+
+import collections
+import misc
+import pyglet
+import stats
+import time
+
+PROFILE_HISTORY_SEC = 10		# frames kept for the percentiles and the CSV dump
+OVERLAY_REFRESH_SEC = 0.25		# the overlay text is only rebuilt this often, so it doesn't cost much itself
+PERCENTILES = (50, 95, 99)
+
+# Sections timed from the main loop, then the entity methods timed by FunctionTimer; in overlay order
+SECTIONS = ('updateAll', 'streaming', 'events', 'stats', 'on_draw')
+ENTITY_FUNCTIONS = (
+	('think', 'GuardEntity', 'think'),
+	('checkCollisions', 'Entity', 'checkCollisions'),
+	('checkCollisions', 'DaggerEntity', 'checkCollisions'),		# counted with the general version
+)
+
+g_window = None
+
+_g_enabled = False
+_g_frames = collections.deque()		# (frame start time, frame ms, {section: ms})
+_g_current = {}						# section -> seconds so far this frame
+_g_started = {}						# section -> start time, while it's running
+_g_frame_start = None
+_g_function_timer = None
+_g_label = None
+_g_overlay_age_sec = 0
+
+# ------------------------------------------------------------------------------
+class FunctionTimer(object):
+	"Replaces class methods with wrappers that add up the time spent in them."
+	def __init__(self, functions):
+		"functions is a list of (name, class, method name).  Methods given the same name are added together."
+		self.functions = functions
+		self.totals = {}
+		self.calls = {}
+		self._originals = []
+
+	def install(self):
+		for name, cls, method_name in self.functions:
+			original = cls.__dict__[method_name]
+			self._originals.append((cls, method_name, original))
+			setattr(cls, method_name, self._wrap(name, original))
+		self.reset()
+
+	def uninstall(self):
+		for cls, method_name, original in reversed(self._originals):
+			setattr(cls, method_name, original)
+		self._originals = []
+
+	def reset(self):
+		for name, cls, method_name in self.functions:
+			self.totals[name] = 0.0
+			self.calls[name] = 0
+
+	def _wrap(self, name, original):
+		is_classmethod = isinstance(original, classmethod)
+		function = original.__func__ if is_classmethod else original
+		totals = self.totals
+		calls = self.calls
+		def timed(*args):
+			start = time.time()
+			result = function(*args)
+			totals[name] += time.time() - start
+			calls[name] += 1
+			return result
+		return classmethod(timed) if is_classmethod else timed
+
+# ------------------------------------------------------------------------------
+def isEnabled():
+	return _g_enabled
+
+# ------------------------------------------------------------------------------
+def toggle():
+	global _g_enabled, _g_function_timer, _g_frame_start
+	_g_enabled = not _g_enabled
+	if _g_enabled:
+		import entities
+		_g_function_timer = FunctionTimer([(name, getattr(entities, class_name), method_name)
+										   for name, class_name, method_name in ENTITY_FUNCTIONS])
+		_g_function_timer.install()
+		_g_frame_start = None
+		_g_frames.clear()
+		_g_current.clear()
+	else:
+		_g_function_timer.uninstall()
+		_g_function_timer = None
+
+# ------------------------------------------------------------------------------
+def start(section):
+	if _g_enabled:
+		_g_started[section] = time.time()
+
+# ------------------------------------------------------------------------------
+def stop(section):
+	if _g_enabled and section in _g_started:
+		_g_current[section] = _g_current.get(section, 0) + time.time() - _g_started.pop(section)
+
+# ------------------------------------------------------------------------------
+def endFrame():
+	"Records the frame that's just been drawn.  Call once per frame, after drawing."
+	global _g_frame_start, _g_overlay_age_sec
+	if not _g_enabled:
+		return
+	now = time.time()
+	if _g_frame_start is not None:
+		sections = dict((section, seconds * 1000) for section, seconds in _g_current.iteritems())
+		for name, seconds in _g_function_timer.totals.iteritems():
+			sections[name] = seconds * 1000
+		_g_frames.append((_g_frame_start, (now - _g_frame_start) * 1000, sections))
+		while _g_frames and _g_frames[0][0] < now - PROFILE_HISTORY_SEC:
+			_g_frames.popleft()
+		_g_overlay_age_sec += now - _g_frame_start
+	_g_frame_start = now
+	_g_current.clear()
+	_g_function_timer.reset()
+
+# ------------------------------------------------------------------------------
+def percentile(sorted_values, percent):
+	if sorted_values == []:
+		return 0
+	index = min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100.0))
+	return sorted_values[index]
+
+# ------------------------------------------------------------------------------
+def _sectionNames():
+	names = list(SECTIONS)
+	for name, class_name, method_name in ENTITY_FUNCTIONS:
+		if name not in names:
+			names.append(name)
+	return names
+
+# ------------------------------------------------------------------------------
+def overlayText():
+	import entities
+	lines = []
+	frame_times = sorted(frame[1] for frame in _g_frames)
+	if frame_times:
+		average = sum(frame_times) / len(frame_times)
+		lines.append('frame  {0:6.2f} ms avg ({1:.0f} fps)  '.format(average, 1000 / max(average, 0.001)) +
+					 '  '.join('p{0} {1:.2f}'.format(percent, percentile(frame_times, percent))
+							   for percent in PERCENTILES))
+	for name in _sectionNames():
+		times = sorted(frame[2].get(name, 0) for frame in _g_frames)
+		if times:
+			lines.append('{0:16} {1:6.2f} ms avg  p{2} {3:.2f}'.format(name, sum(times) / len(times),
+																	   PERCENTILES[-1], percentile(times, PERCENTILES[-1])))
+	counts = collections.Counter(type(entity).__name__ for entity in entities.Entity._entities)
+	lines.append('  '.join('{0} {1}'.format(class_name.replace('Entity', ''), counts[class_name])
+						   for class_name in sorted(counts)))
+	lines.append('Drawn {0} of {1}'.format(entities.Entity.numShown(), len(entities.Entity._entities)))
+	scheduler = entities.GuardEntity._scheduler
+	lines.append('AI thinks/tick {0}  deferred {1}'.format(scheduler.num_thinks, scheduler.num_deferred))
+	lines.append('HUD layouts/s {0:.0f}'.format(stats.g_layouts_per_sec))
+	return '\n'.join(lines)
+
+# ------------------------------------------------------------------------------
+def draw():
+	global _g_label, _g_overlay_age_sec
+	if not _g_enabled or misc.g_headless:
+		return
+	if _g_label is None:
+		_g_label = pyglet.text.Label('', font_name='Ubuntu Mono', font_size=10, color=(255, 255, 255, 255),
+									 x=10, y=g_window.height - 10, anchor_y='top', width=g_window.width - 20,
+									 multiline=True)
+	if _g_label.text == '' or _g_overlay_age_sec >= OVERLAY_REFRESH_SEC:
+		_g_label.text = overlayText()
+		_g_overlay_age_sec = 0
+	_g_label.draw()
+
+# ------------------------------------------------------------------------------
+def dumpCsv(file_name=None):
+	"Saves the recorded frames (the last PROFILE_HISTORY_SEC seconds) to a CSV file, and returns its name."
+	if file_name is None:
+		file_name = time.strftime('profile-%Y%m%d-%H%M%S.csv')
+	names = _sectionNames()
+	with open(file_name, 'w') as out_file:
+		out_file.write(','.join(['time', 'frame_ms'] + [name + '_ms' for name in names]) + '\n')
+		for start_time, frame_ms, sections in _g_frames:
+			values = ['{0:.4f}'.format(start_time), '{0:.3f}'.format(frame_ms)]
+			values += ['{0:.3f}'.format(sections.get(name, 0)) for name in names]
+			out_file.write(','.join(values) + '\n')
+	print 'Saved', len(_g_frames), 'frames to', file_name
+	return file_name
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,193 @@
+# ------------------------------------------------------------------------------
+# Replay: records a session's key presses and releases, with the tick each one
+# arrived on, and the random seed each level started with, so the session can
+# be played back exactly
+#
+# Record with "python thievery.py --record session.json".  Play it back in a
+# window, in real time, with "python thievery.py --replay session.json", or
+# headless, as fast as possible, with "python replay.py session.json".
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	import headless		# must be imported before the game modules
+
+import json
+import misc
+import random
+
+REPLAY_VERSION = 1
+
+_g_recorder = None
+_g_player = None
+_g_seed_source = random.SystemRandom()		# seeds for new recordings; not affected by the game's seeding
+
+# ------------------------------------------------------------------------------
+class Recorder(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, tick_sec, first_level=None):
+		self.tick_sec = tick_sec
+		self.first_level = first_level
+		self.sound = misc.g_enable_sound		# decides whether the game starts on the sound warning screen
+		self.ticks = 0
+		self.seeds = []		# [tick, level name (None for the start), seed]
+		self.keys = []		# [tick, 1 for pressed or 0 for released, symbol, modifiers]
+
+	# ------------------------------------------------------------------------------
+	def startSegment(self, level_name):
+		seed = _g_seed_source.getrandbits(32)
+		self.seeds.append([self.ticks, level_name, seed])
+		random.seed(seed)
+
+	# ------------------------------------------------------------------------------
+	def keyEvent(self, pressed, symbol, modifiers):
+		self.keys.append([self.ticks, 1 if pressed else 0, symbol, modifiers])
+
+	# ------------------------------------------------------------------------------
+	def startTick(self):
+		self.ticks += 1
+
+	# ------------------------------------------------------------------------------
+	def save(self, file_name):
+		recording = {'version': REPLAY_VERSION, 'tick_sec': self.tick_sec, 'first_level': self.first_level,
+					 'sound': self.sound,
+					 'ticks': self.ticks, 'seeds': self.seeds, 'keys': self.keys}
+		with open(file_name, 'w') as out_file:
+			json.dump(recording, out_file, separators=(',', ':'))
+		print 'Recorded {0} ticks and {1} key events to {2}'.format(self.ticks, len(self.keys), file_name)
+
+# ------------------------------------------------------------------------------
+class Player(object):
+	"Plays back a recording, by feeding its keys to misc and seeding random as each level starts."
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, file_name):
+		with open(file_name) as in_file:
+			recording = json.load(in_file)
+		if recording.get('version') != REPLAY_VERSION:
+			raise ValueError('{0} is not a version {1} recording'.format(file_name, REPLAY_VERSION))
+		self.tick_sec = recording['tick_sec']
+		self.first_level = recording.get('first_level')		# None for the usual first level
+		self.sound = recording['sound']
+		self.total_ticks = recording['ticks']
+		self.seeds = recording['seeds']
+		self.keys = recording['keys']
+		self.ticks = 0
+		self._next_seed = 0
+		self._next_key = 0
+
+	# ------------------------------------------------------------------------------
+	def startSegment(self, level_name):
+		if self._next_seed >= len(self.seeds):
+			print 'Replay: no seed recorded for level', level_name
+			return
+		tick, recorded_level_name, seed = self.seeds[self._next_seed]
+		self._next_seed += 1
+		if tick != self.ticks or recorded_level_name != level_name:
+			print 'Replay: {0} started on tick {1}, but the recording has {2} on tick {3}' \
+				.format(level_name, self.ticks, recorded_level_name, tick)
+		random.seed(seed)
+
+	# ------------------------------------------------------------------------------
+	def startTick(self):
+		"Sends the keys that arrived before this tick."
+		while self._next_key < len(self.keys) and self.keys[self._next_key][0] <= self.ticks:
+			tick, pressed, symbol, modifiers = self.keys[self._next_key]
+			self._next_key += 1
+			if pressed:
+				misc.handleKeyPress(symbol, modifiers)
+			else:
+				misc.handleKeyRelease(symbol, modifiers)
+		self.ticks += 1
+
+	# ------------------------------------------------------------------------------
+	def finished(self):
+		return self.ticks >= self.total_ticks
+
+# ------------------------------------------------------------------------------
+def startRecording(tick_sec, first_level=None):
+	global _g_recorder
+	_g_recorder = Recorder(tick_sec, first_level)
+	_g_recorder.startSegment(None)
+	misc.g_key_recorder = _g_recorder.keyEvent
+
+# ------------------------------------------------------------------------------
+def stopRecording(file_name):
+	global _g_recorder
+	if _g_recorder is None:
+		return
+	misc.g_key_recorder = None
+	_g_recorder.save(file_name)
+	_g_recorder = None
+
+# ------------------------------------------------------------------------------
+def startReplay(file_name):
+	"Loads the recording and returns its player.  Call before the first tick, and before showing the first screen."
+	global _g_player
+	_g_player = Player(file_name)
+	_g_player.startSegment(None)
+	return _g_player
+
+# ------------------------------------------------------------------------------
+def isReplaying():
+	return _g_player is not None
+
+# ------------------------------------------------------------------------------
+def replayFinished():
+	return _g_player is not None and _g_player.finished()
+
+# ------------------------------------------------------------------------------
+def levelStarting(level_name):
+	"Called as each level loads, so that it starts from the same seed when replayed."
+	session = _g_player or _g_recorder
+	if session is not None:
+		session.startSegment(level_name)
+
+# ------------------------------------------------------------------------------
+def startTick():
+	"Called at the start of every simulation tick."
+	session = _g_player or _g_recorder
+	if session is not None:
+		session.startTick()
+
+# ------------------------------------------------------------------------------
+def main():
+	import argparse
+	parser = argparse.ArgumentParser(description='Replay a recorded session of Thievery headless, as fast as possible.')
+	parser.add_argument('recording')
+	args = parser.parse_args()
+
+	import game
+	import levels
+	import profiler
+	import replay		# this module, as the rest of the game sees it (not __main__)
+	import stats
+	import time
+	headless.init()
+	player = replay.startReplay(args.recording)
+	levels.g_first_level = player.first_level
+	stats.setUpFirstScreen(sound_warning=not player.sound)
+
+	tick_times = []
+	start = time.time()
+	while not player.finished():
+		tick_start = time.time()
+		keep_going = game.tick(player.tick_sec)
+		tick_times.append(time.time() - tick_start)
+		if not keep_going:
+			break
+	elapsed = time.time() - start
+
+	print 'Replayed {0} ticks ({1:.1f} s of game time) in {2:.3f} s; {3:.0f} ticks/s' \
+		.format(player.ticks, player.ticks * player.tick_sec, elapsed, player.ticks / max(elapsed, 1e-9))
+	if tick_times:
+		sorted_ms = sorted(tick_time * 1000 for tick_time in tick_times)
+		slowest = max(xrange(len(tick_times)), key=lambda index: tick_times[index])
+		print 'Tick ms: ' + '  '.join('p{0} {1:.3f}'.format(percent, profiler.percentile(sorted_ms, percent))
+									   for percent in profiler.PERCENTILES) + \
+			'  max {0:.3f} (tick {1})'.format(tick_times[slowest] * 1000, slowest)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,209 @@
+# ------------------------------------------------------------------------------
+# Spatial: broad-phase structures for collision and visibility queries
+#
+# Bounds are (left, top, right, bottom) tuples, as with entity rects - so "top"
+# is the smaller y value
+# ------------------------------------------------------------------------------
+
+import heapq
+import math
+
+AABB_TREE_LEAF_SIZE = 2
+AABB_TREE_EPSILON = 0.001		# boxes are grown by this much, so touching segments are never missed
+
+# ------------------------------------------------------------------------------
+def boundsUnion(bounds1, bounds2):
+	return (min(bounds1[0], bounds2[0]), min(bounds1[1], bounds2[1]),
+			max(bounds1[2], bounds2[2]), max(bounds1[3], bounds2[3]))
+
+# ------------------------------------------------------------------------------
+def circleBounds(circle):
+	centre_x, centre_y, radius = circle
+	return (centre_x - radius, centre_y - radius, centre_x + radius, centre_y + radius)
+
+# ------------------------------------------------------------------------------
+class SpatialHash(object):
+	"Uniform grid of cells.  Each cell holds the objects whose bounds overlap it."
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, cell_size):
+		self.cell_size = float(cell_size)
+		self._cells = {}		# (cell_x, cell_y) -> set of objects
+		self._ranges = {}		# object -> (min_cell_x, min_cell_y, max_cell_x, max_cell_y)
+
+	# ------------------------------------------------------------------------------
+	def cellRange(self, bounds):
+		# Bounds are inclusive (touching rects overlap), so an edge lying exactly on a cell boundary is
+		# placed in the cell on the far side as well
+		left, top, right, bottom = bounds
+		size = self.cell_size
+		return (int(math.floor(left / size)), int(math.floor(top / size)),
+				int(math.floor(right / size)), int(math.floor(bottom / size)))
+
+	# ------------------------------------------------------------------------------
+	def __contains__(self, obj):
+		return obj in self._ranges
+
+	# ------------------------------------------------------------------------------
+	def __len__(self):
+		return len(self._ranges)
+
+	# ------------------------------------------------------------------------------
+	def insert(self, obj, bounds):
+		cell_range = self.cellRange(bounds)
+		self._ranges[obj] = cell_range
+		self._addToCells(obj, cell_range)
+
+	# ------------------------------------------------------------------------------
+	def move(self, obj, bounds):
+		"Updates the bounds of an object already in the grid.  Cheap if it hasn't changed cells."
+		self.moveEdges(obj, bounds[0], bounds[1], bounds[2], bounds[3])
+
+	# ------------------------------------------------------------------------------
+	def moveEdges(self, obj, left, top, right, bottom):
+		"As move, but given the edges, so nothing is allocated unless the object changes cells."
+		old_range = self._ranges.get(obj)
+		if old_range is None:
+			return
+		size = self.cell_size
+		min_x = int(math.floor(left / size))
+		min_y = int(math.floor(top / size))
+		max_x = int(math.floor(right / size))
+		max_y = int(math.floor(bottom / size))
+		if min_x == old_range[0] and min_y == old_range[1] and max_x == old_range[2] and max_y == old_range[3]:
+			return
+		new_range = (min_x, min_y, max_x, max_y)
+		self._removeFromCells(obj, old_range)
+		self._ranges[obj] = new_range
+		self._addToCells(obj, new_range)
+
+	# ------------------------------------------------------------------------------
+	def remove(self, obj):
+		cell_range = self._ranges.pop(obj, None)
+		if cell_range is not None:
+			self._removeFromCells(obj, cell_range)
+
+	# ------------------------------------------------------------------------------
+	def clear(self):
+		self._cells = {}
+		self._ranges = {}
+
+	# ------------------------------------------------------------------------------
+	def query(self, bounds):
+		"Returns the set of objects in the cells overlapped by the bounds (a superset of actual overlaps)."
+		min_x, min_y, max_x, max_y = self.cellRange(bounds)
+		cells = self._cells
+		if min_x == max_x and min_y == max_y:
+			return set(cells.get((min_x, min_y), ()))
+		found = set()
+		for cell_x in xrange(min_x, max_x + 1):
+			for cell_y in xrange(min_y, max_y + 1):
+				contents = cells.get((cell_x, cell_y))
+				if contents:
+					found.update(contents)
+		return found
+
+	# ------------------------------------------------------------------------------
+	def _addToCells(self, obj, cell_range):
+		min_x, min_y, max_x, max_y = cell_range
+		cells = self._cells
+		for cell_x in xrange(min_x, max_x + 1):
+			for cell_y in xrange(min_y, max_y + 1):
+				contents = cells.get((cell_x, cell_y))
+				if contents is None:
+					cells[(cell_x, cell_y)] = set([obj])
+				else:
+					contents.add(obj)
+
+	# ------------------------------------------------------------------------------
+	def _removeFromCells(self, obj, cell_range):
+		min_x, min_y, max_x, max_y = cell_range
+		cells = self._cells
+		for cell_x in xrange(min_x, max_x + 1):
+			for cell_y in xrange(min_y, max_y + 1):
+				contents = cells.get((cell_x, cell_y))
+				if contents is not None:
+					contents.discard(obj)
+					if not contents:
+						del cells[(cell_x, cell_y)]
+
+# ------------------------------------------------------------------------------
+def segmentEntry(bounds, x1, y1, x2, y2):
+	"Returns the fraction along the segment at which it enters the bounds, or None if it misses them."
+	left, top, right, bottom = bounds
+	t_min = 0.0
+	t_max = 1.0
+	for start, delta, low, high in ((x1, x2 - x1, left, right), (y1, y2 - y1, top, bottom)):
+		if delta == 0:
+			if start < low or start > high:
+				return None
+			continue
+		t1 = (low - start) / float(delta)
+		t2 = (high - start) / float(delta)
+		if t1 > t2:
+			t1, t2 = t2, t1
+		if t1 > t_min:
+			t_min = t1
+		if t2 < t_max:
+			t_max = t2
+		if t_min > t_max:
+			return None
+	return t_min
+
+# ------------------------------------------------------------------------------
+class AABBTree(object):
+	"Bounding volume hierarchy over objects that don't move.  Built once; there's no insertion or removal."
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, items):
+		"items is a list of (bounds, object) pairs."
+		self.size = len(items)
+		self._root = self._build(list(items)) if items else None
+
+	# ------------------------------------------------------------------------------
+	def _build(self, items):
+		# Node layout: [bounds, left_child, right_child, leaf_items]
+		bounds = items[0][0]
+		for item_bounds, obj in items[1:]:
+			bounds = boundsUnion(bounds, item_bounds)
+		bounds = (bounds[0] - AABB_TREE_EPSILON, bounds[1] - AABB_TREE_EPSILON,
+				  bounds[2] + AABB_TREE_EPSILON, bounds[3] + AABB_TREE_EPSILON)
+		if len(items) <= AABB_TREE_LEAF_SIZE:
+			return [bounds, None, None, items]
+
+		# Split at the median centre along the longer axis
+		if bounds[2] - bounds[0] >= bounds[3] - bounds[1]:
+			items.sort(key=lambda item: item[0][0] + item[0][2])
+		else:
+			items.sort(key=lambda item: item[0][1] + item[0][3])
+		half = len(items) // 2
+		return [bounds, self._build(items[:half]), self._build(items[half:]), None]
+
+	# ------------------------------------------------------------------------------
+	def firstSegmentHit(self, x1, y1, x2, y2, test):
+		"""Returns the first object along the segment for which test(obj) is true, or None.
+		Only the nodes whose bounds the segment crosses are visited, nearest first."""
+		if self._root is None:
+			return None
+		entry = segmentEntry(self._root[0], x1, y1, x2, y2)
+		if entry is None:
+			return None
+		
+		heap = [(entry, 0, self._root)]
+		counter = 1		# tie-breaker, so nodes are never compared
+		while heap:
+			entry, index, node = heapq.heappop(heap)
+			leaf_items = node[3]
+			if leaf_items is not None:
+				for bounds, obj in leaf_items:
+					if test(obj):
+						return obj
+				continue
+			for child in (node[1], node[2]):
+				child_entry = segmentEntry(child[0], x1, y1, x2, y2)
+				if child_entry is not None:
+					heapq.heappush(heap, (child_entry, counter, child))
+					counter += 1
+		return None
+
+# ------------------------------------------------------------------------------
@@ -4,6 +4,7 @@
 
 import misc
 import pyglet
+import tweens
 
 g_window = None
 
@@ -34,9 +35,16 @@ _title_label = None
 _body_label = None
 
 # Misc
-_fades = []
+_tweens = tweens.Tweener()		# label fades
 _standard_labels = []
 _text_screen_labels = []
+_standard_batch = None		# draws all the standard labels at once
+
+# Layout counting: every change to a label's text or colour makes pyglet lay out its glyphs again
+LAYOUT_COUNT_INTERVAL_SEC = 1
+g_layouts_per_sec = 0
+_g_layout_count = 0
+_g_layout_count_time = 0
 
 # ------------------------------------------------------------------------------
 def reset(player_died=False):
@@ -48,14 +56,14 @@ def reset(player_died=False):
 	health_fraction = 1
 	global _chat_label
 	if _chat_label is not None:
-		_chat_label.text = ''
+		setLabelText(_chat_label, '')
 	global paused
 	paused = False
 	global won_level
 	won_level = False
 	global _status_label
 	if _status_label is not None and not won_game:
-		_status_label.text = ''
+		setLabelText(_status_label, '')
 	
 	global intro_screen
 	if player_died or intro_screen:
@@ -71,9 +79,9 @@ def reset(player_died=False):
 # ------------------------------------------------------------------------------
 def _showMessage(label, message, col, fade_duration_sec):
 	if message is not None:
-		label.text = message
+		setLabelText(label, message)
 	if col is not None:
-		label.color = col
+		setLabelColor(label, col)
 	_stopFadingLabel(label)
 	if fade_duration_sec is not None:
 		_fadeLabel(label, fade_duration_sec)
@@ -116,12 +124,14 @@ def addKill(name):
 def setLootingCompletion(fraction):
 	global looting_fraction
 	looting_fraction = fraction
-	showStatusMessage('Looting... {0}%'.format(int(100 * looting_fraction)), col=(255, 128, 0, 255),
-						fade_duration_sec=1)
+	setLabelValue(_status_label, 'Looting... {0}%', int(100 * looting_fraction))
+	showStatusMessage(col=(255, 128, 0, 255))		# opaque while looting; it fades once looting stops
 
 # ------------------------------------------------------------------------------
 def stopLooting():
 	global looting_fraction
+	if looting_fraction is not None:
+		_fadeLabel(_status_label, 1)
 	looting_fraction = None
 
 # ------------------------------------------------------------------------------
@@ -153,7 +163,7 @@ def setWonGame():
 	global houses_looted
 	global overall_loot
 	won_game = True
-	_title_label.text = 'Game Complete!'
+	setLabelText(_title_label, 'Game Complete!')
 	
 	body_label = _makeLabel(font_size=14, color=(160, 160, 160, 255), x=g_window.width / 2, y=g_window.height / 2,
 							anchor_x='center', anchor_y='center', width=int(g_window.width * 0.7), multiline=True)
@@ -177,16 +187,17 @@ def setWonGame():
 	showStatusMessage('Press Enter to exit', col=(128, 128, 128, 255))
 
 # ------------------------------------------------------------------------------
-def setUpFirstScreen():
+def setUpFirstScreen(sound_warning=None):
+	"Shows the sound warning if sound isn't working (or if sound_warning is given, if that's True), or else the intro."
 	global showing_sound_warning
-	showing_sound_warning = not misc.g_enable_sound
+	showing_sound_warning = sound_warning if sound_warning is not None else not misc.g_enable_sound
 	if not showing_sound_warning:
 		setUpIntroScreen()
 		return
 	
 	global intro_screen
 	intro_screen = True
-	_title_label.text = 'Welcome to Thievery!'
+	setLabelText(_title_label, 'Welcome to Thievery!')
 	
 	body_label = _makeLabel(font_size=14, color=(160, 160, 160, 255), x=g_window.width / 2, y=360,
 							anchor_x='center', anchor_y='center', width=int(g_window.width * 0.7), multiline=True)
@@ -211,7 +222,7 @@ def setUpIntroScreen():
 	showing_sound_warning = False
 	global intro_screen
 	intro_screen = True
-	_title_label.text = 'Welcome to Thievery!'
+	setLabelText(_title_label, 'Welcome to Thievery!')
 	
 	body_label = _makeLabel(font_size=14, color=(160, 160, 160, 255), x=g_window.width / 2, y=360,
 							anchor_x='center', anchor_y='center', width=int(g_window.width * 0.7), multiline=True)
@@ -259,54 +270,104 @@ def isPlayerDead():
 # General
 # ------------------------------------------------------------------------------
 def _makeLabel(**kwargs):
-	label = pyglet.text.Label('', font_name='Ubuntu Mono', bold=True, **kwargs)
-	label.fade_remaining_sec = None
+	if misc.g_headless:
+		label = misc.HeadlessLabel('', **kwargs)
+	else:
+		label = pyglet.text.Label('', font_name='Ubuntu Mono', bold=True, **kwargs)
+	label.value = None		# what the text was last made from, for setLabelValue
+	label.alpha = 255		# see setLabelAlpha
 	return label
 
+# ------------------------------------------------------------------------------
+def setLabelText(label, text):
+	"Changes the label's text, if it's different.  Each change costs a layout."
+	global _g_layout_count
+	label.value = None		# the text isn't made from a value any more (setLabelValue sets it again)
+	if label.text != text:
+		label.text = text
+		_g_layout_count += 1
+		if label.alpha != 255:
+			_applyLabelAlpha(label)
+
+# ------------------------------------------------------------------------------
+def setLabelColor(label, col):
+	"Changes the label's colour, if it's different.  This costs a layout too."
+	global _g_layout_count
+	if tuple(label.color) != tuple(col):
+		label.color = col
+		_g_layout_count += 1
+		if label.alpha != 255:
+			_applyLabelAlpha(label)
+
+# ------------------------------------------------------------------------------
+def setLabelValue(label, format_text, value):
+	"Shows the value in the label using the format, only formatting it again when the value changes."
+	if label.value != value:
+		setLabelText(label, format_text.format(value))
+		label.value = value
+
+# ------------------------------------------------------------------------------
+def _updateLayoutCount(dt):
+	global g_layouts_per_sec, _g_layout_count, _g_layout_count_time
+	_g_layout_count_time += dt
+	if _g_layout_count_time >= LAYOUT_COUNT_INTERVAL_SEC:
+		g_layouts_per_sec = _g_layout_count / _g_layout_count_time
+		_g_layout_count = 0
+		_g_layout_count_time = 0
+
 # ------------------------------------------------------------------------------
 def _fadeLabel(label, duration_sec):
-	label.fade_duration_sec = duration_sec
-	label.fade_remaining_sec = duration_sec
+	_tweens.start((label, 'alpha'), duration_sec, lambda alpha: setLabelAlpha(label, alpha), 255, 0)
 
 # ------------------------------------------------------------------------------
 def setLabelAlpha(label, alpha):
-	label.color = (label.color[0], label.color[1], label.color[2], int(alpha))
+	"""Fades the label (on top of its colour's alpha) by changing its vertices' alpha in place, which doesn't lay it
+	out again as changing its colour would."""
+	alpha = int(alpha)
+	if label.alpha != alpha:
+		label.alpha = alpha
+		_applyLabelAlpha(label)
 
 # ------------------------------------------------------------------------------
-def _stopFadingLabel(label):
-	label.fade_remaining_sec = None
-	setLabelAlpha(label, 255)
+def _applyLabelAlpha(label):
+	"Sets the alpha of the label's vertices, which every layout resets to its colour's."
+	alpha = label.alpha * label.color[3] // 255
+	# The glyphs' vertex lists, with four colour components per vertex (headless labels have none)
+	for vertex_list in getattr(label, '_vertex_lists', ()):
+		colors = vertex_list.colors
+		for index in xrange(3, len(colors), 4):
+			colors[index] = alpha
 
 # ------------------------------------------------------------------------------
-def updateFades(dt):
-	for label in _standard_labels:
-		if label.fade_remaining_sec is not None:
-			label.fade_remaining_sec -= dt
-			if label.fade_remaining_sec <= 0:
-				label.fade_remaining_sec = None
-				alpha = 0
-			else:
-				alpha = 255 * label.fade_remaining_sec / label.fade_duration_sec
-			setLabelAlpha(label, alpha)
+def _stopFadingLabel(label):
+	_tweens.cancel((label, 'alpha'))
+	setLabelAlpha(label, 255)
 
 # ------------------------------------------------------------------------------
 def init():
 	reset()
 	
+	global _standard_batch
+	_standard_batch = pyglet.graphics.Batch()
+	
 	global _hp_label
-	_hp_label = _makeLabel(font_size=12, color=(255, 0, 0, 255), x=15, y=10)
+	_hp_label = _makeLabel(font_size=12, color=(255, 0, 0, 255), x=15, y=10, batch=_standard_batch)
 	
 	global _dagger_label
-	_dagger_label = _makeLabel(font_size=12, color=(160, 160, 160, 255), x=785, y=10, anchor_x='right')
+	_dagger_label = _makeLabel(font_size=12, color=(160, 160, 160, 255), x=785, y=10, anchor_x='right',
+							   batch=_standard_batch)
 	
 	global _loot_label
-	_loot_label = _makeLabel(font_size=12, color=(255, 255, 0, 255), x=170, y=10, anchor_x='center')
+	_loot_label = _makeLabel(font_size=12, color=(255, 255, 0, 255), x=170, y=10, anchor_x='center',
+							 batch=_standard_batch)
 	
 	global _status_label
-	_status_label = _makeLabel(font_size=12, color=(255, 128, 0, 255), x=g_window.width / 2, y=10, anchor_x='center')
+	_status_label = _makeLabel(font_size=12, color=(255, 128, 0, 255), x=g_window.width / 2, y=10, anchor_x='center',
+							   batch=_standard_batch)
 	
 	global _chat_label
-	_chat_label = _makeLabel(font_size=12, color=(255, 255, 255, 255), x=g_window.width / 2, y=30, anchor_x='center')
+	_chat_label = _makeLabel(font_size=12, color=(255, 255, 255, 255), x=g_window.width / 2, y=30, anchor_x='center',
+							 batch=_standard_batch)
 	
 	global _title_label
 	_title_label = _makeLabel(font_size=36, color=(255, 255, 0, 255), x=g_window.width / 2, y=550,
@@ -322,16 +383,19 @@ def init():
 
 # ------------------------------------------------------------------------------
 def update(dt):
-	updateFades(dt)
-	_hp_label.text = 'Health: {0}%'.format(int(health_fraction * 100))
-	_dagger_label.text = 'Daggers: {0}'.format(daggers)
-	_loot_label.text = 'Loot: {0}'.format(loot)
+	_tweens.update(dt)
+	setLabelValue(_hp_label, 'Health: {0}%', int(health_fraction * 100))
+	setLabelValue(_dagger_label, 'Daggers: {0}', daggers)
+	setLabelValue(_loot_label, 'Loot: {0}', loot)
+	_updateLayoutCount(dt)
 
 # ------------------------------------------------------------------------------
 def draw():
-	labels_to_draw = _text_screen_labels if won_game or intro_screen else _standard_labels
-	for label in labels_to_draw:
-		if label.color[3] > 0:		# ignore if transparent
+	if not won_game and not intro_screen:
+		_standard_batch.draw()
+		return
+	for label in _text_screen_labels:
+		if label.alpha > 0 and label.color[3] > 0:		# ignore if transparent
 			label.draw()
 
 # ------------------------------------------------------------------------------
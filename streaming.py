@@ -0,0 +1,183 @@
+# ------------------------------------------------------------------------------
+# Streaming: splits a level's houses and guards into square chunks of the
+# world, and keeps only the chunks around the player loaded
+#
+# A chunk is loaded when the player comes within STREAM_IN_DISTANCE of it, and
+# released once the player is more than STREAM_OUT_DISTANCE away, so walking
+# along a chunk's edge doesn't load and release it over and over.  What the
+# player did to a released chunk stays with its records: looted chests stay
+# looted, and dead or pickpocketed guards stay that way.  Guards start their
+# patrols again when their chunk comes back.
+#
+# The chunks are only looked at when the player moves into another one, and
+# then only those nearby, so the cost depends on the neighbourhood rather than
+# on the size of the level.  A level that fits on one screen is all loaded at
+# the start, in the order of its file, and nothing is ever released.
+# ------------------------------------------------------------------------------
+
+import entities
+
+CHUNK_SIZE = 400
+STREAM_IN_DISTANCE = 600		# from the player to the nearest point of a chunk; more than half the window's width
+STREAM_OUT_DISTANCE = 800
+
+_CHUNK_REACH = -(-STREAM_OUT_DISTANCE // CHUNK_SIZE)		# chunks either side of the player's that may be in reach
+
+# ------------------------------------------------------------------------------
+def chunkOf(x, y):
+	return int(x // CHUNK_SIZE), int(y // CHUNK_SIZE)
+
+# ------------------------------------------------------------------------------
+def reachBounds(x, y):
+	"Returns the rect covering every chunk that may be loaded with the player at (x, y)."
+	chunk_x, chunk_y = chunkOf(x, y)
+	return ((chunk_x - _CHUNK_REACH) * CHUNK_SIZE, (chunk_y - _CHUNK_REACH) * CHUNK_SIZE,
+			(chunk_x + _CHUNK_REACH + 1) * CHUNK_SIZE, (chunk_y + _CHUNK_REACH + 1) * CHUNK_SIZE)
+
+# ------------------------------------------------------------------------------
+def _chunkDistance(chunk, x, y):
+	"Returns the distance from the point to the nearest point of the chunk, along whichever axis is further."
+	left = chunk[0] * CHUNK_SIZE
+	bottom = chunk[1] * CHUNK_SIZE
+	return max(left - x, x - (left + CHUNK_SIZE), bottom - y, y - (bottom + CHUNK_SIZE), 0)
+
+# ------------------------------------------------------------------------------
+class StreamedRecord(object):
+	"A house or guard from the level file, and its entity while its chunk is loaded."
+	__slots__ = ('key', 'index', 'record_type', 'params', 'is_house', 'chunk', 'entity', 'state')
+
+	def __init__(self, key, index, record_type, params, x, y, is_house):
+		self.key = key			# see levels._recordKey
+		self.index = index		# position in the level file
+		self.record_type = record_type
+		self.params = params	# for the constructor
+		self.is_house = is_house
+		self.chunk = chunkOf(x, y)
+		self.entity = None
+		self.state = None		# what happened to the entity, saved when it was released or died
+
+# ------------------------------------------------------------------------------
+class ChunkStreamer(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, construct):
+		"construct is called with (record type, params, **keyword args) to create each entity."
+		self.construct = construct
+		self.records = []
+		self.unloaded_chests = 0	# chests on houses that aren't loaded, and haven't been looted
+		self.num_loaded = 0			# loads and releases by the last update, for the profiler
+		self.num_released = 0
+		self._chunks = {}			# chunk -> its records, in file order
+		self._loaded = set()		# records with entities
+		self._centre_chunk = None
+
+	# ------------------------------------------------------------------------------
+	def setRecords(self, records):
+		"""Sets the StreamedRecords of the level.  Records may be kept from before (with their entities), e.g. when
+		the level file changes; the next update should be forced."""
+		self.records = records
+		self._chunks = {}
+		for record in records:
+			self._chunks.setdefault(record.chunk, []).append(record)
+		self._loaded = set(record for record in records if record.entity is not None)
+		self.unloaded_chests = sum(1 for record in records if record.entity is None and self._hasChest(record))
+		self._centre_chunk = None
+
+	# ------------------------------------------------------------------------------
+	def isAllLoaded(self):
+		return all(record.entity is not None or self._isDead(record) for record in self.records)
+
+	# ------------------------------------------------------------------------------
+	def update(self, x, y, force=False):
+		"""Loads and releases chunks for the player at (x, y).  Only does anything when the player has moved into
+		another chunk (or if forced).  Returns True if any houses were loaded or released."""
+		centre_chunk = chunkOf(x, y)
+		if centre_chunk == self._centre_chunk and not force:
+			return False
+		self._centre_chunk = centre_chunk
+		self.num_loaded = 0
+		self.num_released = 0
+
+		# Forget guards that have died since the last look
+		self._release([record for record in self._loaded if not record.entity.alive])
+
+		wanted = []
+		in_reach = set()
+		for chunk_x in xrange(centre_chunk[0] - _CHUNK_REACH, centre_chunk[0] + _CHUNK_REACH + 1):
+			for chunk_y in xrange(centre_chunk[1] - _CHUNK_REACH, centre_chunk[1] + _CHUNK_REACH + 1):
+				records = self._chunks.get((chunk_x, chunk_y))
+				if not records:
+					continue
+				distance = _chunkDistance((chunk_x, chunk_y), x, y)
+				if distance <= STREAM_OUT_DISTANCE:
+					in_reach.update(records)
+				if distance <= STREAM_IN_DISTANCE:
+					wanted.extend(record for record in records if record.entity is None and not self._isDead(record))
+
+		# Guards chasing the player out of their chunk stay until they're out of reach too
+		releasing = [record for record in self._loaded if record not in in_reach and
+					 max(abs(record.entity.x - x), abs(record.entity.y - y)) > STREAM_OUT_DISTANCE]
+		self._release(releasing)
+		self.num_released = len(releasing)
+		houses_changed = any(record.is_house for record in releasing)
+
+		wanted.sort(key=lambda record: record.index)		# same order as the file, so random numbers are too
+		for record in wanted:
+			self._load(record)
+			houses_changed |= record.is_house
+			self.num_loaded += 1
+		return houses_changed
+
+	# ------------------------------------------------------------------------------
+	def _load(self, record):
+		state = record.state
+		if state is None:
+			record.entity = self.construct(record.record_type, record.params)
+		elif record.is_house:
+			house = self.construct(record.record_type, record.params, colour=state['colour'])
+			house.loot_amount = state['loot_amount']
+			if state['looted']:
+				entities.removeNow([house.chest])
+				house.chest = None
+			record.entity = house
+		else:
+			record.entity = self.construct(record.record_type, record.params)
+			record.entity.loot_amount = state['loot_amount']
+		self._loaded.add(record)
+		if self._hasChest(record):
+			self.unloaded_chests -= 1
+
+	# ------------------------------------------------------------------------------
+	def _release(self, records):
+		"Saves what's happened to the records' entities, and removes them (unless they're already gone)."
+		if not records:
+			return
+		records.sort(key=lambda record: record.index)
+		for record in records:
+			entity = record.entity
+			if record.is_house:
+				record.state = {'colour': entity.colour, 'loot_amount': entity.loot_amount,
+								'looted': entity.chest is None}
+			else:
+				record.state = {'loot_amount': entity.loot_amount, 'dead': not entity.alive or entity.dying}
+		entities.removeNow([record.entity for record in records])
+		for record in records:
+			record.entity = None
+			self._loaded.discard(record)
+			if self._hasChest(record):
+				self.unloaded_chests += 1
+
+	# ------------------------------------------------------------------------------
+	def _isDead(self, record):
+		return record.state is not None and record.state.get('dead', False)
+
+	# ------------------------------------------------------------------------------
+	def _hasChest(self, record):
+		"True for houses whose chest hasn't been looted (as of when they were last released)."
+		if not record.is_house:
+			return False
+		if record.entity is not None:
+			return record.entity.chest is not None
+		return record.state is None or not record.state['looted']
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,95 @@
+# ------------------------------------------------------------------------------
+# AI scheduler: guards think as often as their distance from the player says,
+# the budget spreads the distant ones out, and nobody waits too long
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import aischeduler
+import unittest
+
+# ------------------------------------------------------------------------------
+class StandInGuard(object):
+	"Stands in for a guard, with a fixed think interval."
+	def __init__(self, order, interval):
+		self.order = order
+		self.interval = interval
+		self.ai_thinking = None
+		self.thinks = []
+
+	def thinkInterval(self, player):
+		return self.interval
+
+# ------------------------------------------------------------------------------
+def runTicks(scheduler, guards, ticks):
+	for tick in xrange(ticks):
+		scheduler.plan(guards, None)
+		for guard in guards:
+			if guard.ai_thinking:
+				guard.thinks.append(tick)
+
+# ------------------------------------------------------------------------------
+class AISchedulerTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def testIntervalForDistance(self):
+		self.assertEqual(aischeduler.intervalForDistance(0), 1)
+		self.assertEqual(aischeduler.intervalForDistance(299 ** 2), 1)
+		self.assertEqual(aischeduler.intervalForDistance(300 ** 2), 2)
+		self.assertEqual(aischeduler.intervalForDistance(10000 ** 2), 4)
+
+	# ------------------------------------------------------------------------------
+	def testIntervalsWithinBudget(self):
+		guards = [StandInGuard(order, (1, 2, 4)[order % 3]) for order in xrange(9)]
+		runTicks(aischeduler.AIScheduler(budget=100), guards, 40)
+		for guard in guards:
+			gaps = set(later - earlier for earlier, later in zip(guard.thinks, guard.thinks[1:]))
+			self.assertEqual(gaps, set([guard.interval]))
+
+	# ------------------------------------------------------------------------------
+	def testStaggered(self):
+		# New guards start at different points in their interval, so the same number think each tick
+		guards = [StandInGuard(order, 4) for order in xrange(8)]
+		scheduler = aischeduler.AIScheduler(budget=100)
+		for tick in xrange(12):
+			scheduler.plan(guards, None)
+			self.assertEqual(scheduler.num_thinks, 2)
+
+	# ------------------------------------------------------------------------------
+	def testBudget(self):
+		guards = [StandInGuard(order, 2) for order in xrange(12)]
+		scheduler = aischeduler.AIScheduler(budget=4)
+		runTicks(scheduler, guards, 60)
+		# Never held back past twice the interval, and they all get the same share
+		for guard in guards:
+			self.assertTrue(guard.thinks[0] < 4)
+			for earlier, later in zip(guard.thinks, guard.thinks[1:]):
+				self.assertTrue(later - earlier <= 2 * aischeduler.AI_MAX_DELAY_FACTOR)
+		counts = [len(guard.thinks) for guard in guards]
+		self.assertTrue(max(counts) - min(counts) <= 1, counts)
+
+	# ------------------------------------------------------------------------------
+	def testEveryTickIgnoresBudget(self):
+		guards = [StandInGuard(order, 1) for order in xrange(6)] + [StandInGuard(6, 4)]
+		scheduler = aischeduler.AIScheduler(budget=0)
+		runTicks(scheduler, guards, 20)
+		for guard in guards[:6]:
+			self.assertEqual(guard.thinks, range(20))
+		# Over budget, so it waits twice its interval (having started partway through it)
+		self.assertEqual(guards[6].thinks, [5, 13])
+		self.assertEqual(scheduler.num_deferred, 1)
+
+	# ------------------------------------------------------------------------------
+	def testForgetsRemovedGuards(self):
+		guards = [StandInGuard(order, 2) for order in xrange(3)]
+		scheduler = aischeduler.AIScheduler()
+		scheduler.plan(guards, None)
+		scheduler.plan(guards[1:], None)
+		self.assertEqual(set(scheduler._waiting), set(guards[1:]))
+		scheduler.clear()
+		self.assertEqual(scheduler._waiting, {})
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,31 @@
+# ------------------------------------------------------------------------------
+# Allocations: no tick of the entity update may keep hold of new memory in a
+# steady scene
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import benchmark
+import entities
+import unittest
+
+# ------------------------------------------------------------------------------
+class SteadyTickTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		headless.init()
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		entities.clearAll()
+
+	# ------------------------------------------------------------------------------
+	def testNothingKept(self):
+		# Traced with tracemalloc where there is one, or else by counting live objects after each tick
+		self.assertEqual(benchmark.benchmarkAllocations(ticks=100), 0)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
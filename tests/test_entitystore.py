@@ -0,0 +1,78 @@
+# ------------------------------------------------------------------------------
+# Entity store: the vectorised move (with numpy) must give exactly the same
+# results as the scalar one
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import entitystore
+import misc
+import random
+import unittest
+
+# ------------------------------------------------------------------------------
+class Owner(object):
+	"Stands in for an entity; the store only needs somewhere to put its slot when it's released."
+	pass
+
+# ------------------------------------------------------------------------------
+def fillStore(store, seed, count):
+	rand = random.Random(seed)
+	owners = []
+	for index in xrange(count):
+		owner = Owner()
+		slot = store.allocate(owner)
+		owner.store = store
+		owner.slot = slot
+		owners.append(owner)
+		store.x[slot] = rand.uniform(-50, 850)
+		store.y[slot] = rand.uniform(-50, 650)
+		store.vx[slot] = rand.choice((0, 0, rand.uniform(-300, 300)))
+		store.vy[slot] = rand.choice((0, 0, rand.uniform(-300, 300)))
+		store.radius[slot] = rand.uniform(4, 20)
+		store.half_width[slot] = rand.choice((8, 16, 32))
+		store.half_height[slot] = rand.choice((8, 16, 32))
+		store.sprite_left[slot] = rand.uniform(0, 4)
+		store.sprite_top[slot] = rand.uniform(0, 4)
+		store.sprite_right[slot] = store.half_width[slot] * 2 - rand.uniform(0, 4)
+		store.sprite_bottom[slot] = store.half_height[slot] * 2 - rand.uniform(0, 4)
+		store.active[slot] = rand.random() < 0.9
+		store.alive[slot] = 1
+		store.dying[slot] = rand.random() < 0.1
+		store.die_off_screen[slot] = rand.random() < 0.3
+		store.force_on_screen[slot] = rand.random() < 0.3
+		store.updateBounds(slot)
+	
+	# Leave some holes, as entities being removed do
+	for owner in owners[::7]:
+		store.release(owner.slot)
+	return store
+
+# ------------------------------------------------------------------------------
+@unittest.skipUnless(misc.g_have_numpy, 'needs numpy')
+class VectorisedMoveTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def testSameAsScalar(self):
+		vectorised = fillStore(entitystore.EntityStore(), 5, 200)
+		scalar = fillStore(entitystore.EntityStore(), 5, 200)
+		scalar.views = None		# the scalar loop is what's used without numpy
+		self.assertIsNotNone(vectorised.views)
+		
+		for tick in xrange(40):
+			self.assertEqual(vectorised.move(0.02, 0, 100, 800, 600), scalar.move(0.02, 0, 100, 800, 600))
+			for name in entitystore.FIELDS:
+				self.assertEqual(getattr(vectorised, name)[:vectorised.size], getattr(scalar, name)[:scalar.size],
+								 '{0} differs after tick {1}'.format(name, tick))
+
+	# ------------------------------------------------------------------------------
+	def testNothingActive(self):
+		store = fillStore(entitystore.EntityStore(), 6, 20)
+		for slot in xrange(store.size):
+			store.active[slot] = 0
+		self.assertEqual(store.move(0.02, 0, 100, 800, 600), [])
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,71 @@
+# ------------------------------------------------------------------------------
+# Events: pending chat lines come out in time order, and cancelling an entity's
+# lines skips them without leaving anything behind
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import events
+import unittest
+
+# ------------------------------------------------------------------------------
+class Speaker(object):
+	"Stands in for an entity; the events only need something to attach the lines to."
+	def __init__(self, name):
+		self.name = name
+
+# ------------------------------------------------------------------------------
+class PendingChatTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		headless.init()
+		del events.g_pending_chat_events[:]
+		events._g_entity_generations.clear()
+		self.spoken = []
+		self.old_trigger_line = events.triggerLine
+		events.triggerLine = lambda line, entity: self.spoken.append((line, entity.name))
+		self.bob = Speaker('Bob')
+		self.rover = Speaker('Rover')
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		events.triggerLine = self.old_trigger_line
+		del events.g_pending_chat_events[:]
+		events._g_entity_generations.clear()
+
+	# ------------------------------------------------------------------------------
+	def testTimeOrder(self):
+		events._scheduleLine(0.5, 'third', self.bob)
+		events._scheduleLine(0.1, 'first', self.rover)
+		events._scheduleLine(0.3, 'second', self.bob)
+		events.update(0.2)
+		self.assertEqual(self.spoken, [('first', 'Rover')])
+		events.update(0.5)
+		self.assertEqual(self.spoken, [('first', 'Rover'), ('second', 'Bob'), ('third', 'Bob')])
+		self.assertEqual(events._g_entity_generations, {})
+
+	# ------------------------------------------------------------------------------
+	def testSameTimeKeepsOrder(self):
+		for line in ('a', 'b', 'c', 'd'):
+			events._scheduleLine(0.1, line, self.bob if line in 'ac' else self.rover)
+		events.update(0.2)
+		self.assertEqual([line for line, name in self.spoken], ['a', 'b', 'c', 'd'])
+
+	# ------------------------------------------------------------------------------
+	def testCancel(self):
+		events._scheduleLine(0.1, 'cancelled', self.bob)
+		events._scheduleLine(0.2, 'kept', self.rover)
+		events.removeAllEventsForEntity(self.bob)
+		events.removeAllEventsForEntity(Speaker('Nobody'))		# nothing pending: nothing to do
+		# Lines added after cancelling still play
+		events._scheduleLine(0.3, 'later', self.bob)
+		events.update(0.5)
+		self.assertEqual(self.spoken, [('kept', 'Rover'), ('later', 'Bob')])
+		self.assertEqual(events.g_pending_chat_events, [])
+		self.assertEqual(events._g_entity_generations, {})
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,128 @@
+# ------------------------------------------------------------------------------
+# Hot reload: edits to a level's file are noticed, and applied to the running
+# level by replacing only the houses and guards whose lines changed
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import entities
+import hotreload
+import levels
+import os
+import shutil
+import tempfile
+import unittest
+
+LEVEL_TEXT = ('player 28 75 12\n'
+			  'house 145 472 96 80 1.5\n'
+			  'house 381 484 128 120\n'
+			  'guard Steve 295 373 470 370 462 558 -1\n'
+			  'dog Rover 269 264\n')
+
+# ------------------------------------------------------------------------------
+def entitiesOfType(entity_class):
+	return [entity for entity in entities.Entity._entities + entities.Entity._new_entities
+			if isinstance(entity, entity_class) and entity.alive]
+
+# ------------------------------------------------------------------------------
+class FileWatcherTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.file_name = os.path.join(self.directory, 'watched.txt')
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	# ------------------------------------------------------------------------------
+	def write(self, text):
+		with open(self.file_name, 'wb') as out_file:
+			out_file.write(text)
+
+	# ------------------------------------------------------------------------------
+	def testChanges(self):
+		self.write('one')
+		watcher = hotreload.FileWatcher()
+		watcher.watch(self.file_name)
+		watcher.watch(self.file_name)		# twice doesn't forget the stamp
+		self.assertEqual(watcher.changed(), [])
+		self.write('three')
+		self.assertEqual(watcher.changed(), [self.file_name])
+		self.assertEqual(watcher.changed(), [])
+
+		# Missing for a while (e.g. an editor saving by renaming) only counts once it's back
+		os.remove(self.file_name)
+		self.assertEqual(watcher.changed(), [])
+		self.write('three')
+		self.assertEqual(watcher.changed(), [self.file_name])
+
+# ------------------------------------------------------------------------------
+class ApplyChangesTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		headless.init()
+		self.level_dir = tempfile.mkdtemp()
+		self.old_level_dir = levels.LEVEL_DIR
+		levels.LEVEL_DIR = self.level_dir
+		levels._g_records.clear()
+		self.writeLevel(LEVEL_TEXT)
+		levels.load('edited')
+		entities.updateAll(0)		# move everything into the update list
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		entities.clearAll()
+		levels.LEVEL_DIR = self.old_level_dir
+		levels._g_records.clear()
+		shutil.rmtree(self.level_dir)
+
+	# ------------------------------------------------------------------------------
+	def writeLevel(self, text):
+		with open(levels.sourceFileName('edited'), 'wb') as out_file:
+			out_file.write(text)
+
+	# ------------------------------------------------------------------------------
+	def testUnchanged(self):
+		before = list(entities.Entity._entities)
+		self.assertEqual(levels.applyChanges(), (0, 0))
+		entities.updateAll(0)
+		self.assertEqual(entities.Entity._entities, before)
+
+	# ------------------------------------------------------------------------------
+	def testOnlyEditedRecordsReplaced(self):
+		house1, house2 = entitiesOfType(entities.HouseEntity)
+		guard, dog = entitiesOfType(entities.GuardEntity)
+		guard.moveTo(300, 380)		# mid-patrol; it should stay where it's got to
+		player = entities.PlayerEntity.instance
+
+		# Move the second house by a fraction, and add another guard
+		self.writeLevel(LEVEL_TEXT.replace('house 381 484', 'house 381.25 484') + 'guard Jeff 600 300\n')
+		self.assertEqual(levels.applyChanges(), (1, 2))
+		entities.updateAll(0)
+
+		houses = entitiesOfType(entities.HouseEntity)
+		self.assertIs(houses[0], house1)
+		self.assertIsNot(houses[1], house2)
+		self.assertFalse(house2.alive or house2.chest.alive)		# its chest went with it
+		self.assertEqual(houses[1].x, house2.x + 0.25)
+		guards = entitiesOfType(entities.GuardEntity)
+		self.assertEqual(guards[:2], [guard, dog])
+		self.assertEqual((guard.x, guard.y), (300, 380))
+		self.assertEqual(guards[2].name, 'Jeff the Guard')
+		self.assertIs(entities.PlayerEntity.instance, player)
+
+	# ------------------------------------------------------------------------------
+	def testPlayerMoved(self):
+		player = entities.PlayerEntity.instance
+		self.writeLevel(LEVEL_TEXT.replace('player 28 75 12', 'player 40 90 12'))
+		self.assertEqual(levels.applyChanges(), (0, 0))
+		self.assertIs(entities.PlayerEntity.instance, player)
+		self.assertEqual((player.x, player.y), (40, 90))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,96 @@
+# ------------------------------------------------------------------------------
+# Baked levels: loading the baked copy must give exactly what parsing the text
+# does
+#
+# Run from the game's folder with "python -m unittest discover tests"
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import glob
+import levels
+import os
+import shutil
+import tempfile
+import unittest
+
+# ------------------------------------------------------------------------------
+def comparable(records):
+	"Returns the records with each param's type, and the patrol routes as plain tuples, so they can be compared."
+	result = []
+	for record_type, params in records:
+		params = list(params)
+		if record_type in (levels.GUARD_RECORD, levels.DOG_RECORD):
+			route = params[3]
+			params[3] = ([tuple(point) for point in route.points], route.is_loop, route.dir_x, route.dir_y)
+		result.append((record_type, [(type(param), param) for param in params]))
+	return result
+
+# ------------------------------------------------------------------------------
+class BakedLevelTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.level_dir = tempfile.mkdtemp()
+		self.old_level_dir = levels.LEVEL_DIR
+		levels.LEVEL_DIR = self.level_dir
+		levels._g_records.clear()
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		levels.LEVEL_DIR = self.old_level_dir
+		levels._g_records.clear()
+		shutil.rmtree(self.level_dir)
+
+	# ------------------------------------------------------------------------------
+	def writeLevel(self, level_name, text):
+		with open(levels.sourceFileName(level_name), 'wb') as out_file:
+			out_file.write(text)
+		return text
+
+	# ------------------------------------------------------------------------------
+	def loadBaked(self, level_name):
+		"Loads the level's records the way a later run would: from the baked file, with nothing in memory."
+		self.assertTrue(os.path.exists(os.path.join(self.level_dir, '{0}.lvb'.format(level_name))))
+		levels._g_records.clear()
+		return levels._levelRecords(level_name)[1]
+
+	# ------------------------------------------------------------------------------
+	def assertBakedMatches(self, level_name, text):
+		parsed = levels.parse(text)
+		self.assertEqual(comparable(levels._levelRecords(level_name)[1]), comparable(parsed))
+		self.assertEqual(comparable(self.loadBaked(level_name)), comparable(parsed))
+
+	# ------------------------------------------------------------------------------
+	def testGameLevels(self):
+		for source_name in sorted(glob.glob(os.path.join(self.old_level_dir, '*.txt'))):
+			level_name = os.path.splitext(os.path.basename(source_name))[0]
+			with open(source_name, 'rb') as src:
+				text = self.writeLevel(level_name, src.read())
+			self.assertBakedMatches(level_name, text)
+
+	# ------------------------------------------------------------------------------
+	def testParamTypes(self):
+		# 1.2 isn't exact as a float32, and the guard has a float position and a name with no patrol
+		text = self.writeLevel('types', 'world 2000 1500\n'
+										'player 28.5 75 12\n'
+										'house 145 472 96 80 1.2\n'
+										'house 381 484 128 120 0.1\n'
+										'house 646 464\n'
+										'guard Steve 295.25 373 470 370 462 558 -1\n'
+										'dog Rover 269 264\n')
+		self.assertBakedMatches('types', text)
+		difficulties = [params[4] for record_type, params in self.loadBaked('types')
+						if record_type == levels.HOUSE_RECORD and len(params) > 4]
+		self.assertEqual(difficulties, [1.2, 0.1])
+
+	# ------------------------------------------------------------------------------
+	def testUnbakeableParams(self):
+		# Too big for the baked file: the level still loads, from the text
+		text = self.writeLevel('big', 'player 28 75 12\nhouse 145 472 96 {0} 1.5\n'.format(10 ** 20))
+		self.assertEqual(comparable(levels._levelRecords('big')[1]), comparable(levels.parse(text)))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,103 @@
+# ------------------------------------------------------------------------------
+# Mixer: the voice limits, priorities and cooldowns decide which sounds play
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import mixer
+import unittest
+
+# ------------------------------------------------------------------------------
+class StandInSource(object):
+	def __init__(self, duration):
+		self.duration = duration
+
+# ------------------------------------------------------------------------------
+class StandInPlayer(object):
+	"Records what the mixer asks of the player, without needing sound."
+	def __init__(self):
+		self.source = None
+		self.sources = []
+
+	def queue(self, source):
+		self.sources.append(source)
+		if self.source is None:
+			self.source = source
+
+	def play(self):
+		pass
+
+	def next(self):
+		self.source = None
+
+# ------------------------------------------------------------------------------
+class MixerTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.mixer = mixer.Mixer(max_voices=3, max_voices_per_event=2)
+		for voice in self.mixer.voices:
+			voice.player = StandInPlayer()
+		self.source = StandInSource(1)
+
+	# ------------------------------------------------------------------------------
+	def playing(self):
+		"Returns the sorted (event, priority) of the voices still playing."
+		return sorted((voice.event, voice.priority) for voice in self.mixer.voices
+					  if voice.event is not None and voice.end_time > self.mixer.time)
+
+	# ------------------------------------------------------------------------------
+	def testCooldown(self):
+		self.assertTrue(self.mixer.play(self.source, 'step'))
+		self.mixer.update(0.02)
+		self.assertFalse(self.mixer.play(self.source, 'step'))
+		self.assertTrue(self.mixer.play(self.source, 'hit'))		# the cooldown is per event
+		self.mixer.update(0.04)
+		self.assertTrue(self.mixer.play(self.source, 'step'))
+		self.assertEqual(self.mixer.num_deduplicated, 1)
+
+	# ------------------------------------------------------------------------------
+	def testEventLimit(self):
+		for index in xrange(3):
+			self.assertTrue(self.mixer.play(self.source, 'step'))
+			self.mixer.update(0.1)
+		# The third replaced the oldest, leaving a voice free for something else
+		self.assertEqual(self.mixer.activeVoices(), 2)
+		self.assertEqual([voice.start_time for voice in self.mixer.voices if voice.event == 'step'], [0.2, 0.1])
+		self.assertEqual(self.mixer.num_stolen, 1)
+
+	# ------------------------------------------------------------------------------
+	def testPriorities(self):
+		self.mixer.play(self.source, 'a', priority=1)
+		self.mixer.play(self.source, 'b', priority=0)
+		self.mixer.play(self.source, 'c', priority=2)
+		# Less important than everything playing: dropped
+		self.assertFalse(self.mixer.play(self.source, 'd', priority=-1))
+		# As important as the least important: steals its voice
+		self.assertTrue(self.mixer.play(self.source, 'e', priority=0))
+		self.assertEqual(self.playing(), [('a', 1), ('c', 2), ('e', 0)])
+		self.assertEqual((self.mixer.num_dropped, self.mixer.num_stolen), (1, 1))
+
+	# ------------------------------------------------------------------------------
+	def testFinishedVoicesAreReused(self):
+		for event in 'abc':
+			self.mixer.play(StandInSource(0.5), event, priority=5)
+		self.mixer.update(0.6)
+		self.assertEqual(self.mixer.activeVoices(), 0)
+		self.assertTrue(self.mixer.play(self.source, 'd'))
+		self.assertEqual(self.mixer.num_stolen, 0)
+		player = self.mixer.voices[0].player
+		self.assertIs(player.source, self.source)		# the finished sound was dropped first
+
+	# ------------------------------------------------------------------------------
+	def testUnknownDuration(self):
+		self.mixer.play(StandInSource(None), 'a')
+		self.mixer.update(mixer.DEFAULT_SOUND_DURATION_SEC - 0.1)
+		self.assertEqual(self.mixer.activeVoices(), 1)
+		self.mixer.update(0.2)
+		self.assertEqual(self.mixer.activeVoices(), 0)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
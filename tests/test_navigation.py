@@ -0,0 +1,154 @@
+# ------------------------------------------------------------------------------
+# Navigation: paths around the houses must only cross walkable cells, and be as
+# short as the grid allows
+# ------------------------------------------------------------------------------
+
+import navigation
+import unittest
+
+# A wall across the middle, with a gap at the top, and a box closed on all sides
+WALL = (200, 0, 232, 400)
+BOX = [(500, 100, 600, 116), (500, 184, 600, 200), (500, 100, 516, 200), (584, 100, 600, 200)]
+CLEARANCE = 8
+
+# ------------------------------------------------------------------------------
+def sign(value):
+	return (value > 0) - (value < 0)
+
+# ------------------------------------------------------------------------------
+def pathCells(nav_grid, start, corners):
+	"Returns every cell along the path, and its cost, by stepping from corner to corner."
+	cells = [start]
+	cost = 0
+	col, row = start
+	for corner_col, corner_row in corners:
+		step_col = sign(corner_col - col)
+		step_row = sign(corner_row - row)
+		while (col, row) != (corner_col, corner_row):
+			# Between corners the path keeps one direction, so it must arrive at the corner exactly
+			assert step_col == sign(corner_col - col) and step_row == sign(corner_row - row)
+			col += step_col
+			row += step_row
+			cells.append((col, row))
+			cost += navigation.SQRT_2 if step_col and step_row else 1
+	return cells, cost
+
+# ------------------------------------------------------------------------------
+class NavGridTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.grid = navigation.NavGrid(800, 600, [WALL] + BOX, CLEARANCE)
+
+	# ------------------------------------------------------------------------------
+	def findPathCells(self, start_x, start_y, goal_x, goal_y):
+		start = self.grid.cellOf(start_x, start_y)
+		points = self.grid.findPath(start_x, start_y, goal_x, goal_y)
+		if points is None:
+			return None, None
+		corners = [self.grid.cellOf(x, y) for x, y in points]
+		return pathCells(self.grid, start, corners)
+
+	# ------------------------------------------------------------------------------
+	def testBlockedCells(self):
+		left, top, right, bottom = WALL
+		for row in xrange(self.grid.rows):
+			for col in xrange(self.grid.columns):
+				x, y = self.grid.cellCentre(col, row)
+				near_wall = left - CLEARANCE < x < right + CLEARANCE and top - CLEARANCE < y < bottom + CLEARANCE
+				if near_wall:
+					self.assertFalse(self.grid.isWalkable(col, row))
+				elif not 500 - CLEARANCE < x < 600 + CLEARANCE or not 100 - CLEARANCE < y < 200 + CLEARANCE:
+					self.assertTrue(self.grid.isWalkable(col, row), (col, row))
+
+	# ------------------------------------------------------------------------------
+	def testPathAroundWall(self):
+		cells, cost = self.findPathCells(100, 100, 350, 100)
+		self.assertIsNotNone(cells)
+		for col, row in cells:
+			self.assertTrue(self.grid.isWalkable(col, row), (col, row))
+		self.assertEqual(cells[-1], self.grid.cellOf(350, 100))
+		# It has to go over the top of the wall, so it's much longer than the straight line
+		self.assertTrue(max(self.grid.cellCentre(*cell)[1] for cell in cells) > WALL[3])
+		self.assertTrue(cost * navigation.NAV_CELL_SIZE > 2 * (350 - 100))
+
+	# ------------------------------------------------------------------------------
+	def testStraightPath(self):
+		# Nothing in the way: one straight run
+		points = self.grid.findPath(40, 500, 400, 500)
+		self.assertEqual(len(points), 1)
+		self.assertEqual(self.grid.cellOf(*points[0]), self.grid.cellOf(400, 500))
+		self.assertEqual(self.grid.findPath(40, 500, 41, 501), [])
+
+	# ------------------------------------------------------------------------------
+	def testNoPath(self):
+		self.assertIsNone(self.grid.findPath(100, 100, 550, 150))
+		self.assertIsNone(self.grid.findPath(550, 150, 100, 100))
+
+	# ------------------------------------------------------------------------------
+	def testCachedPath(self):
+		first = self.grid.findPath(100, 100, 350, 100)
+		self.assertEqual(len(self.grid._path_cache), 1)
+		self.assertEqual(self.grid.findPath(102, 101, 351, 99), first)		# same cells
+		self.assertEqual(len(self.grid._path_cache), 1)
+
+# ------------------------------------------------------------------------------
+class FlowFieldTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.grid = navigation.NavGrid(800, 600, [WALL] + BOX, CLEARANCE)
+		self.target = (350, 100)
+		self.field = navigation.FlowField(self.grid, *self.target)
+
+	# ------------------------------------------------------------------------------
+	def distance(self, col, row):
+		return self.field.distances[row * self.grid.columns + col]
+
+	# ------------------------------------------------------------------------------
+	def testFollowingReachesTarget(self):
+		target_cell = self.grid.cellOf(*self.target)
+		for row in xrange(0, self.grid.rows, 3):
+			for col in xrange(0, self.grid.columns, 3):
+				if self.distance(col, row) is None:
+					continue
+				x, y = self.grid.cellCentre(col, row)
+				for step in xrange(self.grid.columns * self.grid.rows):
+					next_point = self.field.nextPoint(x, y)
+					if next_point is None:
+						break
+					# Every step gets closer
+					self.assertTrue(self.distance(*self.grid.cellOf(*next_point)) < self.distance(*self.grid.cellOf(x, y)))
+					x, y = next_point
+				self.assertEqual(self.grid.cellOf(x, y), target_cell)
+
+	# ------------------------------------------------------------------------------
+	def testDistancesMatchPaths(self):
+		# A* and the field both find shortest paths over the same moves, so their lengths agree
+		for start in ((100, 100), (40, 560), (700, 300), (232 + 24, 24)):
+			start_cell = self.grid.cellOf(*start)
+			points = self.grid.findPath(self.target[0], self.target[1], start[0], start[1])
+			corners = [self.grid.cellOf(x, y) for x, y in points]
+			cells, cost = pathCells(self.grid, self.grid.cellOf(*self.target), corners)
+			self.assertAlmostEqual(self.distance(*start_cell), cost)
+
+	# ------------------------------------------------------------------------------
+	def testUnreachable(self):
+		inside_box = self.grid.cellOf(550, 150)
+		self.assertIsNone(self.distance(*inside_box))
+		self.assertIsNone(self.field.nextPoint(550, 150))
+		self.assertIsNone(self.field.nextPoint(*self.target))		# already there
+
+	# ------------------------------------------------------------------------------
+	def testMaxDistance(self):
+		field = navigation.FlowField(self.grid, 100, 500, max_distance=160)
+		for index, distance in enumerate(field.distances):
+			if distance is not None:
+				self.assertTrue(distance * navigation.NAV_CELL_SIZE <= 160)
+		self.assertIsNotNone(field.nextPoint(200, 500))
+		self.assertIsNone(field.nextPoint(400, 500))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
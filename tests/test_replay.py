@@ -0,0 +1,100 @@
+# ------------------------------------------------------------------------------
+# Replay: a recorded session must play back to exactly the same game
+#
+# Recording and playback each run in a process of their own, as they would for
+# real.  Run as a script, this records or plays a short scripted session and
+# prints a digest of every entity's position on every tick.
+# ------------------------------------------------------------------------------
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+GAME_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TICK_SEC = 0.02
+TICKS = 1500
+
+# Tick -> keys pressed (True) or released (False) at the start of it: through the intro, then about the level
+SCRIPT = {
+	5: [(True, 'ENTER')], 6: [(False, 'ENTER')], 10: [(True, 'ENTER')], 11: [(False, 'ENTER')],
+	20: [(True, 'RIGHT')], 80: [(True, 'UP')], 140: [(True, 'LCTRL')], 145: [(False, 'LCTRL')],
+	600: [(False, 'UP'), (True, 'DOWN')], 900: [(False, 'RIGHT'), (True, 'SPACE')], 1100: [(False, 'DOWN')],
+}
+
+# ------------------------------------------------------------------------------
+def runSession(mode, file_name):
+	"Records the script to the file, or plays the file back.  Returns the digest of the session."
+	import headless		# must be imported before the game modules
+	import entities
+	import game
+	import hashlib
+	import levels
+	import misc
+	import replay
+	import stats
+	from pyglet.window import key
+	
+	headless.init()
+	if mode == 'record':
+		replay.startRecording(TICK_SEC, levels.g_first_level)
+		stats.setUpFirstScreen()
+	else:
+		player = replay.startReplay(file_name)
+		levels.g_first_level = player.first_level
+		stats.setUpFirstScreen(sound_warning=not player.sound)
+	
+	digest = hashlib.md5()
+	for tick in xrange(TICKS):
+		if mode == 'record':
+			for pressed, name in SCRIPT.get(tick, []):
+				(misc.handleKeyPress if pressed else misc.handleKeyRelease)(getattr(key, name), 0)
+		elif player.finished():
+			break
+		if not game.tick(TICK_SEC):
+			break
+		for entity in entities.Entity._entities:
+			digest.update('{0!r} {1!r} {2};'.format(entity.x, entity.y, entity.alive))
+		digest.update('{0!r} {1!r}|'.format(stats.loot, stats.health_fraction))
+	
+	if mode == 'record':
+		replay.stopRecording(file_name)
+	return digest.hexdigest()
+
+# ------------------------------------------------------------------------------
+class ReplayTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		handle, self.file_name = tempfile.mkstemp(suffix='.json')
+		os.close(handle)
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		os.remove(self.file_name)
+
+	# ------------------------------------------------------------------------------
+	def runSessionProcess(self, mode):
+		output = subprocess.check_output([sys.executable, os.path.abspath(__file__), mode, self.file_name],
+										 cwd=GAME_DIR, stderr=subprocess.STDOUT)
+		lines = output.splitlines()
+		self.assertTrue(lines and lines[-1].startswith('digest '), output)
+		return lines[-1].split()[1]
+
+	# ------------------------------------------------------------------------------
+	def testRoundTrip(self):
+		recorded = self.runSessionProcess('record')
+		self.assertEqual(self.runSessionProcess('play'), recorded)
+		# ... and again, to be sure playback doesn't depend on anything left over from recording
+		self.assertEqual(self.runSessionProcess('play'), recorded)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	if len(sys.argv) == 3 and sys.argv[1] in ('record', 'play'):
+		sys.path.insert(0, GAME_DIR)
+		digest = runSession(sys.argv[1], sys.argv[2])
+		print 'digest', digest
+	else:
+		unittest.main()
@@ -0,0 +1,71 @@
+# ------------------------------------------------------------------------------
+# Line of sight: the batched check (with numpy) must agree with the one line at
+# a time check it replaces
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import benchmark
+import entities
+import misc
+import random
+import unittest
+
+# ------------------------------------------------------------------------------
+@unittest.skipUnless(misc.g_have_numpy, 'needs numpy')
+class BatchedSightTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		headless.init()
+		self.random = random.Random(17)
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		entities.clearAll()
+
+	# ------------------------------------------------------------------------------
+	def assertSameAsScalar(self, x1, y1, points, rects):
+		blocked = misc.linesIntersectAny(x1, y1, [x for x, y in points], [y for x, y in points], misc.rectEdges(rects))
+		for (x2, y2), line_blocked in zip(points, blocked):
+			expected = any(misc.lineIntersectsRect(x1, y1, x2, y2, rect) for rect in rects)
+			self.assertEqual(bool(line_blocked), expected, 'from {0} to {1}'.format((x1, y1), (x2, y2)))
+
+	# ------------------------------------------------------------------------------
+	def testRandomLines(self):
+		for attempt in xrange(50):
+			rects = []
+			for index in xrange(self.random.randint(1, 10)):
+				left = self.random.uniform(0, 700)
+				top = self.random.uniform(0, 500)
+				rects.append((left, top, left + self.random.uniform(10, 100), top + self.random.uniform(10, 100)))
+			points = [(self.random.uniform(0, 800), self.random.uniform(0, 600)) for index in xrange(40)]
+			self.assertSameAsScalar(self.random.uniform(0, 800), self.random.uniform(0, 600), points, rects)
+
+	# ------------------------------------------------------------------------------
+	def testGridLines(self):
+		# Whole numbers on a coarse grid, so lots of lines touch corners or run along edges
+		rects = [(100, 100, 200, 200), (200, 300, 260, 340), (40, 300, 40, 360)]
+		points = [(x, y) for x in xrange(0, 401, 20) for y in xrange(0, 401, 20)]
+		for x1, y1 in ((0, 0), (100, 100), (200, 250), (150, 150), (40, 280)):
+			self.assertSameAsScalar(x1, y1, points, rects)
+
+	# ------------------------------------------------------------------------------
+	def testAgainstObstacleTree(self):
+		# The guards' batched check uses the house edges; the single check finds the first house in the tree
+		player = benchmark.buildScene(25, 0, 0)
+		edges = entities.Entity._obstacle_edges
+		self.assertIsNotNone(edges)
+		width = entities.g_window.width
+		height = entities.g_window.height
+		points = [(self.random.uniform(0, width), self.random.uniform(entities.SCREEN_MINIMUM_Y, height))
+				  for index in xrange(200)]
+		blocked = misc.linesIntersectAny(player.x, player.y, [x for x, y in points], [y for x, y in points], edges)
+		for (x, y), line_blocked in zip(points, blocked):
+			expected = entities.Entity.findObstacle(player.x, player.y, x, y) is not None
+			self.assertEqual(bool(line_blocked), expected, 'to {0}'.format((x, y)))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,83 @@
+# ------------------------------------------------------------------------------
+# Spatial hash: a query must find everything whose bounds overlap it, as the
+# brute force check over every object would, however the objects have moved
+# ------------------------------------------------------------------------------
+
+import random
+import spatial
+import unittest
+
+# ------------------------------------------------------------------------------
+def overlap(bounds1, bounds2):
+	"Inclusive, as with entity rects: touching bounds overlap."
+	return bounds1[0] <= bounds2[2] and bounds2[0] <= bounds1[2] and bounds1[1] <= bounds2[3] and bounds2[1] <= bounds1[3]
+
+# ------------------------------------------------------------------------------
+class SpatialHashTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.random = random.Random(3)
+		self.grid = spatial.SpatialHash(32)
+		self.bounds = {}		# object -> its bounds in the grid
+
+	# ------------------------------------------------------------------------------
+	def randomBounds(self):
+		left = self.random.uniform(-100, 900)
+		top = self.random.uniform(-100, 700)
+		return (left, top, left + self.random.uniform(0, 80), top + self.random.uniform(0, 80))
+
+	# ------------------------------------------------------------------------------
+	def assertQueriesMatch(self):
+		self.assertEqual(len(self.grid), len(self.bounds))
+		for attempt in xrange(50):
+			query_bounds = self.randomBounds()
+			found = self.grid.query(query_bounds)
+			expected = set(obj for obj, bounds in self.bounds.iteritems() if overlap(bounds, query_bounds))
+			self.assertTrue(expected <= found, 'missed {0}'.format(expected - found))
+			self.assertTrue(found <= set(self.bounds), 'found objects no longer in the grid')
+
+	# ------------------------------------------------------------------------------
+	def testInsertMoveRemove(self):
+		for obj in xrange(200):
+			self.bounds[obj] = self.randomBounds()
+			self.grid.insert(obj, self.bounds[obj])
+		self.assertQueriesMatch()
+		
+		for step in xrange(20):
+			for obj in self.random.sample(sorted(self.bounds), 50):
+				left, top, right, bottom = self.bounds[obj]
+				dx = self.random.uniform(-20, 20)
+				dy = self.random.uniform(-20, 20)
+				self.bounds[obj] = (left + dx, top + dy, right + dx, bottom + dy)
+				if step % 2:
+					self.grid.move(obj, self.bounds[obj])
+				else:
+					self.grid.moveEdges(obj, *self.bounds[obj])
+			for obj in self.random.sample(sorted(self.bounds), 5):
+				self.grid.remove(obj)
+				del self.bounds[obj]
+			self.assertQueriesMatch()
+
+	# ------------------------------------------------------------------------------
+	def testTouchingOnCellEdges(self):
+		# Edges exactly on cell boundaries, both for the objects and the queries
+		self.grid.insert('left', (0, 0, 32, 32))
+		self.grid.insert('right', (64, 0, 96, 32))
+		self.assertEqual(self.grid.query((32, 0, 64, 32)), set(['left', 'right']))
+		self.assertEqual(self.grid.query((96, 32, 96, 32)), set(['right']))
+		self.assertEqual(self.grid.query((-32, -32, -1, -1)), set())
+
+	# ------------------------------------------------------------------------------
+	def testRemoveClearsCells(self):
+		self.grid.insert('a', (0, 0, 100, 100))
+		self.grid.remove('a')
+		self.grid.remove('a')		# not there any more: ignored
+		self.assertEqual(len(self.grid), 0)
+		self.assertEqual(self.grid._cells, {})
+		self.assertEqual(self.grid.query((0, 0, 100, 100)), set())
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
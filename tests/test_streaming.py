@@ -0,0 +1,111 @@
+# ------------------------------------------------------------------------------
+# Streaming: only the chunks near the player are loaded, and what the player
+# did to a chunk is still there when it comes back
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import entities
+import levels
+import shutil
+import streaming
+import tempfile
+import unittest
+
+# Two houses with a guard each, far enough apart that only one end is ever loaded
+LEVEL_TEXT = ('world 4000 800\n'
+			  'player 100 300 12\n'
+			  'house 200 300 96 80\n'
+			  'guard Near 300 500\n'
+			  'house 3600 300 96 80\n'
+			  'guard Far 3700 500\n')
+
+# ------------------------------------------------------------------------------
+def records():
+	"Returns the streamed records (house 1, guard 1, house 2, guard 2)."
+	return levels._g_streamer.records
+
+# ------------------------------------------------------------------------------
+class ChunkStreamerTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		headless.init()
+		self.level_dir = tempfile.mkdtemp()
+		self.old_level_dir = levels.LEVEL_DIR
+		levels.LEVEL_DIR = self.level_dir
+		levels._g_records.clear()
+		with open(levels.sourceFileName('streamed'), 'wb') as out_file:
+			out_file.write(LEVEL_TEXT)
+		levels.load('streamed')
+		entities.updateAll(0)
+		self.player = entities.PlayerEntity.instance
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		entities.clearAll()
+		levels.LEVEL_DIR = self.old_level_dir
+		levels._g_records.clear()
+		levels._g_streamer.setRecords([])
+		shutil.rmtree(self.level_dir)
+
+	# ------------------------------------------------------------------------------
+	def walkTo(self, x, y):
+		self.player.moveTo(x, y)
+		levels.update()
+		entities.updateAll(0)		# finishes off anything removed or added
+
+	# ------------------------------------------------------------------------------
+	def loaded(self):
+		return [record.entity is not None for record in records()]
+
+	# ------------------------------------------------------------------------------
+	def testLoadsNearPlayer(self):
+		self.assertEqual(self.loaded(), [True, True, False, False])
+		self.assertFalse(levels._g_streamer.isAllLoaded())
+		self.assertEqual(entities.Entity.unlootedChests(), 2)
+
+		self.walkTo(3500, 300)
+		self.assertEqual(self.loaded(), [False, False, True, True])
+		self.assertEqual(levels._g_streamer.num_released, 2)
+		self.assertEqual(entities.Entity.unlootedChests(), 2)
+		self.assertNotIn(records()[0].entity, entities.Entity._entities)
+
+	# ------------------------------------------------------------------------------
+	def testHysteresis(self):
+		# Loaded within STREAM_IN_DISTANCE, but not released until beyond STREAM_OUT_DISTANCE.  The far end's chunk
+		# starts at 3600.
+		self.assertEqual((streaming.STREAM_IN_DISTANCE, streaming.STREAM_OUT_DISTANCE), (600, 800))
+		self.walkTo(2900, 300)
+		self.assertEqual(self.loaded()[2:], [False, False])
+		self.walkTo(3300, 300)
+		self.assertEqual(self.loaded()[2:], [True, True])
+		self.walkTo(2900, 300)
+		self.assertEqual(self.loaded()[2:], [True, True])
+		self.walkTo(2700, 300)
+		self.assertEqual(self.loaded()[2:], [False, False])
+
+	# ------------------------------------------------------------------------------
+	def testStateKept(self):
+		house = records()[0].entity
+		house.startLooting()
+		self.assertTrue(house.updateLooting(100))
+		records()[1].entity.startDying()
+		self.assertEqual(entities.Entity.unlootedChests(), 1)
+
+		# Away and back again: still looted, and the guard stays dead
+		self.walkTo(3500, 300)
+		self.assertEqual(entities.Entity.unlootedChests(), 1)
+		self.walkTo(100, 300)
+		self.assertEqual(self.loaded(), [True, False, False, False])
+		house = records()[0].entity
+		self.assertIsNone(house.chest)
+		self.assertEqual(house.loot_amount, 0)
+		self.assertEqual(entities.Entity.unlootedChests(), 1)
+		self.assertEqual([entity.name for entity in entities.Entity._entities
+						  if isinstance(entity, entities.GuardEntity)], [])
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
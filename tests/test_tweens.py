@@ -0,0 +1,141 @@
+# ------------------------------------------------------------------------------
+# Tweens: values reach their end on time and drop out, and label fades only
+# touch the vertices' alpha, never laying the label out again
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import stats
+import tweens
+import unittest
+
+# ------------------------------------------------------------------------------
+class TweenerTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.tweener = tweens.Tweener()
+		self.values = []
+		self.finished = []
+
+	# ------------------------------------------------------------------------------
+	def start(self, key, duration_sec, start_value, end_value):
+		return self.tweener.start(key, duration_sec, self.values.append, start_value, end_value,
+								  on_finish=lambda: self.finished.append(key))
+
+	# ------------------------------------------------------------------------------
+	def testRunsToEnd(self):
+		self.start('a', 1, 0, 100)
+		self.assertEqual(self.values, [0])		# the start value is applied straight away
+		for index in xrange(4):
+			self.tweener.update(0.25)
+		self.assertEqual(self.values, [0, 25, 50, 75, 100])
+		self.assertEqual(self.finished, ['a'])
+		self.assertEqual(len(self.tweener), 0)
+		self.tweener.update(0.25)
+		self.assertEqual(len(self.values), 5)
+
+	# ------------------------------------------------------------------------------
+	def testOvershootEndsExactly(self):
+		self.start('a', 0.3, 255, 0)
+		self.tweener.update(1)
+		self.assertEqual(self.values, [255, 0])
+		self.assertEqual(self.finished, ['a'])
+
+	# ------------------------------------------------------------------------------
+	def testReplaceAndCancel(self):
+		self.start('a', 1, 0, 100)
+		self.start('b', 1, 0, 10)
+		self.tweener.update(0.5)
+		self.start('a', 1, 100, 200)		# replaces the first, which never finishes
+		self.tweener.cancel('b')
+		self.assertFalse(self.tweener.isRunning('b'))
+		self.tweener.update(1)
+		self.assertEqual(self.values, [0, 0, 50, 5, 100, 200])
+		self.assertEqual(self.finished, ['a'])
+
+	# ------------------------------------------------------------------------------
+	def testOnFinishStartsAnother(self):
+		def chain():
+			self.start('a', 1, 10, 20)
+		self.tweener.start('a', 1, self.values.append, 0, 10, on_finish=chain)
+		self.tweener.update(1)
+		self.assertTrue(self.tweener.isRunning('a'))
+		self.tweener.update(1)
+		self.assertEqual(self.values, [0, 10, 10, 20])
+		self.assertEqual(len(self.tweener), 0)
+
+# ------------------------------------------------------------------------------
+class StandInVertexList(object):
+	"Stands in for a glyph's vertex list: four vertices with four colour components each."
+	def __init__(self, color):
+		self.colors = list(color) * 4
+
+	def alphas(self):
+		return self.colors[3::4]
+
+# ------------------------------------------------------------------------------
+class LabelFadeTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		headless.init()
+		stats.reset()
+		stats._tweens.clear()
+		self.label = stats._status_label
+		stats.showStatusMessage('Hello', col=(255, 128, 0, 255))
+		self.vertex_list = StandInVertexList(self.label.color)
+		self.label._vertex_lists = [self.vertex_list]
+		stats._g_layout_count = 0
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		del self.label._vertex_lists
+		stats._tweens.clear()
+		stats.setLabelAlpha(self.label, 255)
+		stats.reset()
+
+	# ------------------------------------------------------------------------------
+	def testFadeDoesNoLayouts(self):
+		stats.showStatusMessage(fade_duration_sec=1)
+		stats._tweens.update(0.5)
+		self.assertEqual(self.vertex_list.alphas(), [127] * 4)
+		stats._tweens.update(0.5)
+		self.assertEqual(self.vertex_list.alphas(), [0] * 4)
+		self.assertEqual(stats._g_layout_count, 0)
+		self.assertEqual(len(stats._tweens), 0)
+
+	# ------------------------------------------------------------------------------
+	def testFadeKeepsColourAlpha(self):
+		stats.showStatusMessage(col=(255, 128, 0, 128), fade_duration_sec=1)
+		self.assertEqual(stats._g_layout_count, 1)		# the colour change
+		self.vertex_list.colors = [255, 128, 0, 128] * 4	# as the layout would leave them
+		stats._tweens.update(0.5)
+		self.assertEqual(self.vertex_list.alphas(), [63] * 4)
+
+	# ------------------------------------------------------------------------------
+	def testTextChangeKeepsFade(self):
+		stats.showStatusMessage(fade_duration_sec=1)
+		stats._tweens.update(0.5)
+		self.vertex_list.colors = list(self.label.color) * 4		# a layout resets the vertices
+		stats.setLabelText(self.label, 'Goodbye')
+		self.assertEqual(self.vertex_list.alphas(), [127] * 4)
+
+	# ------------------------------------------------------------------------------
+	def testLooting(self):
+		# The status stays opaque while looting, without restarting the fade each tick, then fades once it stops
+		for tick in xrange(5):
+			stats.setLootingCompletion(tick / 10.0)
+			stats._tweens.update(0.02)
+			self.assertFalse(stats._tweens.isRunning((self.label, 'alpha')))
+			self.assertEqual(self.label.alpha, 255)
+		stats.stopLooting()
+		self.assertTrue(stats._tweens.isRunning((self.label, 'alpha')))
+		stats.stopLooting()		# again, as every tick without looting does
+		stats._tweens.update(0.5)
+		self.assertEqual(self.label.alpha, 127)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,122 @@
+# ------------------------------------------------------------------------------
+# Entity update: moving everything in one pass (after every entity has thought)
+# must leave the levels playing out as they did when each entity moved in turn
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import benchmark
+import entities
+import entitystore
+import events
+import hashlib
+import levels
+import misc
+import random
+import stats
+import unittest
+from pyglet.window import key
+
+# Keys pressed at each tick, all others being released; ctrl is pressed with up held, to leap
+SCRIPT = {0: key.RIGHT, 60: key.UP, 140: key.LCTRL, 145: None, 150: key.LEFT, 200: key.DOWN, 260: key.RIGHT,
+		  300: key.UP, 330: key.LCTRL, 360: key.SPACE, 500: key.LEFT, 600: key.DOWN}
+TICKS = 900
+TICK_SEC = 0.02
+
+# What SCRIPT gave when each entity moved straight after its own update: (loot, health, daggers) at the end, and
+# the tick of each change of a guard's state
+SEQUENTIAL_OUTCOMES = {
+	'1': ((0, 0.0, 10), [(141, 'Bob the Guard', 2), (141, 'Rover the dog', 2), (155, 'Bob the Guard', 1),
+						 (331, 'Rover the dog', 1)]),
+	'2': ((0, 1, 8), []),
+	'3': ((0, 0.0, 8), [(128, 'Snuffles the dog', 1)]),
+}
+MAX_DELAY_TICKS = 25		# half a second: guards see where the player was at the start of the tick, and chases
+							# can run a little differently from there
+
+# ------------------------------------------------------------------------------
+def playLevel(level_name):
+	"Plays the level with SCRIPT, returning its outcome in the same form as SEQUENTIAL_OUTCOMES."
+	random.seed(1234)
+	levels.load(level_name)
+	stats.reset(player_died=True)
+	states = {}
+	changes = []
+	for tick in xrange(TICKS):
+		if tick in SCRIPT:
+			for symbol in list(misc._g_keys_held):
+				misc.handleKeyRelease(symbol, 0)
+			if SCRIPT[tick] is not None:
+				misc.handleKeyPress(SCRIPT[tick], 0)
+				if SCRIPT[tick] == key.LCTRL:
+					misc.handleKeyPress(key.UP, 0)
+		entities.updateAll(TICK_SEC)
+		events.update(TICK_SEC)
+		stats.update(TICK_SEC)
+		misc.updateKeys()
+		for entity in entities.Entity._entities:
+			state = getattr(entity, 'state', None)
+			if state is not None and states.setdefault(entity.name, state) != state:
+				states[entity.name] = state
+				changes.append((tick, entity.name, state))
+	for symbol in list(misc._g_keys_held):
+		misc.handleKeyRelease(symbol, 0)
+	return (stats.loot, stats.health_fraction, stats.daggers), changes
+
+# ------------------------------------------------------------------------------
+def sceneDigest(ticks):
+	"Runs the benchmark scene, returning a digest of every entity's position after each tick."
+	window_size = (entities.g_window.width, entities.g_window.height)		# the scene resizes the window
+	entities.Entity._next_order = 0		# the AI scheduler staggers the guards by their place in the update order
+	benchmark.buildScene(16, 12, 4)
+	digest = hashlib.md5()
+	for tick in xrange(ticks):
+		benchmark._sceneTick(4)
+		for entity in entities.Entity._entities:
+			digest.update('{0} {1!r} {2!r} {3};'.format(entity.order, entity.x, entity.y, entity.alive))
+	entities.clearAll()
+	entities.g_window.width, entities.g_window.height = window_size
+	return digest.hexdigest()
+
+# ------------------------------------------------------------------------------
+class UpdateOrderTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		headless.init()
+
+	# ------------------------------------------------------------------------------
+	def tearDown(self):
+		entities.clearAll()
+
+	# ------------------------------------------------------------------------------
+	def testLevelOutcomesMatchSequentialUpdate(self):
+		for level_name, (expected_stats, expected_changes) in sorted(SEQUENTIAL_OUTCOMES.iteritems()):
+			final_stats, changes = playLevel(level_name)
+			self.assertEqual(final_stats, expected_stats, 'level ' + level_name)
+			self.assertEqual([(name, state) for tick, name, state in changes],
+							 [(name, state) for tick, name, state in expected_changes], 'level ' + level_name)
+			for (tick, name, state), (expected_tick, expected_name, expected_state) in zip(changes, expected_changes):
+				self.assertTrue(expected_tick <= tick <= expected_tick + MAX_DELAY_TICKS,
+								'level {0}: {1} changed to state {2} at tick {3}, not {4}'.format(
+									level_name, name, state, tick, expected_tick))
+
+	# ------------------------------------------------------------------------------
+	@unittest.skipUnless(misc.g_have_numpy, 'needs numpy')
+	def testScalarMoveGivesSameGame(self):
+		vectorised = sceneDigest(300)
+		old_store = entities.g_store
+		misc.g_have_numpy = False		# so the new store has no NumPy views, and moves with the scalar loop
+		try:
+			entities.g_store = entitystore.EntityStore()
+			self.assertIsNone(entities.g_store.views)
+			scalar = sceneDigest(300)
+		finally:
+			misc.g_have_numpy = True
+			entities.g_store = old_store
+		self.assertEqual(scalar, vectorised)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
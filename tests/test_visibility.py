@@ -0,0 +1,83 @@
+# ------------------------------------------------------------------------------
+# Visibility table: every pair it classes as clear or blocked must agree with
+# the exact line of sight check
+# ------------------------------------------------------------------------------
+
+import headless		# must be imported before the game modules
+
+import misc
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import visibility
+
+KEY1 = '0' * 32		# the keys are md5 hex digests
+KEY2 = '1' * 32
+HOUSES = [(100, 60, 180, 140), (260, 200, 300, 330), (20, 250, 120, 270)]
+
+# ------------------------------------------------------------------------------
+class VisibilityTableTest(unittest.TestCase):
+
+	# ------------------------------------------------------------------------------
+	def setUp(self):
+		self.random = random.Random(9)
+		self.table = visibility.VisibilityTable.build(320, 360, HOUSES, min_y=20)
+
+	# ------------------------------------------------------------------------------
+	def randomPoint(self):
+		return (self.random.uniform(0, 320), self.random.uniform(20, 360))
+
+	# ------------------------------------------------------------------------------
+	def testAgreesWithExactCheck(self):
+		classified = 0
+		for attempt in xrange(3000):
+			x1, y1 = self.randomPoint()
+			x2, y2 = self.randomPoint()
+			result = self.table.lookup(x1, y1, x2, y2)
+			if result is None:
+				continue
+			classified += 1
+			blocked = any(misc.lineIntersectsRect(x1, y1, x2, y2, rect) for rect in HOUSES)
+			self.assertEqual(result, not blocked, 'from {0} to {1}'.format((x1, y1), (x2, y2)))
+		# A good share of the pairs should be decided by the table, or it isn't saving anything
+		self.assertTrue(classified > 1000)
+
+	# ------------------------------------------------------------------------------
+	def testKnownPairs(self):
+		self.assertTrue(self.table.lookup(16, 36, 300, 36))			# along the top, above the houses
+		self.assertFalse(self.table.lookup(200, 260, 316, 260))		# straight through the tall house
+		self.assertTrue(self.table.lookup(40, 40, 50, 50))			# same cell
+
+	# ------------------------------------------------------------------------------
+	def testOutside(self):
+		self.assertIsNone(self.table.lookup(-10, 40, 50, 50))
+		self.assertIsNone(self.table.lookup(40, 10, 50, 50))		# above min_y
+		self.assertIsNone(self.table.lookup(40, 40, 50, 400))
+
+	# ------------------------------------------------------------------------------
+	def testSaveAndLoad(self):
+		directory = tempfile.mkdtemp()
+		try:
+			file_name = os.path.join(directory, 'test.pvs')
+			self.table.save(file_name, KEY1)
+			loaded = visibility.VisibilityTable.load(file_name, KEY1)
+			self.assertEqual((loaded.columns, loaded.rows, loaded.cell_size, loaded.min_y),
+							 (self.table.columns, self.table.rows, self.table.cell_size, self.table.min_y))
+			self.assertEqual(loaded.clear_bits, self.table.clear_bits)
+			self.assertEqual(loaded.blocked_bits, self.table.blocked_bits)
+
+			# Out of date, damaged or missing files are rebuilt
+			self.assertIsNone(visibility.VisibilityTable.load(file_name, KEY2))
+			with open(file_name, 'r+b') as out_file:
+				out_file.truncate(os.path.getsize(file_name) - 1)
+			self.assertIsNone(visibility.VisibilityTable.load(file_name, KEY1))
+			self.assertIsNone(visibility.VisibilityTable.load(os.path.join(directory, 'missing.pvs'), KEY1))
+		finally:
+			shutil.rmtree(directory)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+	unittest.main()
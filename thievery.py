@@ -17,27 +17,64 @@ if 'win' in sys.platform:
 
 # ------------------------------------------------------------------------------
 
+import argparse
+import camera
 import entities
 import events
+import game
+import hotreload
 import levels
 import misc
+import profiler
 import pyglet
-from pyglet.window import key
+import replay
 import stats
 
 # ------------------------------------------------------------------------------
 
+DEFAULT_TICK_RATE_HZ = 50		# simulation steps per second
+MAX_TICKS_PER_FRAME = 5			# after a long frame, drop any time beyond this many ticks rather than catching up
+
+parser = argparse.ArgumentParser(description='Thievery')
+parser.add_argument('--tick-rate', type=float, default=DEFAULT_TICK_RATE_HZ, help='simulation steps per second')
+parser.add_argument('--record', metavar='FILE', help='record the session, to replay later')
+parser.add_argument('--replay', metavar='FILE', help='replay a recorded session (ignoring the keyboard)')
+parser.add_argument('--level', help='start on this level (e.g. town) instead of the first')
+parser.add_argument('--hot-reload', action='store_true', help='apply edits to the level and chatter files as they\'re saved')
+args, unknown_args = parser.parse_known_args()
+
+g_tick_sec = 1.0 / args.tick_rate
+g_replay = None
+if args.replay:
+	g_replay = replay.startReplay(args.replay)
+	g_tick_sec = g_replay.tick_sec		# ticks have to be the same length as when it was recorded
+	levels.g_first_level = g_replay.first_level
+elif args.record:
+	replay.startRecording(g_tick_sec, args.level)
+if args.hot_reload:
+	if args.replay or args.record:
+		print 'Hot reloading is off while recording or replaying'
+	else:
+		hotreload.enable()
+if args.level and not args.replay:
+	levels.g_first_level = args.level
+g_unsimulated_sec = 0		# time since the last tick; always less than a tick
+
+# ------------------------------------------------------------------------------
+
 window = pyglet.window.Window(width=800, height=600, caption='Thievery', vsync=False)
 entities.g_window = window
 stats.g_window = window
+profiler.g_window = window
 
 grass = pyglet.resource.image('data/textures/grass.jpg')
-
-g_paused = False
+g_camera = camera.Camera(window.width, window.height)
 
 # ------------------------------------------------------------------------------
 @window.event
 def on_key_press(symbol, modifiers):
+	if g_replay is not None:
+		return		# keys come from the recording
 	misc.handleKeyPress(symbol, modifiers)
 	# Stop escape from exiting immediately
 	#if misc.isKeyHeld(key.ESCAPE):
@@ -46,65 +83,71 @@ def on_key_press(symbol, modifiers):
 # ------------------------------------------------------------------------------
 @window.event
 def on_key_release(symbol, modifiers):
+	if g_replay is not None:
+		return
 	misc.handleKeyRelease(symbol, modifiers)
 
 # ------------------------------------------------------------------------------
 @window.event
 def on_draw():
+	profiler.start('on_draw')
 	#window.clear()
-	grass.blit(0, 0)
-	entities.drawAll()
+	if game.g_paused or stats.won_level:
+		alpha = 1		# nothing's moving, so draw everything where it is
+	else:
+		alpha = g_unsimulated_sec / g_tick_sec
+	player = entities.PlayerEntity.instance
+	if player is not None:
+		world_width, world_height = entities.worldSize()
+		render_x, render_y = player.renderPos(alpha)
+		g_camera.follow(render_x, render_y, world_width, world_height)
+	
+	g_camera.begin()
+	drawGround()
+	entities.interpolateAll(alpha)
+	entities.drawAll(g_camera.viewBounds())
+	g_camera.end()
 	stats.draw()
+	profiler.stop('on_draw')
+	profiler.draw()
+	profiler.endFrame()
 
 # ------------------------------------------------------------------------------
-def update(dt):
-	global g_paused
-	
-	if not g_paused and not stats.won_level:
-		entities.updateAll(dt)
-	events.update(dt)
-	stats.update(dt)
-	
-	# Special input
-	if misc.wasAnyKeyPressed((key.ENTER, key.RETURN)):
-		if stats.isPlayerDead():
-			#print 'reloading'
-			levels.reload()
-			stats.reset(player_died=True)
-			g_paused = False
-		elif stats.won_game:
-			#print 'finished'
+def drawGround():
+	"Tiles the grass over the part of the world in view."
+	left, bottom, right, top = g_camera.viewBounds(margin=0)
+	for tile_x in xrange(left // grass.width * grass.width, right, grass.width):
+		for tile_y in xrange(bottom // grass.height * grass.height, top, grass.height):
+			grass.blit(tile_x, tile_y)
+
+# ------------------------------------------------------------------------------
+def frame(dt):
+	"Runs as many fixed-length ticks as the time since the last frame covers."
+	global g_unsimulated_sec
+	hotreload.update(dt)
+	g_unsimulated_sec += dt
+	num_ticks = 0
+	while g_unsimulated_sec >= g_tick_sec:
+		if num_ticks == MAX_TICKS_PER_FRAME:
+			g_unsimulated_sec %= g_tick_sec
+			break
+		if not game.tick(g_tick_sec) or (g_replay is not None and g_replay.finished()):
 			pyglet.app.exit()
-		elif stats.intro_screen:
-			if stats.showing_sound_warning:
-				stats.setUpIntroScreen()
-			else:
-				#print 'starting'
-				levels.start()
-				misc.playMusic()
-				stats.reset()
-		elif stats.won_level:
-			#print 'next level'
-			if not levels.next():
-				misc.playMusic(victory=True)
-			stats.reset()
-			g_paused = False
-	if misc.wasKeyPressed(key.P):
-		if not stats.won_game and not stats.intro_screen:
-			g_paused = not g_paused
-			stats.setPaused(g_paused)
-	
-	# Do this at the end, because it clears the keys pressed
-	misc.updateKeys()
+			break
+		g_unsimulated_sec -= g_tick_sec
+		num_ticks += 1
 
 # ------------------------------------------------------------------------------
 
 misc.init()
 stats.init()
 events.init()
-stats.setUpFirstScreen()
+if g_replay is not None:
+	stats.setUpFirstScreen(sound_warning=not g_replay.sound)
+else:
+	stats.setUpFirstScreen()
 
-pyglet.clock.schedule_interval(update, 0.02)
+pyglet.clock.schedule(frame)
 
 while True:
 	try:
@@ -114,3 +157,8 @@ while True:
 		# Catch and discard the Pyglet exception for unrecognised characters
 		if 'unichr() arg not in range' not in str(exc).lower():
 			raise
+
+if misc.g_mixer is not None:
+	print misc.g_mixer.report()
+if args.record:
+	replay.stopRecording(args.record)
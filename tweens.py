@@ -0,0 +1,80 @@
+# ------------------------------------------------------------------------------
+# Tweens: values animated over time, for fades and flashes
+#
+# A Tweener holds only the tweens that are running, and advances them all in
+# one pass; finished ones drop out, so anything not animating costs nothing.
+# Each tween has a key (e.g. (label, 'alpha')), and starting a tween replaces
+# any that's running with the same key.
+# ------------------------------------------------------------------------------
+
+# ------------------------------------------------------------------------------
+class Tween(object):
+	def __init__(self, duration_sec, apply, start_value, end_value, on_finish=None):
+		"""Calls apply with a value going from start_value to end_value over the duration, then calls on_finish
+		(if given) once it gets there."""
+		self.duration_sec = duration_sec
+		self.remaining_sec = duration_sec
+		self.apply = apply
+		self.start_value = start_value
+		self.end_value = end_value
+		self.on_finish = on_finish
+
+	def value(self):
+		fraction_left = self.remaining_sec / float(self.duration_sec)
+		return self.end_value + (self.start_value - self.end_value) * fraction_left
+
+	def advance(self, dt):
+		"Returns True if the tween has finished."
+		self.remaining_sec -= dt
+		if self.remaining_sec <= 0:
+			self.remaining_sec = 0
+		self.apply(self.value())
+		return self.remaining_sec == 0
+
+# ------------------------------------------------------------------------------
+class Tweener(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self):
+		self._tweens = {}		# key -> running tween
+
+	# ------------------------------------------------------------------------------
+	def __len__(self):
+		return len(self._tweens)
+
+	# ------------------------------------------------------------------------------
+	def start(self, key, duration_sec, apply, start_value, end_value, on_finish=None):
+		"Starts a tween (see Tween), replacing any running with the same key.  The start value is applied now."
+		tween = Tween(duration_sec, apply, start_value, end_value, on_finish)
+		self._tweens[key] = tween
+		apply(start_value)
+		return tween
+
+	# ------------------------------------------------------------------------------
+	def cancel(self, key):
+		"Stops the tween with the key, if there is one, leaving its value where it got to."
+		self._tweens.pop(key, None)
+
+	# ------------------------------------------------------------------------------
+	def isRunning(self, key):
+		return key in self._tweens
+
+	# ------------------------------------------------------------------------------
+	def update(self, dt):
+		if not self._tweens:
+			return
+		finished = []
+		for key, tween in self._tweens.items():
+			if self._tweens.get(key) is tween and tween.advance(dt):
+				finished.append((key, tween))
+		for key, tween in finished:
+			if self._tweens.get(key) is tween:
+				del self._tweens[key]
+			if tween.on_finish is not None:
+				tween.on_finish()
+
+	# ------------------------------------------------------------------------------
+	def clear(self):
+		self._tweens = {}
+
+# ------------------------------------------------------------------------------
@@ -0,0 +1,197 @@
+# ------------------------------------------------------------------------------
+# Visibility: precomputed cell-to-cell line of sight past the houses
+#
+# The world is split into square cells, and each pair of cells is classed as
+# either clear (no line from anywhere in one cell to anywhere in the other can
+# touch a house), blocked (every such line crosses a house edge), or neither.
+# Both classes are stored as one bitset per cell.  Only the pairs that are
+# neither need an exact line of sight check.
+# ------------------------------------------------------------------------------
+
+import math
+import spatial
+import struct
+
+PVS_CELL_SIZE = 32
+PVS_MARGIN = 0.01		# safety margin for the classification, so rounding never gives a wrong answer
+PVS_FILE_MAGIC = 'PVS1'
+_PVS_HEADER = struct.Struct('<4s32siiif')		# magic, key, columns, rows, cell size, min y
+
+_g_tables = {}		# key -> table, so restarting a level doesn't need the disk
+
+# ------------------------------------------------------------------------------
+class VisibilityTable(object):
+
+	# ------------------------------------------------------------------------------
+	def __init__(self, columns, rows, cell_size, min_y, clear_bits=None, blocked_bits=None):
+		self.columns = columns
+		self.rows = rows
+		self.cell_size = cell_size
+		self.min_y = min_y
+		self.num_cells = columns * rows
+		self.row_bytes = (self.num_cells + 7) // 8		# bytes per cell's bitset
+		size = self.num_cells * self.row_bytes
+		self.clear_bits = clear_bits if clear_bits is not None else bytearray(size)
+		self.blocked_bits = blocked_bits if blocked_bits is not None else bytearray(size)
+
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def build(cls, width, height, house_rects, cell_size=PVS_CELL_SIZE, min_y=0):
+		columns = int(math.ceil(float(width) / cell_size))
+		rows = int(math.ceil(float(height - min_y) / cell_size))
+		table = cls(columns, rows, cell_size, min_y)
+		cells = [table._cellBounds(index) for index in xrange(table.num_cells)]
+		half_cell = cell_size / 2.0 + PVS_MARGIN
+		grown_rects = [(left - half_cell, top - half_cell, right + half_cell, bottom + half_cell) \
+						for left, top, right, bottom in house_rects]
+
+		for index1 in xrange(table.num_cells):
+			cell1 = cells[index1]
+			for index2 in xrange(index1, table.num_cells):
+				cell2 = cells[index2]
+				hull = spatial.boundsUnion(cell1, cell2)
+				nearby = [index for index, rect in enumerate(house_rects) if _boundsOverlap(hull, rect)]
+				if nearby == []:
+					table._setPair(table.clear_bits, index1, index2)
+				elif _pairIsClear(cell1, cell2, [grown_rects[index] for index in nearby]):
+					table._setPair(table.clear_bits, index1, index2)
+				elif any(_rectSeparates(cell1, cell2, house_rects[index]) for index in nearby):
+					table._setPair(table.blocked_bits, index1, index2)
+		return table
+
+	# ------------------------------------------------------------------------------
+	def _cellBounds(self, index):
+		col = index % self.columns
+		row = index // self.columns
+		left = col * self.cell_size
+		top = self.min_y + row * self.cell_size
+		return (left, top, left + self.cell_size, top + self.cell_size)
+
+	# ------------------------------------------------------------------------------
+	def cellIndex(self, x, y):
+		"Returns the index of the cell containing the point, or None if it's outside the table."
+		col = int(math.floor(x / self.cell_size))
+		row = int(math.floor((y - self.min_y) / self.cell_size))
+		if col < 0 or row < 0 or col >= self.columns or row >= self.rows:
+			return None
+		return row * self.columns + col
+
+	# ------------------------------------------------------------------------------
+	def _setPair(self, bits, index1, index2):
+		bits[index1 * self.row_bytes + (index2 >> 3)] |= 1 << (index2 & 7)
+		bits[index2 * self.row_bytes + (index1 >> 3)] |= 1 << (index1 & 7)
+
+	# ------------------------------------------------------------------------------
+	def lookup(self, x1, y1, x2, y2):
+		"Returns True if the points can definitely see each other, False if they definitely can't, or None."
+		index1 = self.cellIndex(x1, y1)
+		index2 = self.cellIndex(x2, y2)
+		if index1 is None or index2 is None:
+			return None
+		byte_index = index1 * self.row_bytes + (index2 >> 3)
+		bit = 1 << (index2 & 7)
+		if self.clear_bits[byte_index] & bit:
+			return True
+		if self.blocked_bits[byte_index] & bit:
+			return False
+		return None
+
+	# ------------------------------------------------------------------------------
+	def save(self, file_name, key):
+		with open(file_name, 'wb') as out_file:
+			out_file.write(_PVS_HEADER.pack(PVS_FILE_MAGIC, key, self.columns, self.rows, self.cell_size, self.min_y))
+			out_file.write(self.clear_bits)
+			out_file.write(self.blocked_bits)
+
+	# ------------------------------------------------------------------------------
+	@classmethod
+	def load(cls, file_name, key):
+		"Returns the table saved in the file, or None if it's missing, out of date or damaged."
+		try:
+			with open(file_name, 'rb') as in_file:
+				data = in_file.read()
+		except IOError:
+			return None
+		if len(data) < _PVS_HEADER.size:
+			return None
+		magic, file_key, columns, rows, cell_size, min_y = _PVS_HEADER.unpack_from(data)
+		if magic != PVS_FILE_MAGIC or file_key != key:
+			return None
+		table = cls(columns, rows, cell_size, min_y)
+		size = table.num_cells * table.row_bytes
+		if len(data) != _PVS_HEADER.size + 2 * size:
+			return None
+		table.clear_bits = bytearray(data[_PVS_HEADER.size:_PVS_HEADER.size + size])
+		table.blocked_bits = bytearray(data[_PVS_HEADER.size + size:])
+		return table
+
+# ------------------------------------------------------------------------------
+def loadOrBuild(file_name, key, width, height, house_rects, min_y=0):
+	"""Returns the table for the key, from memory or from the cache file if possible.  Otherwise builds it, which
+	takes a couple of seconds for a screen-sized level, and saves it to the cache file."""
+	table = _g_tables.get(key)
+	if table is None:
+		table = VisibilityTable.load(file_name, key)
+	if table is None:
+		table = VisibilityTable.build(width, height, house_rects, min_y=min_y)
+		try:
+			table.save(file_name, key)
+		except (IOError, OSError):
+			print 'Failed to save visibility table to', file_name
+	_g_tables[key] = table
+	return table
+
+# ------------------------------------------------------------------------------
+def _boundsOverlap(bounds1, bounds2):
+	return bounds1[0] <= bounds2[2] and bounds2[0] <= bounds1[2] and bounds1[1] <= bounds2[3] and bounds2[1] <= bounds1[3]
+
+# ------------------------------------------------------------------------------
+def _pairIsClear(cell1, cell2, grown_rects):
+	# Every line between the two (equal-sized) cells lies within the centre-to-centre line swept by a cell, so
+	# none of them can touch a house if that line misses the house grown by half a cell
+	centre_x1 = (cell1[0] + cell1[2]) / 2.0
+	centre_y1 = (cell1[1] + cell1[3]) / 2.0
+	centre_x2 = (cell2[0] + cell2[2]) / 2.0
+	centre_y2 = (cell2[1] + cell2[3]) / 2.0
+	for rect in grown_rects:
+		if spatial.segmentEntry(rect, centre_x1, centre_y1, centre_x2, centre_y2) is not None:
+			return False
+	return True
+
+# ------------------------------------------------------------------------------
+def _rectSeparates(cell1, cell2, rect):
+	"Returns True if every line between the cells has to cross one of the rect's edges."
+	left, top, right, bottom = rect
+	for edge_x in (left, right):
+		if _crossesEdge(cell1, cell2, 0, edge_x, top, bottom):
+			return True
+	for edge_y in (top, bottom):
+		if _crossesEdge(cell1, cell2, 1, edge_y, left, right):
+			return True
+	return False
+
+# ------------------------------------------------------------------------------
+def _crossesEdge(cell1, cell2, axis, edge_pos, edge_start, edge_end):
+	"""Returns True if every line between the cells crosses the edge at edge_pos on the given axis (0 for a
+	vertical edge at x = edge_pos, 1 for a horizontal one), between edge_start and edge_end."""
+	other = 1 - axis
+	if cell1[axis + 2] < edge_pos - PVS_MARGIN and cell2[axis] > edge_pos + PVS_MARGIN:
+		near, far = cell1, cell2
+	elif cell2[axis + 2] < edge_pos - PVS_MARGIN and cell1[axis] > edge_pos + PVS_MARGIN:
+		near, far = cell2, cell1
+	else:
+		return False		# not on opposite sides of the edge
+
+	# Where a line crosses the edge varies monotonically with each coordinate of its end points, so the
+	# extremes come from lines between corners of the cells
+	for near_pos in (near[axis], near[axis + 2]):
+		for far_pos in (far[axis], far[axis + 2]):
+			fraction = (edge_pos - near_pos) / float(far_pos - near_pos)
+			for near_other in (near[other], near[other + 2]):
+				for far_other in (far[other], far[other + 2]):
+					crossing = near_other + (far_other - near_other) * fraction
+					if crossing < edge_start + PVS_MARGIN or crossing > edge_end - PVS_MARGIN:
+						return False
+	return True
+
+# ------------------------------------------------------------------------------